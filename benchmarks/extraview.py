@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#
+# Fake Extraview server and outbox drain throughput benchmark
+#
+# FakeExtraview answers the extraview client calls used by bcl and bnl
+# locally after a simulated round trip, records every call and can be made
+# to fail. The benchmark queues tickets and comments in a throwaway outbox
+# and times ev_outbox.drain() at different thread counts.
+#
+# usage: python -m benchmarks.extraview [--tickets 100] [--comments 5] [--latency 0.02] [--jobs 1 4 16]
+#
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from .context import opstt
+from opstt import sqlite
+from opstt import ev_outbox
+
+class FakeExtraview ( object ):
+    """ Extraview client stand in with simulated latency """
+
+    def __init__ ( self, latency = 0.0 ):
+        self.latency = latency
+        self.down = False
+        self.calls = []
+        self.next_ticket = 1000
+        self.field_lookups = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def call ( self, *args ):
+        """ record call after the simulated round trip """
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.down:
+                raise Exception('extraview is down')
+
+            with self.lock:
+                self.calls.append(args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def create ( self, project, group, user, title, description, fields ):
+        self.call('create', title)
+        with self.lock:
+            self.next_ticket += 1
+            return self.next_ticket
+
+    def add_resolver_comment ( self, ticket, comment ):
+        self.call('comment', ticket, comment)
+
+    def assign_group ( self, ticket, group, user, fields ):
+        self.call('assign', ticket, group, fields)
+
+    def close ( self, ticket, comment ):
+        self.call('close', ticket, comment)
+
+    def get_field_value_to_field_key ( self, field, value ):
+        with self.lock:
+            self.field_lookups += 1
+        return '%s=%s' % (field, value)
+
+    def ticket_calls ( self, ticket ):
+        """ get calls against ticket in the order they were received """
+        return [ call for call in self.calls if call[0] != 'create' and call[1] == ticket ]
+
+def queue_tickets ( SQL, tickets, comments ):
+    """ queue new tickets with comments interleaved across tickets """
+    outbox = ev_outbox.Outbox(SQL)
+    with sqlite.transaction(SQL):
+        tids = [
+            outbox.create('ssgev', 'ssg', None, 'Bad Cable %d' % (i), 'description', {
+                'HELP_LOCATION': outbox.get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+            })
+            for i in range(tickets)
+        ]
+        for i in range(comments):
+            for tid in tids:
+                outbox.add_resolver_comment(tid, 'comment %d' % (i))
+
+    return tids
+
+def run ( tickets, comments, latency, jobs, rate = 0 ):
+    """ time one drain of a fresh outbox
+    returns dictionary of results
+    """
+    work = tempfile.mkdtemp(prefix = 'opstt-bench-ev-')
+    try:
+        (conn, SQL) = sqlite.init(os.path.join(work, 'outbox.sqlite'))
+        queue_tickets(SQL, tickets, comments)
+
+        ev = FakeExtraview(latency)
+        start = time.perf_counter()
+        stats = ev_outbox.drain(SQL, ev, jobs = jobs, rate = rate)
+        seconds = time.perf_counter() - start
+        sqlite.close(conn, SQL)
+
+        return {
+            'jobs': jobs,
+            'seconds': seconds,
+            'calls_per_second': len(ev.calls) / seconds,
+            'max_in_flight': ev.max_in_flight,
+            'sent': stats['sent'],
+            'latency': stats['latency'],
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors = True)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Benchmark draining the extraview outbox against a fake extraview')
+    parser.add_argument('--tickets', type = int, default = 100, help = 'new tickets queued')
+    parser.add_argument('--comments', type = int, default = 5, help = 'comments queued per ticket')
+    parser.add_argument('--latency', type = float, default = 0.02, help = 'simulated seconds per extraview call')
+    parser.add_argument('--jobs', type = int, nargs = '+', default = [1, 4, 16], help = 'drain thread counts')
+    parser.add_argument('--rate', type = float, default = 0, help = 'most calls per second (0 for unlimited)')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('VERBOSE', '0')
+
+    print('{0:>6}{1:>10}{2:>12}{3:>10}{4:>14}'.format('jobs', 'calls', 'seconds', 'calls/s', 'p95 comment'))
+    for jobs in args.jobs:
+        result = run(args.tickets, args.comments, args.latency, jobs, args.rate)
+        print('{0:>6}{1:>10}{2:>12.3f}{3:>10.1f}{4:>14.4f}'.format(
+            jobs, result['sent'], result['seconds'], result['calls_per_second'],
+            result['latency']['add_resolver_comment']['p95']
+        ))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
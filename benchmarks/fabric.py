@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#
+# Synthetic Infiniband fabric dump generator
+#
+# Writes the files of a bcl dump directory (ibnetdiscover.log,
+# ibdiagnet2.db_csv, ibdiagnet2.log, ibdiagnet2.cables, sgi-ibcv2.log
+# and timestamp.txt) for a generated fabric.
+#
+# usage: python -m benchmarks.fabric dump_dir [fat-tree|hypercube] [ports] [error density]
+#
+import math
+import os
+import random
+import sys
+import time
+
+SHAPES = ( 'fat-tree', 'hypercube' )
+""" supported fabric shapes """
+
+SWITCH_PORTS = 36
+""" ports per switch chip """
+
+SPEED = 'EDR'
+""" speed of every healthy link """
+
+WIDTH = '4x'
+""" width of every healthy link """
+
+CABLE_PN = ( 'MC2207130-002', 'MFA1A00-E010', 'MC2210130-003' )
+""" cable part numbers handed out to links """
+
+class Node ( object ):
+    """ Switch or HCA in the generated fabric """
+
+    def __init__ ( self, fabric, ntype, desc, label, nports ):
+        self.type = ntype
+        self.desc = desc
+        self.label = label
+        self.nports = nports
+        self.guid = (0x7cfe900300000000 if ntype == 'SW' else 0x0002c90300000000) + len(fabric.nodes)
+        self.lid = len(fabric.nodes) + 1
+        #port number -> (node, port number)
+        self.links = {}
+
+    def port_label ( self, port ):
+        """ port label as printed by ibdiagnet """
+        return '%s/P%s' % (self.label, port)
+
+class Fabric ( object ):
+    """ Generated fabric
+    shape: fat-tree or hypercube (SGI ICE)
+    ports: approximate number of connected ports
+    error_density: fraction of links that have an error
+    """
+
+    def __init__ ( self, shape = 'fat-tree', ports = 1000, error_density = 0.01, seed = 0 ):
+        if not shape in SHAPES:
+            raise ValueError('unknown fabric shape: %s' % (shape))
+
+        self.shape = shape
+        self.error_density = error_density
+        self.random = random.Random(seed)
+        self.nodes = []
+        #(node1, port1, node2, port2)
+        self.links = []
+        #links with errors: link index -> error type
+        self.errors = {}
+
+        if shape == 'fat-tree':
+            self._fat_tree(ports)
+        else:
+            self._hypercube(ports)
+
+        for i in range(len(self.links)):
+            if self.random.random() < error_density:
+                self.errors[i] = self.random.choice(['speed', 'width', 'counter', 'symbol', 'link', 'disabled', 'unknown'])
+
+    def add_node ( self, ntype, desc, label, nports ):
+        node = Node(self, ntype, desc, label, nports)
+        self.nodes.append(node)
+        return node
+
+    def connect ( self, node1, port1, node2, port2 ):
+        node1.links[port1] = (node2, port2)
+        node2.links[port2] = (node1, port1)
+        self.links.append((node1, port1, node2, port2))
+
+    def _fat_tree ( self, ports ):
+        """ two level fat tree: half of every leaf switch goes to hosts, half to spines """
+        down = SWITCH_PORTS // 2
+        #every host uses 4 ports: host, leaf down, leaf up and spine
+        hosts = max(1, ports // 4)
+        leaves = int(math.ceil(hosts / float(down)))
+        spines = max(1, int(math.ceil(leaves / 2.0)))
+
+        spine_nodes = [
+            self.add_node('SW', 'MF0;core%02d:SX60XX/U1' % (i + 1), 'core%02d/U1' % (i + 1), SWITCH_PORTS)
+            for i in range(spines)
+        ]
+        spine_port = [1] * spines
+
+        for l in range(leaves):
+            leaf = self.add_node('SW', 'MF0;ib%03d:SX60XX/U1' % (l + 1), 'ib%03d/U1' % (l + 1), SWITCH_PORTS)
+            for p in range(down):
+                h = l * down + p
+                if h >= hosts:
+                    break
+                host = self.add_node('CA', 'ys%05d HCA-1' % (h + 1), 'ys%05d/U1' % (h + 1), 1)
+                self.connect(host, 1, leaf, p + 1)
+
+            for u in range(down):
+                s = u % spines
+                if spine_port[s] > SWITCH_PORTS:
+                    continue
+                self.connect(leaf, down + u + 1, spine_nodes[s], spine_port[s])
+                spine_port[s] += 1
+
+    def _hypercube ( self, ports ):
+        """ SGI ICE enhanced hypercube: 2 switches per IRU with 18 nodes each """
+        per_switch = SWITCH_PORTS // 2
+        #estimate ports per IRU then grow the cube until it is big enough
+        irus = 1
+        while True:
+            dims = int(math.ceil(math.log(irus, 2))) if irus > 1 else 0
+            if irus * 2 * (per_switch * 2 + dims * 2 * 2) >= ports or dims >= 9:
+                break
+            irus += 1
+
+        dims = int(math.ceil(math.log(irus, 2))) if irus > 1 else 0
+        switches = {}
+        for k in range(irus):
+            rack = k // 4 + 1
+            iru = k % 4
+            for s in range(2):
+                switch = self.add_node(
+                    'SW',
+                    'MF0;r%di%ds%d:SX60XX/U1' % (rack, iru, s),
+                    'r%di%ds%d/U1' % (rack, iru, s),
+                    SWITCH_PORTS
+                )
+                switch.sgi = 'r%di%ds%dc0' % (rack, iru, s)
+                switches[(k, s)] = switch
+                for n in range(per_switch):
+                    node = s * per_switch + n
+                    host = self.add_node('CA', 'r%di%dn%d HCA-1' % (rack, iru, node), 'r%di%dn%d/U1' % (rack, iru, node), 1)
+                    self.connect(host, 1, switch, n + 1)
+
+        #2 links per dimension between the same switch of neighboring IRUs
+        for k in range(irus):
+            for d in range(dims):
+                other = k ^ (1 << d)
+                if other <= k or other >= irus:
+                    continue
+                for s in range(2):
+                    for i in range(2):
+                        port = per_switch + 1 + d * 2 + i
+                        self.connect(switches[(k, s)], port, switches[(other, s)], port)
+
+    def port_count ( self ):
+        return len(self.links) * 2
+
+    def link_error ( self, node, port ):
+        """ error type of the link on node/port or None """
+        return self._port_errors().get((node.guid, port))
+
+    def _port_errors ( self ):
+        if not hasattr(self, '_errors_by_port'):
+            self._errors_by_port = {}
+            for i, error in self.errors.items():
+                node1, port1, node2, port2 = self.links[i]
+                self._errors_by_port[(node1.guid, port1)] = error
+                self._errors_by_port[(node2.guid, port2)] = error
+        return self._errors_by_port
+
+    def link_speed ( self, node, port ):
+        return 'FDR' if self.link_error(node, port) == 'speed' else SPEED
+
+    def link_width ( self, node, port ):
+        return '1x' if self.link_error(node, port) == 'width' else WIDTH
+
+    def write_ibnetdiscover ( self, fds ):
+        """ 'ibnetdiscover -p' output: every port of every node """
+        for node in self.nodes:
+            for port in range(1, node.nports + 1):
+                if port in node.links:
+                    other, oport = node.links[port]
+                    fds.write("%s %5d %2d 0x%016x %s %s - %s %5d %2d 0x%016x ( '%s' - '%s' )\n" % (
+                        node.type, node.lid, port, node.guid,
+                        self.link_width(node, port), self.link_speed(node, port),
+                        other.type, other.lid, oport, other.guid,
+                        node.desc, other.desc
+                    ))
+                else:
+                    fds.write("%s %5d %2d 0x%016x %s %s %37s'%s'\n" % (
+                        node.type, node.lid, port, node.guid, WIDTH, 'SDR', '', node.desc
+                    ))
+
+    def write_ibdiagnet_csv ( self, fds ):
+        """ ibdiagnet2.db_csv with the sections ibdiagnet writes on every run """
+        fds.write('START_NODES\n')
+        fds.write('NodeDesc,NumPorts,NodeType,ClassVersion,BaseVersion,SystemImageGUID,NodeGUID,PortGUID\n')
+        for node in self.nodes:
+            fds.write('"%s",%d,%d,1,1,0x%016x,0x%016x,0x%016x\n' % (
+                node.desc, node.nports, 2 if node.type == 'SW' else 1, node.guid, node.guid, node.guid
+            ))
+        fds.write('END_NODES\n\n')
+
+        fds.write('START_PORTS\n')
+        fds.write('NodeGuid,PortGuid,PortNum,LID,PortState,PortPhyState,LinkWidthActv,LinkSpeedActv\n')
+        for node in self.nodes:
+            for port in range(1, node.nports + 1):
+                if port in node.links:
+                    state, phy = (1, 3) if self.link_error(node, port) == 'disabled' else (4, 5)
+                else:
+                    state, phy = (1, 2)
+                fds.write('0x%016x,0x%016x,%d,%d,%d,%d,2,%d\n' % (node.guid, node.guid, port, node.lid, state, phy, 64))
+        fds.write('END_PORTS\n\n')
+
+        fds.write('START_LINKS\n')
+        fds.write('NodeGuid1,PortNum1,NodeGuid2,PortNum2\n')
+        for node1, port1, node2, port2 in self.links:
+            fds.write('0x%016x,%d,0x%016x,%d\n' % (node1.guid, port1, node2.guid, port2))
+        fds.write('END_LINKS\n\n')
+
+        fds.write('START_CABLE_INFO\n')
+        fds.write('NodeGuid,PortGuid,PortNum,Source,Vendor,OUI,PN,SN,Rev,LengthDesc\n')
+        for i, (node1, port1, node2, port2) in enumerate(self.links):
+            for node, port in ((node1, port1), (node2, port2)):
+                fds.write('0x%016x,0x%016x,%d,Cable,Mellanox,0x2c9,%s,MT%08d,A1,%d m\n' % (
+                    node.guid, node.guid, port, CABLE_PN[i % len(CABLE_PN)], i, 1 + i % 5
+                ))
+        fds.write('END_CABLE_INFO\n\n')
+
+        fds.write('START_PM_INFO\n')
+        counters = ('symbol_error_counter', 'link_error_recovery_counter', 'link_downed_counter', 'port_rcv_errors', 'port_xmit_discard', 'port_xmit_data', 'port_rcv_data')
+        fds.write('NodeGUID,PortGUID,PortNumber,%s\n' % (','.join(counters)))
+        for node in self.nodes:
+            for port in sorted(node.links):
+                fds.write('0x%016x,0x%016x,%d,%s\n' % (
+                    node.guid, node.guid, port, ','.join(str(self.random.randint(0, 5)) for c in counters)
+                ))
+        fds.write('END_PM_INFO\n')
+
+    def write_ibdiagnet_log ( self, fds ):
+        """ ibdiagnet2.log with an error line per link error """
+        sep = '-' * 55 + '\n'
+        switches = len([node for node in self.nodes if node.type == 'SW'])
+
+        fds.write(sep + 'Discovery\n')
+        fds.write('-I- Discovering ... %d nodes (%d Switches & %d CA-s) discovered.\n' % (
+            len(self.nodes), switches, len(self.nodes) - switches
+        ))
+        fds.write('-I- Fabric Discover finished successfully\n\n')
+
+        links = []
+        counters = []
+        unknown = []
+        for i, error in sorted(self.errors.items()):
+            node1, port1, node2, port2 = self.links[i]
+            label1 = node1.port_label(port1)
+            label2 = node2.port_label(port2)
+            if error == 'link':
+                links.append('-E- Link: %s<-->%s - Unexpected actual link speed 14\n' % (label1, label2))
+            elif error == 'counter':
+                counter = self.random.choice(['link_down_counter', 'port_xmit_discard', 'vl15_dropped', 'unknown_block_cnt'])
+                counters.append('-E- %s - "%s" increased during the run (difference value=%d,difference allowed threshold=1)\n' % (
+                    label1, counter, self.random.randint(1, 200)
+                ))
+            elif error == 'symbol':
+                counters.append('-E- %s - "symbol_error_counter" increased during the run (difference value=%d,difference allowed threshold=1)\n' % (
+                    label1, self.random.randint(50, 5000)
+                ))
+                counters.append('-W- lid=0x%04x dev=4115 %s\n' % (node1.lid, label1))
+            elif error == 'unknown':
+                unknown.append('-E- Cable problem between %s and S%016x/N%016x/P%d\n' % (label1, node2.guid, node2.guid, port2))
+
+        fds.write(sep + 'Lids Check\n')
+        fds.write('-I- Lids Check finished successfully\n\n')
+
+        fds.write(sep + 'Links Check\n')
+        fds.writelines(links)
+        fds.writelines(unknown)
+        fds.write('-E- Links Check finished with errors\n' if links or unknown else '-I- Links Check finished successfully\n')
+        fds.write('\n')
+
+        fds.write(sep + 'Port Counters\n')
+        fds.writelines(counters)
+        fds.write('-E- Ports counters Difference Check (during run) finished with errors\n' if counters else '-I- Ports counters Difference Check (during run) finished successfully\n')
+        fds.write('\n')
+
+        fds.write(sep + 'Routing\n')
+        if self.errors:
+            node = self.nodes[-1]
+            fds.write('-E- Error in mark route from:%s SLID:%d to DLID:%d\n' % (node.label, node.lid, 1))
+        fds.write('-I- Routing finished\n\n')
+
+        fds.write(sep + 'Summary\n')
+        fds.write('-I- Stage                     Warnings   Errors     Comment\n')
+        fds.write('-I- Total                     0          %d\n' % (len(self.errors)))
+
+    def write_ibdiagnet_cables ( self, fds ):
+        """ ibdiagnet2.cables: stanza per cabled port """
+        sep = '-' * 55 + '\n'
+        for i, (node1, port1, node2, port2) in enumerate(self.links):
+            for node, port in ((node1, port1), (node2, port2)):
+                fds.write(sep)
+                fds.write('Port=%d Lid=0x%04x GUID=0x%016x Port Name=%s\n' % (port, node.lid, node.guid, node.port_label(port)))
+                fds.write(sep)
+                fds.write('Vendor: Mellanox\nOUI: 0x2c9\nPN: %s\nSN: MT%08d\nRev: A1\nLength: %d m\nType: Copper cable- unequalized\nSupportedSpeed: SDR/DDR/QDR/FDR/EDR\n\n' % (
+                    CABLE_PN[i % len(CABLE_PN)], i, 1 + i % 5
+                ))
+
+    def write_sgi_ibcv2 ( self, fds ):
+        """ SGI ibcv2 output (hypercube only): missing and unexpected cables """
+        for i, error in sorted(self.errors.items()):
+            node1, port1, node2, port2 = self.links[i]
+            if node1.type != 'SW' or node2.type != 'SW':
+                continue
+            if error in ('disabled', 'link'):
+                fds.write('NOT FOUND: %s.%d %s.%d\n' % (node1.sgi, port1, node2.sgi, port2))
+            elif error == 'unknown':
+                fds.write('MISCABLE:\n')
+                fds.write('\tFOUND:    %s.%d <---> %s.%d\n' % (node1.sgi, port1, node2.sgi, port2 + 1))
+                fds.write('\tEXPECTED: %s.%d <---> %s.%d\n' % (node1.sgi, port1, node2.sgi, port2))
+        if self.errors:
+            fds.write('ERROR: %d cabling problems found\n' % (len(self.errors)))
+
+    def write ( self, dump_dir ):
+        """ write every dump file into dump_dir
+        returns dictionary of file name -> size in bytes
+        """
+        if not os.path.isdir(dump_dir):
+            os.makedirs(dump_dir)
+
+        files = [
+            ('ibnetdiscover.log', self.write_ibnetdiscover),
+            ('ibdiagnet2.db_csv', self.write_ibdiagnet_csv),
+            ('ibdiagnet2.log', self.write_ibdiagnet_log),
+            ('ibdiagnet2.cables', self.write_ibdiagnet_cables),
+        ]
+        if self.shape == 'hypercube':
+            files.append(('sgi-ibcv2.log', self.write_sgi_ibcv2))
+
+        sizes = {}
+        for name, write in files:
+            path = os.path.join(dump_dir, name)
+            with open(path, 'w') as fds:
+                write(fds)
+            sizes[name] = os.path.getsize(path)
+
+        with open(os.path.join(dump_dir, 'timestamp.txt'), 'w') as fds:
+            fds.write('%d\n' % (int(time.time())))
+
+        return sizes
+
+def generate ( dump_dir, shape = 'fat-tree', ports = 1000, error_density = 0.01, seed = 0 ):
+    """ Generate fabric and write its dump files into dump_dir
+    returns Fabric
+    """
+    fabric = Fabric(shape, ports, error_density, seed)
+    fabric.write(dump_dir)
+    return fabric
+
+def main(argv):
+    if not argv:
+        print('usage: python -m benchmarks.fabric dump_dir [%s] [ports] [error density]' % ('|'.join(SHAPES)))
+        return 1
+
+    fabric = generate(
+        argv[0],
+        argv[1] if len(argv) > 1 else 'fat-tree',
+        int(argv[2]) if len(argv) > 2 else 1000,
+        float(argv[3]) if len(argv) > 3 else 0.01
+    )
+    print('%s: %d nodes %d ports %d links %d errors' % (
+        fabric.shape, len(fabric.nodes), fabric.port_count(), len(fabric.links), len(fabric.errors)
+    ))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#
+# Benchmark ingesting synthetic 'ibnetdiscover -p' output
+#
+# usage: python -m benchmarks.ibnetdiscover_ingest [lines]+
+#
+import os
+import sys
+import time
+from .context import opstt
+from opstt import ib_diagnostics
+
+def synthetic_ibnetdiscover(lines):
+    """ generate lines of 'ibnetdiscover -p' output with node to switch cables """
+    out = []
+    for i in range(lines):
+        switch = i // 36
+        out.append("CA %5d  1 0x%016x 4x EDR - SW %5d %2d 0x%016x ( 'r%di%dn%d HCA-1' - 'MF0;r%di%ds0:SX60XX/U1' )" % (
+            100000 + i,
+            0x0002c90300000000 + i,
+            switch + 1,
+            i % 36 + 1,
+            0x7cfe900300000000 + switch,
+            switch // 4,
+            switch % 4,
+            i % 36,
+            switch // 4,
+            switch % 4
+        ))
+    return os.linesep.join(out)
+
+def time_ingest(ports, contents):
+    """ return seconds to parse contents into ports """
+    start = time.time()
+    ib_diagnostics.parse_ibnetdiscover_cables(ports, contents)
+    return time.time() - start
+
+def main(sizes):
+    os.environ.setdefault('VERBOSE', '0')
+
+    print('{0:>10}{1:>12}{2:>16}'.format('lines', 'ports', 'registry (s)'))
+    for size in sizes:
+        contents = synthetic_ibnetdiscover(size)
+        ports = ib_diagnostics.PortRegistry()
+        elapsed = time_ingest(ports, contents)
+        print('{0:>10}{1:>12}{2:>16.3f}'.format(size, len(ports), elapsed))
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#
+# Benchmark the dump parsers against generated fabrics
+#
+# Times (and memory profiles) every parser in ib_diagnostics, parse_dump,
+# the parse cache and bcl.run_parse end to end against a throwaway database.
+# Results are written as JSON.
+#
+# usage: python -m benchmarks.run [--shape fat-tree] [--ports 1000 10000] [--output bench_results.json]
+#
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from .context import opstt
+from opstt import ib_diagnostics
+from opstt import dump_cache
+from . import fabric
+
+def measure ( func, memory = True ):
+    """ run func() and return (result, step results)
+    memory: run func() a second time under tracemalloc for the peak usage
+    """
+    start = time.perf_counter()
+    result = func()
+    step = { 'seconds': time.perf_counter() - start }
+
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            step['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result, step
+
+def read ( dump_dir, name ):
+    with open(os.path.join(dump_dir, name), 'r') as fds:
+        return fds.read()
+
+def parser_steps ( dump_dir, shape, memory = True ):
+    """ time each parser on its own against a fresh port registry """
+    steps = {}
+
+    def ibnetdiscover():
+        ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(ports, read(dump_dir, 'ibnetdiscover.log'))
+        return ports
+
+    ports, steps['ibnetdiscover'] = measure(ibnetdiscover, memory)
+
+    def ibdiagnet_csv():
+        with open(os.path.join(dump_dir, 'ibdiagnet2.db_csv'), 'rb') as fcsv:
+            ib_diagnostics.parse_ibdiagnet_csv(ports, [], fcsv)
+
+    steps['ibdiagnet_csv'] = measure(ibdiagnet_csv, memory)[1]
+
+    def ibdiagnet_log():
+        issues = []
+        ib_diagnostics.parse_ibdiagnet(ports, issues, read(dump_dir, 'ibdiagnet2.log'))
+        return issues
+
+    steps['ibdiagnet_log'] = measure(ibdiagnet_log, memory)[1]
+
+    def ibdiagnet_cables():
+        ib_diagnostics.parse_ibdiagnet_cables(ports, [], read(dump_dir, 'ibdiagnet2.cables'))
+
+    steps['ibdiagnet_cables'] = measure(ibdiagnet_cables, memory)[1]
+
+    if shape == 'hypercube':
+        def sgi_ibcv2():
+            ib_diagnostics.parse_sgi_ibcv2(ports, [], read(dump_dir, 'sgi-ibcv2.log'))
+
+        steps['sgi_ibcv2'] = measure(sgi_ibcv2, memory)[1]
+
+    return steps
+
+def dump_steps ( dump_dir, jobs, memory = True ):
+    """ time parse_dump serial and parallel plus the parse cache """
+    steps = {}
+
+    def parse(jobs):
+        ports = ib_diagnostics.PortRegistry()
+        issues = []
+        ib_diagnostics.parse_dump(ports, issues, dump_dir, jobs)
+        return ports, issues
+
+    (ports, issues), steps['parse_dump'] = measure(lambda: parse(1), memory)
+    if jobs and jobs > 1:
+        #memory of worker processes is not visible to tracemalloc
+        steps['parse_dump_jobs_%d' % (jobs)] = measure(lambda: parse(jobs), False)[1]
+
+    steps['cache_save'] = measure(lambda: dump_cache.save(dump_dir, ports, issues), False)[1]
+    steps['cache_load'] = measure(lambda: dump_cache.load(dump_dir), memory)[1]
+    dump_cache.clear(dump_dir)
+
+    return steps, len(ports), len(issues)
+
+def run_parse_step ( dump_dir, jobs, memory = True ):
+    """ time bcl.run_parse against a throwaway database """
+    try:
+        from opstt import bcl
+        from opstt import cluster_info
+    except ImportError as err:
+        return { 'skipped': 'unable to import opstt.bcl: %s' % (err) }
+
+    work = tempfile.mkdtemp(prefix = 'opstt-bench-db-')
+    get_ib_speed = cluster_info.get_ib_speed
+    try:
+        bcl.BAD_CABLE_DB = os.path.join(work, 'bad_cables.sqlite')
+        bcl.DISABLE_TICKETS = True
+        bcl.EV = None
+        bcl.CONFIG = {}
+        cluster_info.get_ib_speed = lambda: { 'speed': fabric.SPEED, 'link': 25, 'width': fabric.WIDTH }
+
+        def parse():
+            bcl.initialize_db()
+            try:
+                bcl.run_parse(dump_dir, jobs)
+            finally:
+                bcl.release_db()
+
+        #second pass runs against the populated database
+        return measure(parse, memory)[1]
+    except Exception as err:
+        return { 'error': '%s: %s' % (type(err).__name__, err) }
+    finally:
+        cluster_info.get_ib_speed = get_ib_speed
+        shutil.rmtree(work, ignore_errors = True)
+
+def run ( shape, ports, density, jobs = None, memory = True, end_to_end = True, seed = 0 ):
+    """ generate one fabric and benchmark it
+    returns dictionary of results
+    """
+    dump_dir = tempfile.mkdtemp(prefix = 'opstt-bench-')
+    try:
+        start = time.perf_counter()
+        fab = fabric.Fabric(shape, ports, density, seed)
+        files = fab.write(dump_dir)
+        generated = time.perf_counter() - start
+
+        result = {
+            'shape': shape,
+            'requested_ports': ports,
+            'ports': fab.port_count(),
+            'nodes': len(fab.nodes),
+            'errors': len(fab.errors),
+            'density': density,
+            'files': files,
+            'generate_seconds': generated,
+            'steps': parser_steps(dump_dir, shape, memory),
+        }
+
+        steps, result['parsed_ports'], result['parsed_issues'] = dump_steps(dump_dir, jobs, memory)
+        result['steps'].update(steps)
+
+        if end_to_end:
+            result['steps']['run_parse'] = run_parse_step(dump_dir, jobs, memory)
+
+        return result
+    finally:
+        shutil.rmtree(dump_dir, ignore_errors = True)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Benchmark the dump parsers against generated fabrics')
+    parser.add_argument('--shape', choices = fabric.SHAPES, action = 'append', help = 'fabric shape (repeatable, default: all)')
+    parser.add_argument('--ports', type = int, nargs = '+', default = [1000, 10000, 100000], help = 'approximate ports per fabric')
+    parser.add_argument('--density', type = float, default = 0.01, help = 'fraction of links with errors')
+    parser.add_argument('--jobs', type = int, default = None, help = 'also time parse_dump with this many processes')
+    parser.add_argument('--seed', type = int, default = 0, help = 'random seed of the generated fabrics')
+    parser.add_argument('--output', default = 'bench_results.json', help = 'JSON results file')
+    parser.add_argument('--no-memory', dest = 'memory', action = 'store_false', help = 'skip tracemalloc passes')
+    parser.add_argument('--no-run-parse', dest = 'end_to_end', action = 'store_false', help = 'skip bcl.run_parse')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('VERBOSE', '0')
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'runs': []
+    }
+
+    print('{0:>10}{1:>10}{2:>10}{3:>14}{4:>14}'.format('shape', 'ports', 'issues', 'parse (s)', 'peak (MiB)'))
+    for shape in args.shape or fabric.SHAPES:
+        for ports in args.ports:
+            result = run(shape, ports, args.density, args.jobs, args.memory, args.end_to_end, args.seed)
+            results['runs'].append(result)
+
+            step = result['steps']['parse_dump']
+            print('{0:>10}{1:>10}{2:>10}{3:>14.3f}{4:>14}'.format(
+                shape, result['ports'], result['parsed_issues'], step['seconds'],
+                '%.1f' % (step['peak_bytes'] / 1048576.0) if 'peak_bytes' in step else '-'
+            ))
+
+    with open(args.output, 'w') as fds:
+        json.dump(results, fds, indent = 2, sort_keys = True)
+    print('results written to %s' % (args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,6 @@
 # vim: set tabstop=8 softtabstop=4 noexpandtab
 from . import cluster_info
+from . import dump_cache
 from . import file_locking
 from . import ib_diagnostics
 from . import ibm_cluster
@@ -30,28 +30,54 @@
 #OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
 import opstt
 from sys import path, argv, stderr
-import extraview
 from . import config
 from . import nfile
 from .nlog import vlog,die_now
 from ClusterShell.NodeSet import NodeSet
 from ClusterShell.Task import task_self
 from . import sqlite
+from . import bcl_schema
 import os
 import syslog
 from . import pbs
 from . import siblings
 from . import cluster_info
 from . import ib_diagnostics
+from . import dump_cache
 from . import ib_mgt
+from . import ev_outbox
+from . import ev_field_keys
+from . import file_locking
 import pprint
 import time
 import datetime
 import re
 import csv
+import json
 import sys
 import time
 import shutil
+import contextlib
+
+CONFIG = None
+
+BAD_CABLE_DB='/etc/ncar_bad_cable_list.sqlite'
+""" const string: Path to sqlite database for bad cable list """
+
+DISABLE_PORT_STATE_CHANGE=False
+DISABLE_BISECT_DETECT=False
+DISABLE_TICKETS=False
+EV = None
+""" extraview client or ev_outbox.Outbox queueing ticket operations for run_drain() """
+
+EV_DRAIN_LOCK='/var/run/ncar_bcl_ev_drain'
+""" const string: lock held while draining the extraview outbox """
+
+PORT_BATCH = None
+""" fabric port states (guid, port) -> enable queued by batch_cable_changes() or None to change them immediately """
+
+ISSUE_BATCH = None
+""" per run issues waiting for flush_issues() and caches or None to insert them immediately """
 
 def initialize_db():
     """ Initialize DATABASE state variable 
@@ -63,94 +89,124 @@ def initialize_db():
     if not SQL_CONNECTION or not SQL:
         die_now('unable to open DB')
 
+    #auto_vacuum only applies to new databases (see run_maintenance())
     SQL.executescript("""
+        PRAGMA auto_vacuum = INCREMENTAL;
         PRAGMA foreign_keys = ON;
         PRAGMA journal_mode = WAL;
     """)
- 
-    return;
 
-    SQL.executescript("""
-        PRAGMA foreign_keys = ON;
+    sqlite.migrate(SQL, MIGRATIONS)
 
-        create table if not exists cables (
-            cid INTEGER PRIMARY KEY AUTOINCREMENT,
-            state TEXT,
-            --creation time
-            ctime INTEGER,
-            --mtime (last time state from watch state)
-            mtime INTEGER,
-            --Cable Length
-            length text,
-            --Serial Number
-            SN text,
-            --Product Number
-            PN text 
-            --State enum - watch, suspect, disabled, removed
-            state text,
-            comment BLOB,
-            --Number of times that cable has gone into suspect state
-            suspected INTEGER,
-            --Extraview Ticket number
-            ticket INTEGER,
-            --Physical Label
-            plabel text,
-            --Firmware Label
-            flabel text,
-            --Online (cable last seen online)
-            online BOOLEAN,
-            --Last Time seen Online
-            onlineTime integer 
-        );
+def run_maintenance(force = False):
+    """ Run database maintenance 
+    Once the free page ratio crosses cables/maintenance/'free page ratio',
+    free pages are released in bounded incremental_vacuum steps and the
+    query planner statistics are refreshed.
+    force: run every step and convert database to incremental auto vacuum
+    """
+    ratio = config.get(CONFIG, ['cables', 'maintenance', 'free page ratio'], 0.1)
+    pages = config.get(CONFIG, ['cables', 'maintenance', 'vacuum pages'], 1024)
+    steps = config.get(CONFIG, ['cables', 'maintenance', 'vacuum steps'], 16)
+
+    if sqlite.auto_vacuum(SQL) != sqlite.AUTO_VACUUM_INCREMENTAL:
+        if not force:
+            vlog(2, 'database is not using incremental auto vacuum. Run "%s maintenance force" once to convert it.' % (argv[0]))
+            SQL.execute('PRAGMA optimize;')
+            return
 
-        --may not need these indexs yet
-        --CREATE INDEX IF NOT EXISTS cables_state_index on cables (state);
-        --CREATE INDEX IF NOT EXISTS cables_online_index on cables (online);
-
-        create table if not exists cable_ports (
-            cpid INTEGER PRIMARY KEY AUTOINCREMENT, 
-            cid integer,
-            --Physical Label
-            plabel text,
-            --Firmware Label
-            flabel text,
-            guid text,
-            --PortNum 
-            port integer,
-            --Name (usually hostname)
-            name text,
-            --if port is an HCA
-            hca BOOLEAN,
-            FOREIGN KEY (cid) REFERENCES cables(cid)
-        );
+        #only time the whole database is rewritten
+        vlog(2, 'converting database to incremental auto vacuum')
+        SQL.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+        SQL.execute('VACUUM;')
 
-        CREATE INDEX IF NOT EXISTS cable_ports_guid_index on cable_ports  (guid, port);
-        CREATE INDEX IF NOT EXISTS cable_ports_guid_cid_index on cable_ports  (cid, guid, port);
-
-        CREATE TABLE IF NOT EXISTS issues (
-            iid INTEGER PRIMARY KEY AUTOINCREMENT,
-            -- last time issue was generated
-            mtime integer,
-            -- Parsed error type
-            type text,
-            -- Issue description (aka what is wrong)
-            issue blob,
-            --Raw error message
-            raw blob,
-            --Where error was generated
-            source blob,
-            --cable source of issue (may be null)
-            cid INTEGER,
-            --should these issues be ignored?
-            ignore BOOLEAN,
-            FOREIGN KEY (cid) REFERENCES cables(cid)
-        );
+    free, total = sqlite.free_pages(SQL)
+    vlog(4, 'database free pages: %s/%s' % (free, total))
 
-    """)
+    if force or (total and float(free) / total >= ratio):
+        for i in range(steps):
+            if not free:
+                break
 
-    sqlite.add_column(SQL, 'cables', 'online', 'BOOLEAN')
-    sqlite.add_column(SQL, 'cables', 'onlineTime', 'integer')
-    #sqlite.add_column(SQL, 'cable_ports' , 'enabled', 'BOOLEAN')
+            #each step is its own short transaction to avoid blocking readers
+            sqlite.incremental_vacuum(SQL, pages)
+            free, total = sqlite.free_pages(SQL)
+            vlog(4, 'incremental vacuum: %s/%s pages free' % (free, total))
+
+        SQL.execute('ANALYZE;')
+        vlog(3, 'database analyzed')
+
+    SQL.execute('PRAGMA optimize;')
+
+def open_extraview():
+    """ Open extraview client with persistently cached field keys """
+    #only needed to talk to extraview (not to parse or query the database)
+    import extraview_cli
+    return ev_field_keys.open_cache(extraview_cli.open_extraview(), CONFIG)
+
+def field_key_cache_path():
+    """ Get path to extraview field key cache """
+    return ev_field_keys.cache_path(CONFIG)
+
+def run_field_keys(clear = False):
+    """ Dump cached extraview field keys 
+    clear: invalidate the cache (after extraview is reconfigured)
+    """
+    path = field_key_cache_path()
+    if clear:
+        ev_field_keys.clear(path)
+        return
+
+    now = time.time()
+    for field, values in sorted(ev_field_keys.load(path).items()):
+        for value, (key, cached) in sorted(values.items()):
+            print('%s=%s: %s (cached %d seconds ago)' % (field, value, key, now - cached))
+
+def backfill_ticket(placeholder, ticket):
+    """ Replace placeholder ticket id of queued create with real ticket """
+    SQL.execute(bcl_schema.BACKFILL_TICKET, (ticket, placeholder))
+    vlog(4, 'backfilled ticket %s for placeholder %s' % (ticket, placeholder))
+
+def run_drain(retry = False):
+    """ Send queued extraview operations and backfill new ticket ids 
+    retry: requeue operations that failed every retry
+    """
+    if DISABLE_TICKETS:
+        vlog(1, 'Extraview tickets are disabled. Not draining outbox.')
+        return
+
+    lock = file_locking.try_lock(EV_DRAIN_LOCK, 1)
+    if not lock:
+        vlog(1, 'Extraview outbox is already being drained')
+        return
+
+    ev_outbox.init(SQL)
+    if retry:
+        ev_outbox.retry_failed(SQL)
+
+    stats = ev_outbox.drain(
+        SQL, 
+        open_extraview(),
+        config.get(CONFIG, ['tickets', 'outbox retries'], ev_outbox.RETRIES),
+        config.get(CONFIG, ['tickets', 'outbox backoff'], ev_outbox.BACKOFF),
+        jobs = config.get(CONFIG, ['tickets', 'outbox jobs'], ev_outbox.JOBS),
+        rate = config.get(CONFIG, ['tickets', 'outbox rate'], ev_outbox.RATE)
+    )
+
+    with sqlite.transaction(SQL):
+        count = ev_outbox.backfill(SQL, backfill_ticket)
+
+    vlog(3, 'extraview outbox: sent %s, retry %s, failed %s, waiting %s, backfilled %s tickets' % (
+        stats['sent'],
+        stats['retry'],
+        stats['failed'],
+        stats['waiting'],
+        count
+    ))
+    for op, latency in sorted(stats['latency'].items()):
+        vlog(4, 'extraview %s: %s calls mean %.3fs p95 %.3fs max %.3fs' % (
+            op, latency['count'], latency['mean'], latency['p95'], latency['max']
+        ))
 
 def release_db():
     """ Releases Database """
@@ -158,138 +214,281 @@ def release_db():
     sqlite.close(SQL_CONNECTION, SQL)
     vlog(5, 'released db')
 
-def add_issue(issue_type, cid, issue, raw, source, timestamp):
-    """ Add issue to issues list """
-    global EV
-
-    iid = None
-
-    #find if this issue is already ignored
-    SQL.execute('''
-        SELECT 
-            iid
-        FROM 
-            issues
-        WHERE
-            type = ? and
-            issue = ? and
-            ( ? IS NULL or raw = ? ) and
-            ignore = 1 and
-            cid = ?
-        LIMIT 1
-    ''',(
-        issue_type,
-        issue,
-        raw, raw,
-        cid       
-    ))
+CABLE_ALIASES = '''
+    SELECT 'c:' || %(row)s.cid, %(row)s.cid, NULL %(from)s WHERE %(row)s.cid IS NOT NULL
+    UNION ALL
+    SELECT 't:' || %(row)s.ticket, %(row)s.cid, NULL %(from)s WHERE %(row)s.ticket IS NOT NULL
+    UNION ALL
+    SELECT 'cl:' || %(row)s.plabel, %(row)s.cid, NULL %(from)s WHERE %(row)s.plabel IS NOT NULL
+    UNION ALL
+    SELECT 'cl:' || %(row)s.flabel, %(row)s.cid, NULL %(from)s WHERE %(row)s.flabel IS NOT NULL
+'''
+""" alias keys of cables (row is NEW in triggers or cables with from) """
+
+CABLE_PORT_ALIASES = '''
+    SELECT 'p:' || %(row)s.cpid, %(row)s.cid, %(row)s.cpid %(from)s WHERE %(row)s.cpid IS NOT NULL
+    UNION ALL
+    SELECT 'pl:' || %(row)s.plabel, %(row)s.cid, %(row)s.cpid %(from)s WHERE %(row)s.plabel IS NOT NULL
+    UNION ALL
+    SELECT 'pl:' || %(row)s.flabel, %(row)s.cid, %(row)s.cpid %(from)s WHERE %(row)s.flabel IS NOT NULL
+    UNION ALL
+    SELECT 'g:' || %(row)s.guid || '/' || %(row)s.port, %(row)s.cid, %(row)s.cpid %(from)s
+        WHERE %(row)s.guid IS NOT NULL and %(row)s.port IS NOT NULL
+    UNION ALL
+    SELECT 'n:' || %(row)s.name || '/' || %(row)s.port, %(row)s.cid, %(row)s.cpid %(from)s
+        WHERE %(row)s.name IS NOT NULL and %(row)s.port IS NOT NULL
+'''
+""" alias keys of cable ports (row is NEW in triggers or cable_ports with from) """
+
+def create_cable_aliases(SQL):
+    """ Create cable_aliases table of every needle resolve_cable() accepts 
+    keys are prefixed by type:
+        c:{cid} t:{ticket} cl:{cable label} 
+        p:{cpid} pl:{port label} g:{guid int}/{port} n:{name}/{port}
+    triggers keep the aliases in sync with cables and cable_ports
+    """
+    SQL.execute("SELECT name FROM sqlite_master WHERE type = 'table' and name = 'cable_aliases'")
+    if SQL.fetchall():
+        return
 
-    for row in SQL.fetchall():
-        iid = row['iid']
-        vlog(2, 'Ignoring existing issue i%s' % (iid))
+    SQL.execute("SELECT name FROM sqlite_master WHERE type = 'table' and name IN ('cables', 'cable_ports')")
+    if len(SQL.fetchall()) != 2:
         return
 
-    #find if this exact issue already exists
-    SQL.execute('''
-        SELECT 
-            iid
-        FROM 
-            issues
-        WHERE
-            type = ? and
-            issue = ? and
-            ( ? IS NULL or raw = ? ) and
-            source = ? and
-            cid = ?
-        LIMIT 1
-    ''',(
-        issue_type,
-        issue,
-        raw, raw,
-        source,
-        cid       
-    ))
+    with sqlite.transaction(SQL):
+        SQL.execute('''
+            CREATE TABLE cable_aliases (
+                key TEXT NOT NULL,
+                cid INTEGER NOT NULL,
+                --NULL for aliases of the cable itself
+                cpid INTEGER
+            );
+        ''')
+        SQL.execute('CREATE INDEX cable_aliases_key_index on cable_aliases (key);')
+        SQL.execute('CREATE INDEX cable_aliases_cid_index on cable_aliases (cid, cpid);')
 
-    #only care about last time this issue was seen	
-    #in theory, there should never be more than 1
-    #since a new issue would have a new cable
-    for row in SQL.fetchall():
-        iid = row['iid']
-        break
+        SQL.execute('''
+            CREATE TRIGGER cable_aliases_cables_insert AFTER INSERT ON cables 
+            BEGIN
+                INSERT INTO cable_aliases (key, cid, cpid) %s;
+            END;
+        ''' % (CABLE_ALIASES % { 'row': 'NEW', 'from': '' }))
+        SQL.execute('''
+            CREATE TRIGGER cable_aliases_cables_update AFTER UPDATE OF ticket, plabel, flabel ON cables 
+            WHEN 
+                OLD.ticket IS NOT NEW.ticket or
+                OLD.plabel IS NOT NEW.plabel or
+                OLD.flabel IS NOT NEW.flabel
+            BEGIN
+                DELETE FROM cable_aliases WHERE cid = OLD.cid and cpid IS NULL;
+                INSERT INTO cable_aliases (key, cid, cpid) %s;
+            END;
+        ''' % (CABLE_ALIASES % { 'row': 'NEW', 'from': '' }))
+        SQL.execute('''
+            CREATE TRIGGER cable_aliases_cables_delete AFTER DELETE ON cables 
+            BEGIN
+                DELETE FROM cable_aliases WHERE cid = OLD.cid;
+            END;
+        ''')
 
-    if not iid:
         SQL.execute('''
-            INSERT INTO 
-            issues 
-            (
-                ignore,
-                type,
-                issue,
-                raw,
-                source,
-                mtime,
-                cid
-            ) VALUES (
-                0, ?, ?, ?, ?, ?, ?
-            );''', (
-                issue_type,
-                issue,
-                raw,
-                source,
-                timestamp,
-                cid
-        ));
+            CREATE TRIGGER cable_aliases_cable_ports_insert AFTER INSERT ON cable_ports 
+            BEGIN
+                INSERT INTO cable_aliases (key, cid, cpid) %s;
+            END;
+        ''' % (CABLE_PORT_ALIASES % { 'row': 'NEW', 'from': '' }))
+        SQL.execute('''
+            CREATE TRIGGER cable_aliases_cable_ports_update AFTER UPDATE OF cid, plabel, flabel, guid, port, name ON cable_ports 
+            WHEN 
+                OLD.cid IS NOT NEW.cid or
+                OLD.plabel IS NOT NEW.plabel or
+                OLD.flabel IS NOT NEW.flabel or
+                OLD.guid IS NOT NEW.guid or
+                OLD.port IS NOT NEW.port or
+                OLD.name IS NOT NEW.name
+            BEGIN
+                DELETE FROM cable_aliases WHERE cid = OLD.cid and cpid = OLD.cpid;
+                INSERT INTO cable_aliases (key, cid, cpid) %s;
+            END;
+        ''' % (CABLE_PORT_ALIASES % { 'row': 'NEW', 'from': '' }))
+        SQL.execute('''
+            CREATE TRIGGER cable_aliases_cable_ports_delete AFTER DELETE ON cable_ports 
+            BEGIN
+                DELETE FROM cable_aliases WHERE cid = OLD.cid and cpid = OLD.cpid;
+            END;
+        ''')
+
+        SQL.execute('INSERT INTO cable_aliases (key, cid, cpid) %s;' % (
+            CABLE_ALIASES % { 'row': 'cables', 'from': 'FROM cables' }
+        ))
+        SQL.execute('INSERT INTO cable_aliases (key, cid, cpid) %s;' % (
+            CABLE_PORT_ALIASES % { 'row': 'cable_ports', 'from': 'FROM cable_ports' }
+        ))
 
-        iid = SQL.lastrowid
-        vlog(3, 'created new issue i%s type=%s issue=%s cid=%s' % (iid, issue_type, issue, cid))
-    else: #issue was found
-        #update mtime since we just got a new hit
+    vlog(3, 'created cable aliases')
 
+def create_issue_index(SQL):
+    """ Create unique index over the issue identity used by bcl_schema.ISSUE_UPSERT 
+    merges any duplicate issues (keeping oldest iid) first
+    """
+    SQL.execute("SELECT name FROM sqlite_master WHERE type = 'index' and name = 'issues_identity_index'")
+    if SQL.fetchall():
+        return
+
+    SQL.execute("SELECT name FROM sqlite_master WHERE type = 'table' and name = 'issues'")
+    if not SQL.fetchall():
+        return
+
+    with sqlite.transaction(SQL):
+        #NULLs are never equal in a unique index: only merge issues without NULLs
         SQL.execute('''
-            UPDATE
+            CREATE TEMP TABLE issue_duplicates AS
+                SELECT 
+                    min(iid) as iid,
+                    max(mtime) as mtime,
+                    max(ignore) as ignore
+                FROM 
+                    issues
+                WHERE
+                    type IS NOT NULL and
+                    issue IS NOT NULL and
+                    source IS NOT NULL and
+                    cid IS NOT NULL
+                GROUP BY type, issue, source, cid, coalesce(raw, '')
+                HAVING count(*) > 1
+        ''')
+
+        SQL.execute('''
+            DELETE FROM 
                 issues 
+            WHERE 
+                iid NOT IN (SELECT iid FROM issue_duplicates) and
+                EXISTS (
+                    SELECT 1 FROM issues as keep
+                    WHERE
+                        keep.iid IN (SELECT iid FROM issue_duplicates) and
+                        keep.type = issues.type and
+                        keep.issue = issues.issue and
+                        keep.source = issues.source and
+                        keep.cid = issues.cid and
+                        coalesce(keep.raw, '') = coalesce(issues.raw, '')
+                )
+        ''')
+
+        SQL.execute('''
+            UPDATE 
+                issues
             SET
-                mtime = ?
+                mtime = (SELECT mtime FROM issue_duplicates WHERE issue_duplicates.iid = issues.iid),
+                ignore = (SELECT ignore FROM issue_duplicates WHERE issue_duplicates.iid = issues.iid)
             WHERE
-                iid = ?
-            ;''', (
-                timestamp,
-                iid
-        ));
+                iid IN (SELECT iid FROM issue_duplicates)
+        ''')
 
-        vlog(4, 'updated issue i%s mtime' % (iid))
+        SQL.execute('DROP TABLE issue_duplicates')
 
-    
-    #find cable status
-    SQL.execute('''
-        SELECT 
-            cables.cid,
-            cables.state,
-            cables.suspected,
-            cables.ticket,
-            cp1.flabel as cp1_flabel,
-            cp2.flabel as cp2_flabel
-        FROM 
-            cables
+        SQL.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS issues_identity_index 
+                on issues (type, issue, source, cid, coalesce(raw, ''))
+        ''')
 
-        INNER JOIN
-            cable_ports as cp1
-        ON
-            cables.cid = ? and
-            cables.cid = cp1.cid
+    vlog(3, 'created issues identity index')
 
-        LEFT OUTER JOIN
-            cable_ports as cp2
-        ON
-            cables.cid = cp2.cid and
-            cp1.cpid != cp2.cpid
-             
-        LIMIT 1
-    ''',(
-        cid,
-    ))
+def migrate_baseline(SQL):
+    """ Migration 1: schema from before migrations were numbered 
+    every step is skipped if it already exists.
+    """
+    for table in bcl_schema.TABLES:
+        SQL.execute(table)
+
+    sqlite.add_column(SQL, 'cables', 'online', 'BOOLEAN')
+    sqlite.add_column(SQL, 'cables', 'onlineTime', 'integer')
+    #sqlite.add_column(SQL, 'cable_ports' , 'enabled', 'BOOLEAN')
+
+    create_issue_index(SQL)
+    create_cable_aliases(SQL)
+
+MIGRATIONS = [
+    (1, migrate_baseline),
+    (2, bcl_schema.create_indexes),
+]
+""" numbered database migrations (applied by sqlite.migrate() from initialize_db()) """
+
+def issue_ignored(issue_type, issue, raw, cid):
+    """ Check if issue matches an ignored issue 
+    source is not checked and a raw of None matches any raw
+    """
+    if ISSUE_BATCH is None:
+        SQL.execute(bcl_schema.ISSUE_IGNORED, (
+            issue_type,
+            issue,
+            raw, raw,
+            cid       
+        ))
+
+        for row in SQL.fetchall():
+            vlog(2, 'Ignoring existing issue i%s' % (row['iid']))
+            return True
+
+        return False
+
+    #match the query above: NULL is never equal in sql
+    for iraw, iid in ISSUE_BATCH['ignored'].get((issue_type, issue, cid), []):
+        if raw is None or iraw == raw:
+            vlog(2, 'Ignoring existing issue i%s' % (iid))
+            return True
+
+    return False
+
+def cable_status(cid):
+    """ Get state, suspected, ticket and port labels of cable or None 
+    cached for the run inside of batch_issues()
+    """
+    if not ISSUE_BATCH is None and cid in ISSUE_BATCH['cables']:
+        return ISSUE_BATCH['cables'][cid]
+
+    status = None
+    SQL.execute(bcl_schema.CABLE_STATUS, (cid,))
 
     for row in SQL.fetchall():
+        status = dict(zip(row.keys(), row))
+
+    if not ISSUE_BATCH is None:
+        ISSUE_BATCH['cables'][cid] = status
+
+    return status
+
+def forget_cable_status(cid):
+    """ Drop cable from the cable_status() cache after changing it """
+    if not ISSUE_BATCH is None:
+        ISSUE_BATCH['cables'].pop(cid, None)
+
+def add_issue(issue_type, cid, issue, raw, source, timestamp):
+    """ Add issue to issues list """
+    global EV
+
+    #find if this issue is already ignored
+    if issue_ignored(issue_type, issue, raw, cid):
+        return
+
+    #insert or update mtime since we just got a new hit
+    if ISSUE_BATCH is None:
+        SQL.execute(bcl_schema.ISSUE_UPSERT, (
+            issue_type,
+            issue,
+            raw,
+            source,
+            timestamp,
+            cid
+        ))
+        vlog(3, 'added issue type=%s issue=%s cid=%s' % (issue_type, issue, cid))
+    else:
+        ISSUE_BATCH['rows'].append((issue_type, issue, raw, source, timestamp, cid))
+        vlog(4, 'queued issue type=%s issue=%s cid=%s' % (issue_type, issue, cid))
+
+    #find cable status
+    row = cable_status(cid)
+    if row:
         suspected = row['suspected'] + 1
         cname = None
         if row['cp2_flabel']:
@@ -346,6 +545,9 @@ def add_issue(issue_type, cid, issue, raw, source, timestamp):
             ));
 
             vlog(3, 'Changed cable %s to suspect state %s times' % (cid, suspected))
+            row['state'] = 'suspect'
+            row['suspected'] = suspected
+            row['ticket'] = tid
 
         #update EV if cable is not disabled. disabled cables will get issues that will confuse ops
         if row['state'] != 'disabled' and not DISABLE_TICKETS:
@@ -357,6 +559,81 @@ def add_issue(issue_type, cid, issue, raw, source, timestamp):
             ))
 
 
+@contextlib.contextmanager
+def batch_issues():
+    """ Queue every issue added inside of block and insert them together 
+    ignored issues and cable states are cached until the block exits
+    """
+    global ISSUE_BATCH
+
+    ISSUE_BATCH = { 'rows': [], 'ignored': {}, 'cables': {} }
+    try:
+        SQL.execute(bcl_schema.IGNORED_ISSUES)
+        for row in SQL.fetchall():
+            key = (row['type'], row['issue'], row['cid'])
+            if not None in key:
+                ISSUE_BATCH['ignored'].setdefault(key, []).append((row['raw'], row['iid']))
+
+        yield
+        flush_issues()
+    finally:
+        ISSUE_BATCH = None
+
+def flush_issues():
+    """ Insert or update every issue queued by add_issue() """
+    if not ISSUE_BATCH or not ISSUE_BATCH['rows']:
+        return
+
+    SQL.executemany(bcl_schema.ISSUE_UPSERT, ISSUE_BATCH['rows'])
+
+    vlog(3, 'added %s issues' % (len(ISSUE_BATCH['rows'])))
+    ISSUE_BATCH['rows'] = []
+
+CABLE_NEEDLE = re.compile(
+    r"""
+        ^\s*
+        (?P<needle>
+            (?:[sS]|)(?P<guid>(?:0x|)[a-fA-F0-9]*)(?:/[nN](?:0x|)[a-fA-F0-9]*|)/P(?P<guidport>[0-9]+)
+            |
+            t(?P<ticket>[0-9]+)
+            |
+            c(?P<cid>[0-9]+)
+            |
+            [pP](?P<cpid>[0-9]+)
+            |
+            (?P<label_name>(?:\w|-|\ |/)*)/P(?P<label_port>[0-9]+)
+            |
+            (?P<label>(?:\w|-|\ |/)*(?:\s+<-*>\s+(?:\w|\ |/)*|))
+        )
+        \s*$
+    """,
+    re.VERBOSE
+    ) 
+""" user inputed cable needle formats (see resolve_cable()) """
+
+def cable_needle_keys(match):
+    """ Get cable_aliases keys of parsed needle """
+    keys = []
+
+    #cable aliases
+    if match.group('cid'):
+        keys.append('c:%d' % (int(match.group('cid'))))
+    if match.group('ticket'):
+        keys.append('t:%d' % (int(match.group('ticket'))))
+    if match.group('label'):
+        keys.append('cl:%s' % (match.group('label')))
+
+    #port aliases
+    if match.group('cpid'):
+        keys.append('p:%d' % (int(match.group('cpid'))))
+    keys.append('pl:%s' % (match.group('label') if match.group('label') else match.group('needle')))
+    if match.group('guid'):
+        keys.append('g:%s/%d' % (convert_guid_intstr(match.group('guid')), int(match.group('guidport'))))
+    if match.group('label_name') is not None:
+        keys.append('n:%s/%d' % (match.group('label_name'), int(match.group('label_port'))))
+
+    return keys
+
 def resolve_cable(needle):
     """ Resolve user inputed string for cable (needle)
 
@@ -367,158 +644,128 @@ def resolve_cable(needle):
         Port Firmware Label
         Port Physical Label
         Port: p#
+
+    Cable matches are preferred over port matches then the oldest cable.
     """
     global SQL
     #Se41d2d03004bcdd0/Ne41d2d03004bcdd0/P25
-    cable_match = re.compile(
-        r"""
-            ^\s*
-            (?P<needle>
-                (?:[sS]|)(?P<guid>(?:0x|)[a-fA-F0-9]*)(?:/[nN](?:0x|)[a-fA-F0-9]*|)/P(?P<guidport>[0-9]+)
-                |
-                t(?P<ticket>[0-9]+)
-                |
-                c(?P<cid>[0-9]+)
-                |
-                [pP](?P<cpid>[0-9]+)
-                |
-                (?P<label_name>(?:\w|-|\ |/)*)/P(?P<label_port>[0-9]+)
-                |
-                (?P<label>(?:\w|-|\ |/)*(?:\s+<-*>\s+(?:\w|\ |/)*|))
-            )
-            \s*$
-        """,
-        re.VERBOSE
-        ) 
-
-    match = cable_match.match(needle)
+    match = CABLE_NEEDLE.match(needle)
     if not match:
         return None
 
-    if match.group('cid') or match.group('label') or match.group('label') or match.group('ticket'):
-        SQL.execute('''
-            SELECT 
-                cables.cid as cid,
-                port.cpid as cpid
-            from 
-                cables
-
-            LEFT OUTER JOIN
-                cable_ports as port
-            ON
-                cables.cid = port.cid 
-            WHERE
-                cables.cid = ? or
-                cables.plabel = ? or
-                cables.flabel = ? or
-                cables.ticket = ?
-
-            ORDER BY cables.ctime ASC
-            LIMIT 1
-        ''',(    
-            match.group('cid'),
-            match.group('label'),
-            match.group('label'),
-            match.group('ticket')
-        ))
-
-        for row in SQL.fetchall():
-            return {'cid':row['cid'], 'cpid':row['cpid']}
-
-    SQL.execute('''
-        SELECT 
-            cables.cid as cid,
-            port.cpid as cpid
-        from 
-            cables
-
-        INNER JOIN
-            cable_ports as port
-        ON
-            (
-                port.cpid   = ? or
-                port.flabel = ? or
-                port.plabel = ? or
-                ( port.guid = ? and port.port = ? ) or
-                ( port.name = ? and port.port = ? )
-            ) and
-            cables.cid = port.cid 
-
-        ORDER BY cables.ctime ASC
-        LIMIT 1
-    ''',(    
-        int(match.group('cpid')) if match.group('cpid') else 0,
-        match.group('label') if match.group('label') else match.group('needle'),
-        match.group('label') if match.group('label') else match.group('needle'),
-        convert_guid_intstr(match.group('guid')) if match.group('guid') else None, 
-            int(match.group('guidport')) if match.group('guid') else None,
-        match.group('label_name'), match.group('label_port'),
-    ))
+    keys = cable_needle_keys(match)
+    SQL.execute(bcl_schema.RESOLVE_CABLE % { 'keys': ','.join('?' * len(keys)) }, keys)
 
     for row in SQL.fetchall():
         return {'cid':row['cid'], 'cpid':row['cpid']}
 
     return None
 
-def resolve_cables(user_input):
-    """ Resolve user inputed set of strings into cable id list """
+STATE_NEEDLE = re.compile(
+    r"""
+        ^\s*@(?:bad:|)(?P<state>\w+)\s*$
+    """,
+    re.VERBOSE
+    ) 
+""" user inputed cable state needle: @state """
 
-    cids = []
+def resolve_cables(user_input):
+    """ Resolve user inputed set of strings into cable id list 
+    user_input: list (or stream) of needles, each may be comma delimited
+    every needle is resolved against cable_aliases in a single query
+    """
 
     if not user_input:
         return [ None ]
 
+    needles = []
+    states = {}
 
-    state_match = re.compile(
-        r"""
-            ^\s*@(?:bad:|)(?P<state>\w+)\s*$
-        """,
-        re.VERBOSE
-        ) 
+    SQL.execute(bcl_schema.NEEDLE_KEYS_TABLE)
+    SQL.execute('DELETE FROM needle_keys;')
 
-    for uneedle in user_input:
-        for needle in uneedle.split(','):
-            match = state_match.match(needle)
-            if match:
-                state = match.group('state').lower()
-                if state == 'online' or state == 'offline':
-                    SQL.execute('''
-                        SELECT 
-                            cid
-                        FROM 
-                            cables
-                        WHERE
-                            online = ?
-                    ''',(
-                        1 if (state == 'online') else 0,
-                    ))
-                else:
-                    SQL.execute('''
-                        SELECT 
-                            cid
-                        FROM 
-                            cables
-                        WHERE
-                            state = ?
-                    ''',(
-                        state,
-                    ))
-
-                for row in SQL.fetchall():
-                    if row['cid'] and not row['cid'] in cids:
-                        cids.append(row['cid'])
-            else:
-                cret = resolve_cable(needle)
-                vlog(4, 'resolving %s to %s' %(needle, cret))
+    def needle_keys():
+        for uneedle in user_input:
+            for needle in uneedle.split(','):
+                nid = len(needles)
+                needles.append(needle)
 
-                if cret:
-                    if not cret['cid'] in cids:
-                        cids.append(cret['cid'])
-                else:
-                    vlog(2, 'unable to resolve %s to a known cable or port' % (needle))
+                match = STATE_NEEDLE.match(needle)
+                if match:
+                    states[nid] = match.group('state').lower()
+                    continue
+
+                match = CABLE_NEEDLE.match(needle)
+                if match:
+                    for key in cable_needle_keys(match):
+                        yield (nid, key)
+
+    SQL.executemany('INSERT INTO needle_keys (nid, key) VALUES (?, ?);', needle_keys())
+
+    #same precedence as resolve_cable(): cable aliases then oldest cable
+    found = {}
+    SQL.execute(bcl_schema.RESOLVE_NEEDLE_KEYS)
+    for row in SQL:
+        if not row['nid'] in found:
+            found[row['nid']] = row['cid']
+
+    SQL.execute('DELETE FROM needle_keys;')
+
+    state_cids = {}
+    for state in set(states.values()):
+        if state == 'online' or state == 'offline':
+            SQL.execute(bcl_schema.CABLES_BY_ONLINE, (1 if (state == 'online') else 0,))
+        else:
+            SQL.execute(bcl_schema.CABLES_BY_STATE, (state,))
+
+        state_cids[state] = [row['cid'] for row in SQL.fetchall()]
+
+    cids = []
+    seen = set()
+    for nid, needle in enumerate(needles):
+        if nid in states:
+            resolved = state_cids[states[nid]]
+        elif nid in found:
+            vlog(4, 'resolving %s to c%s' %(needle, found[nid]))
+            resolved = [ found[nid] ]
+        else:
+            vlog(2, 'unable to resolve %s to a known cable or port' % (needle))
+            continue
+
+        for cid in resolved:
+            if cid and not cid in seen:
+                seen.add(cid)
+                cids.append(cid)
 
     return cids
 
+def read_needles(args):
+    """ Stream needles from command arguments 
+    --from-file {path}, --from-file={path} or - reads one needle per line from path (- for stdin)
+    blank lines and lines starting with # are skipped
+    """
+    args = iter(args)
+    for arg in args:
+        if arg == '--from-file':
+            path = next(args, '-')
+        elif arg.startswith('--from-file='):
+            path = arg.split('=', 1)[1]
+        elif arg == '-':
+            path = arg
+        else:
+            yield arg
+            continue
+
+        fds = sys.stdin if path == '-' else open(path, 'r')
+        try:
+            for line in fds:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if fds is not sys.stdin:
+                fds.close()
+
 def resolve_cable_ports(user_input):
     """ Resolve user inputed set of strings into cable port id list """
 
@@ -808,34 +1055,83 @@ def comment_cable(cid, comment):
             vlog(3, 'Updated Extraview Ticket %s for c%s with comment: %s' % (row['ticket'], cid, comment))
 
 
+def set_port_state(guid, port, enable):
+    """ Enable or disable port in fabric 
+    queued until the batch commits inside of batch_cable_changes()
+    """
+    if PORT_BATCH is not None:
+        #only the last requested state of a port matters
+        PORT_BATCH.pop((guid, port), None)
+        PORT_BATCH[(guid, port)] = enable
+    elif enable:
+        ib_mgt.enable_port(guid, port)
+    else:
+        ib_mgt.disable_port(guid, port)
+
+@contextlib.contextmanager
+def queue_tickets():
+    """ Queue direct extraview calls made inside of block in the outbox 
+    they are drained once the block completes so extraview is never called
+    while the database write lock is held or for changes that roll back.
+    operations committed before a failure are sent by the next drain.
+    """
+    global EV
+
+    ev = EV
+    if ev is None or isinstance(ev, ev_outbox.Outbox):
+        yield
+        return
+
+    EV = ev_outbox.Outbox(SQL)
+    try:
+        yield
+    finally:
+        EV = ev
+
+    ev_outbox.drain(SQL, ev)
+    with sqlite.transaction(SQL):
+        ev_outbox.backfill(SQL, backfill_ticket)
+
+@contextlib.contextmanager
+def batch_cable_changes():
+    """ Apply cable state changes inside of block in one transaction 
+    fabric port state changes are queued and only made once the transaction
+    commits. direct extraview calls are deferred by queue_tickets().
+    nothing is changed if the block fails.
+    """
+    global PORT_BATCH
+
+    with queue_tickets():
+        PORT_BATCH = {}
+        try:
+            with sqlite.transaction(SQL):
+                yield
+
+            ports = PORT_BATCH
+        finally:
+            PORT_BATCH = None
+
+        vlog(3, 'changing state of %s fabric ports' % (len(ports)))
+        for (guid, port), enable in ports.items():
+            set_port_state(guid, port, enable)
+
 def enable_cable_ports(cid):
     """ Enables cable ports in fabric """
 
-    SQL.execute('''
-        SELECT 
-            cpid,
-            guid,
-            port,
-            hca
-        FROM 
-            cable_ports 
-        WHERE
-            cid = ?
-    ''',(
-        cid,
-    ))
+    SQL.execute(bcl_schema.CABLE_PORTS_BY_CID, (cid,))
 
     for row in SQL.fetchall(): 
         if row['hca']:
             vlog(3, 'skip enabling hca for p%s' % ( row['cpid'] ))
         elif not DISABLE_PORT_STATE_CHANGE:
-            ib_mgt.enable_port(int(row['guid']), int(row['port'])) 
+            set_port_state(int(row['guid']), int(row['port']), True)
 
 def remove_cable(cid, comment, release = True):
     """ marks cable as removed """
     
     if release:
         release_cable(cid, comment)
+    forget_cable_status(cid)
     
     SQL.execute('''
         UPDATE
@@ -856,28 +1152,16 @@ def remove_cable(cid, comment, release = True):
 def disable_cable_ports(cid):
     """ Disables cable ports in fabric """
 
-    SQL.execute('''
-        SELECT 
-            cpid,
-            guid,
-            port,
-            hca
-        FROM 
-            cable_ports 
-        WHERE
-            cid = ?
-    ''',(
-        cid,
-    ))
-
-    for row in SQL.fetchall(): 
-        if row['hca']:
-            vlog(1, 'ignoring request to disable HCA p%s.' % (row['cpid']))
-            continue
-
-        if not DISABLE_PORT_STATE_CHANGE: 
-            ib_mgt.disable_port(int(row['guid']), int(row['port']))
-
+    SQL.execute(bcl_schema.CABLE_PORTS_BY_CID, (cid,))
+
+    for row in SQL.fetchall(): 
+        if row['hca']:
+            vlog(1, 'ignoring request to disable HCA p%s.' % (row['cpid']))
+            continue
+
+        if not DISABLE_PORT_STATE_CHANGE: 
+            set_port_state(int(row['guid']), int(row['port']), False)
+
     SQL.execute('''
         UPDATE
             cables 
@@ -907,7 +1191,7 @@ def enable_cable_ports(cid):
 
     for row in SQL.fetchall(): 
         if not DISABLE_PORT_STATE_CHANGE: 
-            ib_mgt.enable_port(int(row['guid']), int(row['port']))
+            set_port_state(int(row['guid']), int(row['port']), True)
 
 def query_cable_ports(cid):
     """ Queries cable ports in fabric """
@@ -1028,17 +1312,7 @@ def dump_debug(cid, output_path):
                                 'Switch Name: %s' % row['flabel']
                             )
 
-        SQL.execute('''
-                SELECT 
-                    source
-                FROM 
-                    issues 
-                WHERE
-                    ignore = 0 and 
-                    cid = ? and
-                    mtime >= ?
-                ORDER BY mtime ASC
-            ''', (
+        SQL.execute(bcl_schema.CABLE_ISSUE_SOURCES, (
                 int(row['cid']),
                 int(row['mtime']) if row['mtime'] else None,
             ))
@@ -1362,256 +1636,224 @@ def release_cable(cid, comment, full = False):
         EV.close(ticket, 'Released Bad Cable\nBad Cable Comment:\n%s' % comment)
         vlog(3, 'Closed Extraview Ticket %s for c%s' % (ticket, cid))
 
-def list_state(what, list_filter):
-    """ dump state to user """
+def list_cables_join(list_filter, table):
+    """ Restrict list query to the cables resolved from list_filter 
+    resolved cids are loaded into temp table list_cables in order
+    returns (join clause against table.cid, order by prefix) or empty strings to list everything
+    """
+    if not list_filter:
+        return ('', '')
 
-    if what == 'action' or what == 'actions' or what == 'actionable':
-        f='{0:<10}{1:<10}{2:<15}{3:<12}{4:<15}{5:<15}{6:<70}'
-        print((f.format(
-                "cable_id",
-                "state",
-                "Ticket",
-                "length",
-                "Serial_Number",
-                "Product_Number",
-                "Firmware Label (node_desc)"
-            )))             
-
-        for cid in resolve_cables(list_filter):
-            SQL.execute('''
-                SELECT 
-                    cid,
-                    length,
-                    SN,
-                    PN,
-                    state,
-                    comment,
-                    suspected,
-                    ticket,
-                    flabel,
-                    mtime
-                FROM 
-                    cables
-                WHERE
-                    ( 
-                        ? IS NULL and
-                        state != 'watch' and
-                        state != 'removed'
-                    ) or cid = ? 
-                ORDER BY 
-                    ctime 
-            ''', (
-                cid,
-                cid
-            ))
+    SQL.execute(bcl_schema.LIST_FILTER_TABLE)
+    SQL.execute('DELETE FROM list_cables;')
+    SQL.executemany('INSERT OR IGNORE INTO list_cables (cid) VALUES (?);', ((cid,) for cid in resolve_cables(list_filter)))
 
-            for row in SQL.fetchall():
-                print((f.format(
-                        'c%s' % (row['cid']),
-                        row['state'],
-                        't%s' % (row['ticket']) if row['ticket'] else None,
-                        row['length'] if row['length'] else None,
-                        row['SN'] if row['SN'] else None,
-                        row['PN'] if row['PN'] else None,
-                        row['flabel']
-                    ))) 
-                print(('\tSuspected %s times. Last went suspect on %s' % (
-                        row['suspected'], 
-                        datetime.datetime.fromtimestamp(row['mtime']).strftime('%Y-%m-%d %H:%M:%S') if row['mtime'] > 0 else None
-                    )))
-                print(('\tComment: %s' % (row['comment'])))
-
-                SQL.execute('''
-                    SELECT 
-                        iid,
-                        type,
-                        issue,
-                        raw,
-                        source,
-                        mtime,
-                        ignore,
-                        cid 
-                    FROM 
-                        issues 
-                    WHERE
-                        ignore = 0 and 
-                        cid = ? and
-                        mtime >= ?
-                    ORDER BY mtime ASC
-                ''', (
-                    int(row['cid']),
-                    int(row['mtime']) if row['mtime'] else None,
-                ))
+    return (
+        bcl_schema.LIST_FILTER_JOIN % { 'table': table },
+        bcl_schema.LIST_FILTER_ORDER
+    )
+
+def print_json(record):
+    """ print record as a single JSON line """
+    print(json.dumps(record, sort_keys=True, default=str))
+
+def list_state(what, list_filter, as_json = False):
+    """ dump state to user 
+    as_json: print one JSON object per line instead of a table
+    """
 
-                for irow in SQL.fetchall():
-                    print(('\tIssue %s %s: %s' % (
-                            'i%s' % irow['iid'],
-                            irow['source'],
-                            irow['issue']
+    if what == 'action' or what == 'actions' or what == 'actionable':
+        f='{0:<10}{1:<10}{2:<15}{3:<12}{4:<15}{5:<15}{6:<70}'
+        if not as_json:
+            print((f.format(
+                    "cable_id",
+                    "state",
+                    "Ticket",
+                    "length",
+                    "Serial_Number",
+                    "Product_Number",
+                    "Firmware Label (node_desc)"
+                )))             
+
+        join, order = list_cables_join(list_filter, 'cables')
+        SQL.execute(bcl_schema.LIST_ACTIONS % {
+            'join': join,
+            'where': '' if join else bcl_schema.ACTIONABLE,
+            'order': order
+        })
+
+        cable = None
+        for row in SQL:
+            if not cable or cable['cid'] != row['cid']:
+                if cable and as_json:
+                    print_json(cable)
+                elif cable:
+                    print(' ')
+
+                cable = {
+                    'cid': row['cid'],
+                    'state': row['state'],
+                    'ticket': row['ticket'],
+                    'length': row['length'],
+                    'SN': row['SN'],
+                    'PN': row['PN'],
+                    'flabel': row['flabel'],
+                    'suspected': row['suspected'],
+                    'mtime': row['mtime'],
+                    'comment': row['comment'],
+                    'issues': []
+                }
+
+                if not as_json:
+                    print((f.format(
+                            'c%s' % (row['cid']),
+                            row['state'],
+                            't%s' % (row['ticket']) if row['ticket'] else None,
+                            row['length'] if row['length'] else None,
+                            row['SN'] if row['SN'] else None,
+                            row['PN'] if row['PN'] else None,
+                            row['flabel']
                         ))) 
+                    print(('\tSuspected %s times. Last went suspect on %s' % (
+                            row['suspected'], 
+                            datetime.datetime.fromtimestamp(row['mtime']).strftime('%Y-%m-%d %H:%M:%S') if row['mtime'] > 0 else None
+                        )))
+                    print(('\tComment: %s' % (row['comment'])))
+
+            if row['iid'] is None:
+                continue
+
+            if as_json:
+                cable['issues'].append({
+                    'iid': row['iid'],
+                    'type': row['type'],
+                    'issue': row['issue'],
+                    'source': row['source'],
+                    'mtime': row['issue_mtime']
+                })
+            else:
+                print(('\tIssue %s %s: %s' % (
+                        'i%s' % row['iid'],
+                        row['source'],
+                        row['issue']
+                    ))) 
 
-                print(' ')
+        if cable and as_json:
+            print_json(cable)
+        elif cable:
+            print(' ')
 
     elif what == 'cables' or what == 'cable':
         f='{0:<10}{1:10}{2:<12}{3:<15}{4:<15}{5:<15}{6:<15}{7:<15}{8:<15}{9:<50}{10:<50}{11:<50}'
-        print((f.format(
-                "cable_id",
-                "state",
-                "Suspected#",
-                "Ticket",
-                "ctime",
-                "mtime",
-                "length",
-                "Serial_Number",
-                "Product_Number",
-                "Comment",
-                "Firmware Label (node_desc)",
-                "Physical Label"
-            )))            
-        for cid in resolve_cables(list_filter):
-            SQL.execute('''
-                SELECT 
-                    cables.cid as cid,
-                    cables.ctime as ctime,
-                    cables.mtime as mtime,
-                    cables.length as length,
-                    cables.SN as SN,
-                    cables.PN as PN,
-                    cables.state as state,
-                    cables.comment as comment,
-                    cables.suspected as suspected,
-                    cables.ticket as ticket,
-                    cables.flabel as flabel,
-                    cables.plabel as plabel,
-                    cp1.flabel as cp1_flabel,
-                    cp1.plabel as cp1_plabel,
-                    cp2.flabel as cp2_flabel,
-                    cp2.plabel as cp2_plabel
-                from 
-                    cables
-
-                INNER JOIN
-                    cable_ports as cp1
-                ON
-                    cables.cid = cp1.cid and
-                    ( ? IS NULL or cables.cid = ? )
-
-                LEFT OUTER JOIN
-                    cable_ports as cp2
-                ON
-                    cables.cid = cp2.cid and
-                    cp2.cpid != cp1.cpid
-
-                GROUP BY cables.cid
-            ''', (
-                cid, cid
-            ))
-
-            for row in SQL.fetchall():
-                print((f.format(
-                        'c%s' % (row['cid']),
-                        row['state'],
-                        row['suspected'],
-                        't%s' % (row['ticket']) if row['ticket'] else None,
-                        row['ctime'],
-                        row['mtime'],
-                        row['length'] if row['length'] else None,
-                        row['SN'] if row['SN'] else None,
-                        row['PN'] if row['PN'] else None,
-                        row['comment'],
-                        row['flabel'],
-                        row['plabel']
-                    )))
+        if not as_json:
+            print((f.format(
+                    "cable_id",
+                    "state",
+                    "Suspected#",
+                    "Ticket",
+                    "ctime",
+                    "mtime",
+                    "length",
+                    "Serial_Number",
+                    "Product_Number",
+                    "Comment",
+                    "Firmware Label (node_desc)",
+                    "Physical Label"
+                )))            
+
+        join, order = list_cables_join(list_filter, 'cables')
+        SQL.execute(bcl_schema.LIST_CABLES % { 'join': join, 'order': order })
+
+        for row in SQL:
+            if as_json:
+                print_json({ key: row[key] for key in row.keys() })
+                continue
+
+            print((f.format(
+                    'c%s' % (row['cid']),
+                    row['state'],
+                    row['suspected'],
+                    't%s' % (row['ticket']) if row['ticket'] else None,
+                    row['ctime'],
+                    row['mtime'],
+                    row['length'] if row['length'] else None,
+                    row['SN'] if row['SN'] else None,
+                    row['PN'] if row['PN'] else None,
+                    row['comment'],
+                    row['flabel'],
+                    row['plabel']
+                )))
 
     elif what == 'ports' or what == 'port':
         f='{0:<10}{1:<10}{2:<25}{3:<7}{4:<7}{5:<50}{6:<50}{7:<50}'
-        print((f.format(
-                "cable_id",
-                "port_id",
-                "guid",
-                "port",
-                "HCA",
-                "name (node_desc)",
-                "Firmware Label",
-                "Physical Label"
-            ))) 
-
-        for cid in resolve_cables(list_filter):
-            SQL.execute('''
-                SELECT 
-                    cid,
-                    cpid,
-                    plabel,
-                    flabel,
-                    guid,
-                    port,
-                    hca,
-                    name
-                FROM 
-                    cable_ports 
-                WHERE
-                    ? IS NULL or
-                    cid = ?
-                ORDER BY cpid ASC
-            ''', (
-                cid, cid
-            ))
-
-            for row in SQL.fetchall():
-                print((f.format(
-                        'c%s' % row['cid'],
-                        'p%s' % row['cpid'],
-                        hex(int(row['guid'])),
-                        row['port'],
-                        'True' if row['hca'] else 'False',
-                        row['name'],
-                        row['flabel'],
-                        row['plabel']
-                    )))
+        if not as_json:
+            print((f.format(
+                    "cable_id",
+                    "port_id",
+                    "guid",
+                    "port",
+                    "HCA",
+                    "name (node_desc)",
+                    "Firmware Label",
+                    "Physical Label"
+                ))) 
+
+        join, order = list_cables_join(list_filter, 'cable_ports')
+        SQL.execute(bcl_schema.LIST_PORTS % { 'join': join, 'order': order })
+
+        for row in SQL:
+            if as_json:
+                record = { key: row[key] for key in row.keys() }
+                record['guid'] = hex(int(row['guid']))
+                record['hca'] = bool(row['hca'])
+                print_json(record)
+                continue
+
+            print((f.format(
+                    'c%s' % row['cid'],
+                    'p%s' % row['cpid'],
+                    hex(int(row['guid'])),
+                    row['port'],
+                    'True' if row['hca'] else 'False',
+                    row['name'],
+                    row['flabel'],
+                    row['plabel']
+                )))
 
     elif what == 'issues':
         f='{0:<10}{1:<15}{2:<10}{3:<10}{4:<15}{5:<20}:{6:<100}{7:<50}'
-        print((f.format(
-                "issue_id",
-                "Type",
-                "cable_id",
-                "Ignored",
-                "mtime",
-                "source",
-                "issue",
-                "raw error"
-            ))) 
-
-        for cid in resolve_cables(list_filter):
-            SQL.execute('''
-                SELECT 
-                    iid,
-                    type,
-                    issue,
-                    raw,
-                    source,
-                    mtime,
-                    ignore,
-                    cid 
-                FROM 
-                    issues 
-                WHERE
-                    ? IS NULL OR
-                    cid = ?
-                ORDER BY iid ASC
-            ''', (cid, cid))
-
-            for row in SQL.fetchall():
-                print((f.format(
-                        'i%s' % row['iid'],
-                        row['type'],
-                        'c%s' % row['cid'] if row['cid'] else None,
-                        'False' if row['ignore'] == 0 else 'True',
-                        row['mtime'],
-                        row['source'],
-                        row['issue'],
-                        row['raw'].replace("\n", "\\n") if row['ignore'] == 0 and row['raw'] else None
-                    )))
+        if not as_json:
+            print((f.format(
+                    "issue_id",
+                    "Type",
+                    "cable_id",
+                    "Ignored",
+                    "mtime",
+                    "source",
+                    "issue",
+                    "raw error"
+                ))) 
+
+        join, order = list_cables_join(list_filter, 'issues')
+        SQL.execute(bcl_schema.LIST_ISSUES % { 'join': join, 'order': order })
+
+        for row in SQL:
+            if as_json:
+                record = { key: row[key] for key in row.keys() }
+                record['ignore'] = bool(row['ignore'])
+                print_json(record)
+                continue
+
+            print((f.format(
+                    'i%s' % row['iid'],
+                    row['type'],
+                    'c%s' % row['cid'] if row['cid'] else None,
+                    'False' if row['ignore'] == 0 else 'True',
+                    row['mtime'],
+                    row['source'],
+                    row['issue'],
+                    row['raw'].replace("\n", "\\n") if row['ignore'] == 0 and row['raw'] else None
+                )))
 
     else:
         vlog(1, 'unknown list %s request' % (list_filter))
@@ -1716,6 +1958,7 @@ def mark_replaced_cable(old_cid, new_cid, comment):
         if not new['ticket']:
             vlog(3, 'assigned Ticket %s to c%s for replaced cable %s' % (old['ticket'], new_cid, old_cid))
             #assign old ticket to new cable if it doesn't have one already
+            forget_cable_status(new_cid)
             SQL.execute('''
                 UPDATE
                     cables 
@@ -1737,9 +1980,168 @@ def convert_guid_intstr(guid):
         since sqlite cant handle 64bit ints """
     return str(int(guid, 16))
 
-def run_parse(dump_dir):
-    """ Run parse mode against a dump directory """
-    global EV, SQL
+def load_cable_index():
+    """ Load every non removed cable and its ports into memory 
+    returns (cables, cable_ports)
+        cables: dict of cid -> { cid, SN, PN, state, ctime }
+        cable_ports: dict of (guid, port) -> dict of cid -> hca
+    """
+    cables = {}
+    cable_ports = {}
+
+    SQL.execute('''
+        SELECT 
+            cables.cid as cid,
+            cables.SN as SN,
+            cables.PN as PN,
+            cables.state as state,
+            cables.ctime as ctime,
+            cable_ports.guid as guid,
+            cable_ports.port as port,
+            cable_ports.hca as hca
+        FROM 
+            cables
+        INNER JOIN
+            cable_ports
+        ON
+            cables.cid = cable_ports.cid
+        WHERE
+            cables.state != 'removed'
+    ''')
+
+    for row in SQL.fetchall():
+        cid = row['cid']
+        if not cid in cables:
+            cables[cid] = {
+                'cid': cid,
+                'SN': row['SN'],
+                'PN': row['PN'],
+                'state': row['state'],
+                'ctime': row['ctime']
+            }
+
+        if not row['guid'] is None and not row['port'] is None:
+            index_cable_port(cable_ports, cid, row['guid'], row['port'], row['hca'])
+
+    vlog(4, 'loaded %s cables with %s ports' % (len(cables), len(cable_ports)))
+    return (cables, cable_ports)
+
+def index_cable_port(cable_ports, cid, guid, port, hca):
+    """ add cable port to the (guid, port) index from load_cable_index() """
+    key = (str(guid), int(port))
+    if not key in cable_ports:
+        cable_ports[key] = {}
+    #first port row wins like GROUP BY would
+    cable_ports[key].setdefault(cid, hca)
+
+def reconcile_online_cables(seen, timestamp):
+    """ Mark seen cables online and every other cable offline 
+    seen: cids found in the fabric
+    returns (missing, disabled, removed) sets of cids
+        missing: cables that were not seen and are not disabled
+    """
+    SQL.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS seen_cables (
+            cid INTEGER PRIMARY KEY
+        );
+    ''')
+    SQL.execute('DELETE FROM seen_cables;')
+    SQL.executemany('INSERT OR IGNORE INTO seen_cables (cid) VALUES (?);', ((cid,) for cid in seen))
+
+    SQL.execute('''
+        UPDATE
+            cables 
+        SET
+            online = 1,
+            onlineTime = ?
+        WHERE
+            cid IN (SELECT cid FROM seen_cables)
+        ;''', (
+            int(timestamp),
+    ))
+
+    SQL.execute('''
+        UPDATE
+            cables 
+        SET
+            online = 0
+        WHERE
+            cid NOT IN (SELECT cid FROM seen_cables)
+        ;''')
+
+    missing = set()
+    disabled = set()
+    removed = set()
+    SQL.execute('''
+        SELECT 
+            cables.cid as cid,
+            cables.state as state,
+            seen_cables.cid IS NOT NULL as seen
+        FROM 
+            cables
+        LEFT OUTER JOIN
+            seen_cables
+        ON
+            cables.cid = seen_cables.cid
+        WHERE
+            cables.state IN ('disabled', 'removed') or
+            seen_cables.cid IS NULL
+        ORDER BY cables.cid
+    ''')
+    for row in SQL.fetchall():
+        cid = int(row['cid'])
+        if row['state'] == 'disabled':
+            disabled.add(cid)
+        elif row['state'] == 'removed':
+            removed.add(cid)
+
+        #only note cables if they should not be missing
+        if not row['seen'] and row['state'] != 'disabled':
+            missing.add(cid)
+
+    SQL.execute('DELETE FROM seen_cables;')
+    vlog(4, 'online reconciliation: %s missing %s disabled %s removed' % (len(missing), len(disabled), len(removed)))
+    return (missing, disabled, removed)
+
+def find_switch_links(cids):
+    """ Find which cables have (atleast) two ports that are not on an HCA 
+    cids: cables to check
+    returns set of cids
+    """
+    SQL.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS check_cables (
+            cid INTEGER PRIMARY KEY
+        );
+    ''')
+    SQL.execute('DELETE FROM check_cables;')
+    SQL.executemany('INSERT OR IGNORE INTO check_cables (cid) VALUES (?);', ((cid,) for cid in cids))
+
+    links = set()
+    SQL.execute('''
+        SELECT 
+            cable_ports.cid as cid
+        FROM 
+            cable_ports
+        INNER JOIN
+            check_cables
+        ON
+            cable_ports.cid = check_cables.cid
+        WHERE
+            cable_ports.hca = 0
+        GROUP BY cable_ports.cid
+        HAVING count(cable_ports.cpid) >= 2
+    ''')
+    for row in SQL.fetchall():
+        links.add(int(row['cid']))
+
+    SQL.execute('DELETE FROM check_cables;')
+    return links
+
+def run_parse(dump_dir, jobs = None):
+    """ Run parse mode against a dump directory 
+    jobs: number of processes to parse the dump files with (default from config)
+    """
+    global EV, SQL, CONFIG
 
     def gv(port, key):
         """ get value or none """
@@ -1749,7 +2151,7 @@ def run_parse(dump_dir):
             return None if not key in port else str(port[key])
     
     def find_cables(port1, port2):
-        """ Find any cable in db that match guid/port pairs 
+        """ Find any cable in the cable index that match guid/port pairs 
         Warning: this may find crossed cables into existing ports
         Warning: will not find any removed cables
         port1: ib_diagnostics formatted port
@@ -1770,109 +2172,60 @@ def run_parse(dump_dir):
             vlog(1, 'Error: attempt to find cable no ports? %s %s' % (port1, port2))
             return None
 
-        #Attempt to find the any matching cable by the ports
-        SQL.execute('''
-            SELECT 
-                cables.cid as cid,
-                max(cp1.hca, cp2.hca) as has_hca,
-                cables.SN as SN,
-                cables.PN as PN,
-                cables.state as state
-
-            FROM 
-                cables
-        
-            INNER JOIN
-                cable_ports as cp1
-            ON
-                cables.cid = cp1.cid and
-                cp1.guid = ? and
-                cp1.port = ?
-
-            LEFT OUTER JOIN
-                cable_ports as cp2
-            ON
-                ? IS NOT NULL and
-                cables.cid = cp2.cid and
-                cp2.guid = ? and
-                cp2.port = ?    
-
-            WHERE
-                cables.state != 'removed'
-
-            GROUP BY cables.cid
-            ORDER BY cables.ctime DESC
-        ''',(
-            convert_guid_intstr(port1['guid']),
-            int(port1['port']),
-            '1' if port2 else None,
-            convert_guid_intstr(port2['guid']) if port2 else None, 
-            int(port2['port']) if port2 else None,
-        ))
+        cp2 = {}
+        if port2:
+            cp2 = cable_ports.get((convert_guid_intstr(port2['guid']), int(port2['port'])), {})
 
         cables = []
-        for row in SQL.fetchall():
-            cid = int(row['cid'])
+        for cid, hca1 in cable_ports.get((convert_guid_intstr(port1['guid']), int(port1['port'])), {}).items():
+            cable = cable_index[cid]
+            if cable['state'] == 'removed':
+                continue
+
             if not cid is None and cid > 0:
+                hca2 = cp2.get(cid)
                 cables.append({ 
-                        'cid': row['cid'],
-                        'has_hca': True if row['has_hca'] == 1 else False,
-                        'SN': row['SN'],
-                        'PN': row['PN']
+                        'cid': cid,
+                        #hca only counts when both ports matched (sqlite max() of NULL is NULL)
+                        'has_hca': not hca1 is None and not hca2 is None and max(hca1, hca2) == 1,
+                        'SN': cable['SN'],
+                        'PN': cable['PN']
                 })
             else:
-                vlog(4, 'Unexpected invalid cable c%s: %s' % (cid, row))
+                vlog(4, 'Unexpected invalid cable c%s: %s' % (cid, cable))
 
+        #newest cables first
+        cables.sort(key = lambda cable: cable['cid'], reverse = True)
         return cables
 
     def insert_cable(port1, port2, timestamp):
-        """ insert new cable into db """
+        """ queue new cable for insert into db """
 
         plabel = None
         port_plabel = { 'port1': None, 'port2': None }
 
-        SQL.execute('''
-            INSERT INTO 
-            cables 
-            (
-                ctime,
-                length,
-                SN,
-                PN,
-                state,
-                suspected,
-                flabel,
-                plabel
-            ) VALUES (
-                ?, ?, ?, ?, ?, ?, ?, ?
-            );''', (
-                timestamp,
-                gv(port1,'LengthDesc'),
-                gv(port1,'SN'),
-                gv(port1,'PN'), 
-                'watch', #watching all cables by default
-                0, #new cables havent been suspected yet
-                '%s <--> %s' % (ib_diagnostics.port_pretty(port1), ib_diagnostics.port_pretty(port2)),
-                plabel
-        ));
-        cid = SQL.lastrowid
+        #cids are handed out here so the inserts can be batched
+        if batch['next_cid'] is None:
+            batch['next_cid'] = sqlite.next_autoincrement(SQL, 'cables', 'cid')
+        cid = batch['next_cid']
+        batch['next_cid'] += 1
+
+        batch['cables'].append((
+            cid,
+            timestamp,
+            gv(port1,'LengthDesc'),
+            gv(port1,'SN'),
+            gv(port1,'PN'), 
+            'watch', #watching all cables by default
+            0, #new cables havent been suspected yet
+            '%s <--> %s' % (ib_diagnostics.port_pretty(port1), ib_diagnostics.port_pretty(port2)),
+            plabel
+        ))
 
-        #insert the ports
+        #queue the ports
         for key,port in list({'port1': port1, 'port2': port2}.items()):
             if port:
-                SQL.execute('''
-                    INSERT INTO cable_ports (
-                        cid,
-                        guid,
-                        name,
-                        port,
-                        hca,
-                        plabel,
-                        flabel
-                    ) VALUES (
-                        ?, ?, ?, ?, ?, ?, ?
-                    );
-                ''', (
+                batch['ports'].append((
                     cid,
                     convert_guid_intstr(port['guid']),
                     port['name'],
@@ -1881,15 +2234,73 @@ def run_parse(dump_dir):
                     port_plabel[key],
                     ib_diagnostics.port_pretty(port), 
                 ))
-                cpid = SQL.lastrowid
+                index_cable_port(cable_ports, cid, convert_guid_intstr(port['guid']), port['port'], int(port['type'] == "CA"))
+
+        cable_index[cid] = {
+            'cid': cid,
+            'SN': gv(port1,'SN'),
+            'PN': gv(port1,'PN'),
+            'state': 'watch',
+            'ctime': timestamp
+        }
 
         vlog(5, 'create cable(%s) %s <--> %s' % (cid, ib_diagnostics.port_pretty(port1),ib_diagnostics.port_pretty(port2)))
         return cid
 
+    def flush():
+        """ write out every queued cable, port and issue """
+        if batch['cables']:
+            SQL.executemany('''
+                INSERT INTO 
+                cables 
+                (
+                    cid,
+                    ctime,
+                    length,
+                    SN,
+                    PN,
+                    state,
+                    suspected,
+                    flabel,
+                    plabel
+                ) VALUES (
+                    ?, ?, ?, ?, ?, ?, ?, ?, ?
+                );''', batch['cables'])
+
+        if batch['ports']:
+            SQL.executemany('''
+                INSERT INTO cable_ports (
+                    cid,
+                    guid,
+                    name,
+                    port,
+                    hca,
+                    plabel,
+                    flabel
+                ) VALUES (
+                    ?, ?, ?, ?, ?, ?, ?
+                );
+            ''', batch['ports'])
+
+        batch['cables'] = []
+        batch['ports'] = []
+        flush_issues()
+
+    def chunk():
+        """ count a write and commit once the transaction holds chunk_size writes """
+        batch['writes'] += 1
+        if chunk_size and batch['writes'] >= chunk_size:
+            flush()
+            sqlite.checkpoint(SQL)
+            vlog(4, 'committed %s writes' % (batch['writes']))
+            batch['writes'] = 0
+            #another writer may have added cables between transactions
+            batch['next_cid'] = None
+
 
  
     #ports from ib_diagnostics should not leave this function
-    ports = []
+    ports = ib_diagnostics.PortRegistry()
     #dict to hold the issues found
     issues = []
     #timestamp to apply to the cables and issues 
@@ -1904,197 +2315,146 @@ def run_parse(dump_dir):
 
     vlog(5, 'parse dir timestamp: %s = %s' % (timestamp, datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')))
 
-    with open('%s/%s' % (dump_dir,'ibnetdiscover.log') , 'r') as fds:
-        ib_diagnostics.parse_ibnetdiscover_cables(ports, fds.read()) 
-
-    with open('%s/ibdiagnet2.db_csv' % (dump_dir), 'r') as fds:
-        ib_diagnostics.parse_ibdiagnet_csv(ports, issues, fds)
-
-    with open('%s/%s' % (dump_dir,'ibdiagnet2.log') , 'r') as fds:
-        ib_diagnostics.parse_ibdiagnet(ports, issues, fds.read()) 
-
-    if os.path.isfile('%s/%s' % (dump_dir,'ibdiagnet2.cables')):
-        with open('%s/%s' % (dump_dir,'ibdiagnet2.cables'), 'r') as fds:
-            ib_diagnostics.parse_ibdiagnet_cables(ports, issues, fds.read()) 
-
-    p_ibcv2 = '%s/%s' % (dump_dir,'sgi-ibcv2.log') #optional
-    if os.path.isfile(p_ibcv2):
-        with open(p_ibcv2, 'r') as fds:
-            ib_diagnostics.parse_sgi_ibcv2(ports, issues, fds.read()) 
-            pass
+    if jobs is None:
+        jobs = config.get(CONFIG, ['cables', 'parse jobs'], 1)
+    #writes per transaction (0 for a single transaction)
+    chunk_size = config.get(CONFIG, ['cables', 'parse transaction size'], 0)
+    batch = { 'cables': [], 'ports': [], 'next_cid': None, 'writes': 0 }
+    thresholds = ib_diagnostics.compile_counter_thresholds(
+        config.get(CONFIG, ['cables', 'counter thresholds'])
+    )
+
+    use_cache = config.get(CONFIG, ['cables', 'parse cache'], True)
+    cached = dump_cache.load(dump_dir, thresholds) if use_cache else None
+    if cached:
+        ports, issues = cached
+    else:
+        ib_diagnostics.parse_dump(ports, issues, dump_dir, jobs, thresholds)
+        if use_cache:
+            dump_cache.save(dump_dir, ports, issues, thresholds)
 
     ibsp = cluster_info.get_ib_speed()
     ib_diagnostics.find_underperforming_cables ( ports, issues, ibsp['speed'], ibsp['width'])
 
-    #add every known cable to database
-    #slow but keeps sane list of all cables forever for issue tracking
-    known_cables=[] #track every that is found
-    hca_cables=[] #track every that has an hca
-    all_replaced_cables=set() #every cable replaced so far
-    for port in ports:
-        if 'cable_id' in port and port['cable_id']:
-            #ignore duplicate found cables
-            continue 
-
-        port1 = port
-        port2 = port['connection']
-
-        cid = None
-        hca_found = None
-        replaced_cables=set()
-        cables = find_cables(port1, port2)
-        #If the current existing cable has a SN/PN, then favor the cable that matches
-        if gv(port1, 'SN') and gv(port1, 'PN'):
-            #find the newest matching cable
-            for cable in cables:
-                if not cable['cid'] in all_replaced_cables:
-                    if cable['SN'] == gv(port1, 'SN') and   \
-                        cable['PN'] == gv(port1, 'PN') and  \
-                        (cid is None or cable['cid'] > cid) :
+    cache = ib_diagnostics.parse_port_cache_info()
+    vlog(4, 'parse_port cache: %s hits %s misses %s cached labels' % (cache.hits, cache.misses, cache.currsize))
+
+    #single transaction (or chunks of chunk_size writes) for every write
+    #a crash rolls back to the last commit instead of a half written parse
+    #tickets are sent after the commit by queue_tickets()
+    with queue_tickets(), sqlite.transaction(SQL), batch_issues():
+        #match cables in memory instead of querying per port
+        cable_index, cable_ports = load_cable_index()
+
+        #add every known cable to database
+        #slow but keeps sane list of all cables forever for issue tracking
+        known_cables=[] #track every that is found
+        hca_cables=[] #track every that has an hca
+        all_replaced_cables=set() #every cable replaced so far
+        for port in ports:
+            if 'cable_id' in port and port['cable_id']:
+                #ignore duplicate found cables
+                continue 
+
+            port1 = port
+            port2 = port['connection']
+
+            cid = None
+            hca_found = None
+            replaced_cables=set()
+            cables = find_cables(port1, port2)
+            #If the current existing cable has a SN/PN, then favor the cable that matches
+            if gv(port1, 'SN') and gv(port1, 'PN'):
+                #find the newest matching cable
+                for cable in cables:
+                    if not cable['cid'] in all_replaced_cables:
+                        if cable['SN'] == gv(port1, 'SN') and   \
+                            cable['PN'] == gv(port1, 'PN') and  \
+                            (cid is None or cable['cid'] > cid) :
+                                cid = cable['cid']
+                                hca_found = cable['has_hca']
+                                vlog(5, 'Found matching cable c%s' % (cid))
+                        else:
+                            vlog(5, 'Non-matching cable c%s rejected SN=%s PN=%s' % (cable['cid'],cable['SN'],cable['PN']))
+
+                #mark all other cables as replaced
+                if cid:
+                    for cable in cables:
+                        if not cable['cid'] in all_replaced_cables and cable['cid'] != cid:
+                            #found old cable w/ different SN/PN
+                            replaced_cables.add(cable['cid'])
+                            vlog(5, 'Found replaced cable c%s' % (cable['cid']))
+            else: 
+                #if the detected live cable lacks a SN/PN, favor the cable that has one
+                #ignore any replacements since current cable is unplugged or half-dead
+                #always favor newer cables
+                cid_nosn = None
+                cid_nosn_hca_found = None
+                for cable in cables:
+                    if not cable['cid'] in all_replaced_cables:
+                        if cable['SN'] and cable['PN'] and (cid is None or cable['cid'] > cid):
                             cid = cable['cid']
                             hca_found = cable['has_hca']
-                            vlog(5, 'Found matching cable c%s' % (cid))
-                    else:
-                        vlog(5, 'Non-matching cable c%s rejected SN=%s PN=%s' % (cable['cid'],cable['SN'],cable['PN']))
-
-            #mark all other cables as replaced
-            if cid:
-                for cable in cables:
-                    if not cable['cid'] in all_replaced_cables and cable['cid'] != cid:
-                        #found old cable w/ different SN/PN
-                        replaced_cables.add(cable['cid'])
-                        vlog(5, 'Found replaced cable c%s' % (cable['cid']))
-        else: 
-            #if the detected live cable lacks a SN/PN, favor the cable that has one
-            #ignore any replacements since current cable is unplugged or half-dead
-            #always favor newer cables
-            cid_nosn = None
-            cid_nosn_hca_found = None
-            for cable in cables:
-                if not cable['cid'] in all_replaced_cables:
-                    if cable['SN'] and cable['PN'] and (cid is None or cable['cid'] > cid):
-                        cid = cable['cid']
-                        hca_found = cable['has_hca']
-                        vlog(5, 'Found matching cable c%s with serial: %s product: %s' % (cid,cable['SN'],cable['PN']))
-                    else:
-                        #record newest cable found if no SN/PN are found
-                        if cid_nosn is None or cable['cid'] > cid_nosn:
-                            cid_nosn = cable['cid']
-                            cid_nosn_hca_found = cable['has_hca']
-                            vlog(5, 'Found matching cable c%s without serial' % (cid_nosn))
-
-            if cid is None and cid_nosn:
-                #unable to find a cable with a SN/PN, just take first cable found
-                cid = cid_nosn 
-                hca_found  = cid_nosn_hca_found  
-                vlog(5, 'Found matching cable c%s without serial' % (cid))
+                            vlog(5, 'Found matching cable c%s with serial: %s product: %s' % (cid,cable['SN'],cable['PN']))
+                        else:
+                            #record newest cable found if no SN/PN are found
+                            if cid_nosn is None or cable['cid'] > cid_nosn:
+                                cid_nosn = cable['cid']
+                                cid_nosn_hca_found = cable['has_hca']
+                                vlog(5, 'Found matching cable c%s without serial' % (cid_nosn))
+
+                if cid is None and cid_nosn:
+                    #unable to find a cable with a SN/PN, just take first cable found
+                    cid = cid_nosn 
+                    hca_found  = cid_nosn_hca_found  
+                    vlog(5, 'Found matching cable c%s without serial' % (cid))
         
-        if cid is None: #create the cable
-            vlog(5, 'Unable to find matching cable. Creating new cable')
-            cid = insert_cable(port1, port2, timestamp)
-            hca_found = port1['type'] == "CA" or (port2 and port2['type'] == "CA") 
-
-        #mark all the replaced cables (hope its not more than one...)
-        if replaced_cables:
-            for rcid in replaced_cables:
-                if not rcid in all_replaced_cables:
-                    all_replaced_cables.add(rcid)
-                    mark_replaced_cable(
-                        rcid, 
-                        cid, 
-                        'Detected new cable c%s in same physical location' % (cid)
-                    )
-
-        #record cid in each port to avoid relookup
-        port1['cable_id'] = cid
-        if port2:
-            port2['cable_id'] = cid
-
-        known_cables.append(cid)
-        if hca_found:
-            hca_cables.append(cid)
-
-    #Find any cables that are known but not parsed this time around (aka went dark)
-    #ignore any cables in a disabled state
-    missing_cables = set()
-    disabled_cables = set()
-    removed_cables = set()
-    SQL.execute('''
-            SELECT 
-                cid,
-                state
-            FROM 
-                cables
-        ''')
-    for row in SQL.fetchall():
-        if row['state'] == 'disabled':
-            disabled_cables.add(int(row['cid'])) 
-        if row['state'] == 'removed':
-            removed_cables.add(int(row['cid'])) 
- 
-        if row['cid'] in known_cables:
-            #cable found, mark it online and when
-            SQL.execute('''
-                UPDATE
-                    cables 
-                SET
-                    online = 1,
-                    onlineTime = ?
-                WHERE
-                    cid = ?
-                ;''', (
-                    int(timestamp),
-                    row['cid']
-            ));
- 
-        else: #cable not found
-            if not int(row['cid']) in disabled_cables:
-                #only note cables if they should not be missing
-                missing_cables.add(int(row['cid']))
-
-            #Mark cable offline
-            SQL.execute('''
-                UPDATE
-                    cables 
-                SET
-                    online = 0
-                WHERE
-                    cid = ?
-                ;''', (
-                    row['cid'],
-            ));
+            if cid is None: #create the cable
+                vlog(5, 'Unable to find matching cable. Creating new cable')
+                cid = insert_cable(port1, port2, timestamp)
+                chunk()
+                hca_found = port1['type'] == "CA" or (port2 and port2['type'] == "CA") 
+
+            #mark all the replaced cables (hope its not more than one...)
+            if replaced_cables:
+                for rcid in replaced_cables:
+                    if not rcid in all_replaced_cables:
+                        all_replaced_cables.add(rcid)
+                        #replacement reads both cables from the db
+                        flush()
+                        chunk()
+                        mark_replaced_cable(
+                            rcid, 
+                            cid, 
+                            'Detected new cable c%s in same physical location' % (cid)
+                        )
+
+                        #pick up the state of the replaced cable
+                        SQL.execute('SELECT state FROM cables WHERE cid = ?', (rcid,))
+                        for row in SQL.fetchall():
+                            cable_index[rcid]['state'] = row['state']
+
+            #record cid in each port to avoid relookup
+            port1['cable_id'] = cid
+            if port2:
+                port2['cable_id'] = cid
+
+            known_cables.append(cid)
+            if hca_found:
+                hca_cables.append(cid)
+
+        #Find any cables that are known but not parsed this time around (aka went dark)
+        #ignore any cables in a disabled state
+        flush()
+        missing_cables, disabled_cables, removed_cables = reconcile_online_cables(known_cables, timestamp)
+        chunk()
 
-    for cid in missing_cables:
         #Verify missing cables actually matter: ignore single port cables (aka unconnected)
         #ignore missing cables connected to HCAs, nodes go up and down all the time
-        SQL.execute('''
-            SELECT 
-                cables.cid,
-                cp1.cpid as cp1_cpid,
-                cp2.cpid as cp2_cpid
-            FROM 
-                cables
-
-            INNER JOIN
-                cable_ports as cp1
-            ON
-                cables.cid = ? and
-                cables.cid = cp1.cid and
-                cp1.hca != 0
-
-            LEFT OUTER JOIN
-                cable_ports as cp2
-            ON
-                cables.cid = cp2.cid and
-                cp1.cpid != cp2.cpid and
-                cp2.hca != 0
-                 
-            LIMIT 1 
-            ''', (
-                cid,
-            ))
-        for row in SQL.fetchall():
-            if row['cp1_cpid'] and row['cp2_cpid']:
+        #ignore removed cables, they are expected to be missing
+        switch_links = find_switch_links(missing_cables - removed_cables)
+        for cid in missing_cables:
+            if cid in switch_links:
                 #cable went dark
                 add_issue(
                     'missing',
@@ -2105,73 +2465,79 @@ def run_parse(dump_dir):
                     timestamp
                 )              
             else:
-                vlog(3, 'Ignoring missing single port Cable %s' % (cid))
+                vlog(3, 'Ignoring missing single port, HCA or removed Cable %s' % (cid))
+        chunk()
 
-    fabric_disabled = set()
-    ticket_issues = []
-    for issue in issues:
-        cid = None
+        fabric_disabled = set()
+        ticket_issues = []
+        for issue in issues:
+            cid = None
 
-        #set cable from port which was just resolved
-        for iport in issue['ports']:
-            if iport and 'cable_id' in iport:
-                cid = iport['cable_id']
+            #set cable from port which was just resolved
+            for iport in issue['ports']:
+                if iport and 'cable_id' in iport:
+                    cid = iport['cable_id']
 
-        if cid and issue['type'] == 'disabled':
-            fabric_disabled.add(cid)
+            if cid and issue['type'] == 'disabled':
+                fabric_disabled.add(cid)
  
-        if issue['type'] == 'missing' and cid in hca_cables:
-            vlog(3, 'ignoring missing cable c%s with an hca' % (cid))
-            continue
+            if issue['type'] == 'missing' and cid in hca_cables:
+                vlog(3, 'ignoring missing cable c%s with an hca' % (cid))
+                continue
 
-        if issue['type'] in ['missing','disabled'] and cid in removed_cables:
-            vlog(3, 'ignoring missing removed cable c%s' % (cid))
-            continue
+            if issue['type'] in ['missing','disabled'] and cid in removed_cables:
+                vlog(3, 'ignoring missing removed cable c%s' % (cid))
+                continue
 
-        if issue['type'] in ['missing','disabled'] and cid in disabled_cables:
-            vlog(3, 'ignoring missing disabled or removed cable c%s' % (cid))
-            continue
+            if issue['type'] in ['missing','disabled'] and cid in disabled_cables:
+                vlog(3, 'ignoring missing disabled or removed cable c%s' % (cid))
+                continue
              
-        vlog(5, 'issue detected: %s' % ([
-            issue['type'],
-            'c%s' % cid if cid else None,
-            issue['issue'],
-            issue['raw'],
-            issue['source'],
-            timestamp
-        ]))
-
-        if cid:
-            #hand over cleaned up info for issues
-            add_issue(
+            vlog(5, 'issue detected: %s' % ([
                 issue['type'],
-                cid,
+                'c%s' % cid if cid else None,
                 issue['issue'],
                 issue['raw'],
-                dump_dir,
-                timestamp
-            )
-        else:
-            #issues without a known cable will be aggregated into a single ticket
-            ticket_issues.append(issue['raw'])
-
-    #detect cables that should be disabled but are not any more
-    #print 'fabric disabled: %s' % (fabric_disabled)
-    #print 'expected disabled: %s' % (disabled_cables)
-    for cid in disabled_cables:
-        if not cid in fabric_disabled:
-            vlog(3, 'Cable that should be disabled found to be enabled c%s' % (cid))
-            add_issue(
-                'enabled',
-                cid,
-                'Atleast one port in cable detected as enabled',
-                'csv state of cable',
-                dump_dir,
+                issue['source'],
                 timestamp
-            ) 
-            #enable_cable(cid, 'Cable detected as enabled')
+            ]))
+
+            if cid:
+                #hand over cleaned up info for issues
+                add_issue(
+                    issue['type'],
+                    cid,
+                    issue['issue'],
+                    issue['raw'],
+                    dump_dir,
+                    timestamp
+                )
+                chunk()
+            else:
+                #issues without a known cable will be aggregated into a single ticket
+                ticket_issues.append(issue['raw'])
+
+        #detect cables that should be disabled but are not any more
+        #print 'fabric disabled: %s' % (fabric_disabled)
+        #print 'expected disabled: %s' % (disabled_cables)
+        for cid in disabled_cables:
+            if not cid in fabric_disabled:
+                vlog(3, 'Cable that should be disabled found to be enabled c%s' % (cid))
+                add_issue(
+                    'enabled',
+                    cid,
+                    'Atleast one port in cable detected as enabled',
+                    'csv state of cable',
+                    dump_dir,
+                    timestamp
+                ) 
+                chunk()
+                #enable_cable(cid, 'Cable detected as enabled')
+
+        flush()
 
-    SQL.execute('VACUUM;')
+    #never rewrite the whole database during parse
+    run_maintenance()
 
     #create ticket if are non cable issues
     if ticket_issues and not DISABLE_TICKETS:
@@ -2236,6 +2602,9 @@ def dump_help(full = False):
             {0} list ports {{cables}}+ 
                 dump list of cable ports
 
+            {0} list --json ...
+                dump one JSON object per line (actionable cables include their issues)
+
         add: 
             {0} add {{issue description}} {{cables}}+ 
             {0} suspect {{issue description}} {{cables}}+ 
@@ -2313,7 +2682,24 @@ def dump_help(full = False):
             generates issues against errors found 
             checks if any cable has been replaced (new SN) and will set that cable back to watch state
 
+        drain: {0} drain [retry]
+            send extraview ticket operations queued in the outbox (tickets/outbox) with retries
+            new tickets are listed with a negative placeholder id until drained
+            retry: requeue operations that failed every retry
+
+        field_keys: {0} field_keys [clear]
+            dump extraview field keys cached in tickets/'field key cache' for tickets/'field key ttl' seconds
+            clear: invalidate the cache after extraview is reconfigured
+
+        maintenance: {0} maintenance [force]
+            release free database pages in bounded incremental vacuum steps and refresh query statistics
+            only runs once the free page ratio crosses cables/maintenance/'free page ratio' (default 0.1)
+            force: always run and convert an old database to incremental auto vacuum (one full rewrite)
+
         {{cables}}+: Cable Labels Types (comma or space delimited)
+            --from-file {{path}}: read cables from file, one per line ('-' for stdin)
+                add, remove, disable, enable, casg, release, rejuvenate and comment
+                apply every cable in one transaction and change fabric ports after it commits
             cable id: c#
             ticket id: t#
             guid/port pairs: S{{guid}}/P{{port}}
@@ -2330,6 +2716,10 @@ def dump_help(full = False):
                 YES: disable creating and updating tickets (may cause extra errors)
                 NO: create tickets
 
+            DISABLE_EV_OUTBOX={{YES|NO default=NO}}
+                YES: send ticket operations to extraview immediately
+                NO: queue ticket operations in the outbox for drain
+
             DISABLE_BISECT_DETECT={{YES|NO default=NO}} 
                 YES: Bisection detection will be disabled
                 NO: Detect network bisection and refuse commands that will cause a network bisection
@@ -2370,117 +2760,143 @@ def dump_help(full = False):
         \n""".format(argv[0]))
 
 def main():
+    global CONFIG, BAD_CABLE_DB, DISABLE_PORT_STATE_CHANGE, DISABLE_BISECT_DETECT, DISABLE_TICKETS, EV
     CONFIG = config.load()
     cluster_info.init(CONFIG)
-    print(CONFIG)
 
-#if not cluster_info.is_mgr():
-#    die_now("Only run this on the cluster manager")
-#
-#BAD_CABLE_DB='/etc/ncar_bad_cable_list.sqlite'
-#""" const string: Path to JSON database for bad cable list """
-#
-#DISABLE_PORT_STATE_CHANGE=False
-#DISABLE_BISECT_DETECT=False
-#DISABLE_TICKETS=False
-#EV = None
-#syslog.openlog('bcl.py')
-#
-#if 'BAD_CABLE_DB' in os.environ and os.environ['BAD_CABLE_DB']:
-#    BAD_CABLE_DB=os.environ['BAD_CABLE_DB']
-#    syslog.openlog('bcl.py::override')
-#    vlog(1, 'Database: %s' % (BAD_CABLE_DB))
-#
-#if 'DISABLE_TICKETS' in os.environ and os.environ['DISABLE_TICKETS'] == "YES":
-#    DISABLE_TICKETS=True
-#    vlog(1, 'Warning: Disabling creating of extraview tickets')
-#else:
-#    EV = extraview_cli.open_extraview()
-#
-#if 'DISABLE_BISECT_DETECT' in os.environ and os.environ['DISABLE_BISECT_DETECT'] == "YES":
-#    DISABLE_BISECT_DETECT=True
-#    vlog(1, 'Warning: Disabling bisection detection.')
-#
-#if 'DISABLE_PORT_STATE_CHANGE' in os.environ and os.environ['DISABLE_PORT_STATE_CHANGE'] == "YES":
-#    DISABLE_BISECT_DETECT=True
-#    vlog(1, 'Warning: Disabling port state changes.') 
-#
-#initialize_db()
-#
-#vlog(5, argv)
-#
-#if len(argv) < 2:
-#    dump_help() 
-#else:
-#    CMD=argv[1].lower()
-#    if CMD == 'parse':
-#        run_parse(argv[2])
-#    elif CMD == 'bisect':
-#        for cid in resolve_cables(argv[2:]):
-#            detect_bisect_cable(cid)  
-#    elif len(argv) < 3:
-#        if CMD == 'help':
-#            dump_help(True)  
-#        elif CMD == 'list':
-#            list_state('action', None)   
-#        elif CMD == 'inventory':
-#            dump_inventory()
-#        else:
-#            dump_help()  
-#    else:
-#        if CMD == 'list':
-#            list_state(argv[2].lower(), argv[3:] if len(argv) > 3 else None)  
-#        elif CMD == 'replace':
-#            new_cid = None
-#            for cid in resolve_cables([argv[3]]):
-#                new_cid = cid
-#            if new_cid:
-#                for cid in resolve_cables(argv[4:]):
-#                    mark_replaced_cable(cid, new_cid, argv[2]) 
-#        elif CMD == 'remove':
-#            for cid in resolve_cables(argv[3:]):
-#                remove_cable(cid, argv[2]) 
-#        elif CMD == 'mlxdump' or CMD == 'dump':
-#            for cid in resolve_cables(argv[3:]):
-#                dump_debug(cid, argv[2]) 
-#        elif CMD == 'disable':
-#            for cid in resolve_cables(argv[3:]):
-#                disable_cable(cid, argv[2])
-#        elif CMD == 'enable':
-#            for cid in resolve_cables(argv[3:]):
-#                enable_cable(cid, argv[2]) 
-#        elif CMD == 'casg':
-#            for cid in resolve_cables(argv[3:]):
-#                send_casg(cid, argv[2]) 
-#        elif CMD == 'add' or CMD == 'suspect':
-#            for cid in resolve_cables(argv[3:]):
-#                add_issue('Manual Entry', cid, argv[2], None, 'admin', int(time.time()))
-#        elif CMD == 'release' or CMD == 'resolve':
-#            for cid in resolve_cables(argv[3:]):
-#                release_cable(cid, argv[2])
-#        elif CMD == 'query':
-#            for cid in resolve_cables(argv[2:]):
-#                query_cable_ports(cid) 
-#        elif CMD == 'rejuvenate':
-#            for cid in resolve_cables(argv[3:]):
-#                release_cable(cid, argv[2], True)
-#        elif CMD == 'ignore':
-#            for iid in resolve_issues(argv[3:]):
-#                ignore_issue(argv[2], iid)
-#        elif CMD == 'honor':
-#            for iid in resolve_issues(argv[3:]):
-#                honor_issue(argv[2], iid) 
-#        elif CMD == 'cable_plabel':
-#            for cid in resolve_cables(argv[3:]):
-#                set_plabel_cable(cid, argv[2])
-#        elif CMD == 'port_plabel':
-#            for cid in resolve_cable_ports(argv[3:]):
-#                set_plabel_cableport(cid, argv[2])
-#        elif CMD == 'comment':
-#            for cid in resolve_cables(argv[3:]):
-#                comment_cable(cid, argv[2]) 
-#        else:
-#            dump_help() 
-#
-#release_db()
-#
+    if not cluster_info.is_mgr():
+        die_now("Only run this on the cluster manager")
+
+    syslog.openlog('bcl.py')
+
+    BAD_CABLE_DB = config.get(CONFIG, ['database'], BAD_CABLE_DB)
+    DISABLE_TICKETS = not config.get(CONFIG, ['tickets', 'enabled'], True)
+    outbox = config.get(CONFIG, ['tickets', 'outbox'], True)
+    DISABLE_BISECT_DETECT = config.get(CONFIG, ['cables', 'disable bisect detect'], False)
+    DISABLE_PORT_STATE_CHANGE = config.get(CONFIG, ['cables', 'disable port state change'], False)
+
+    if 'BAD_CABLE_DB' in os.environ and os.environ['BAD_CABLE_DB']:
+        BAD_CABLE_DB=os.environ['BAD_CABLE_DB']
+        syslog.openlog('bcl.py::override')
+        vlog(1, 'Database: %s' % (BAD_CABLE_DB))
+
+    if 'DISABLE_TICKETS' in os.environ and os.environ['DISABLE_TICKETS'] == "YES":
+        DISABLE_TICKETS=True
+
+    if 'DISABLE_EV_OUTBOX' in os.environ and os.environ['DISABLE_EV_OUTBOX'] == "YES":
+        outbox=False
+
+    if DISABLE_TICKETS:
+        vlog(1, 'Warning: Disabling creating of extraview tickets')
+    elif not outbox:
+        EV = open_extraview()
+
+    if 'DISABLE_BISECT_DETECT' in os.environ and os.environ['DISABLE_BISECT_DETECT'] == "YES":
+        DISABLE_BISECT_DETECT=True
+    if DISABLE_BISECT_DETECT:
+        vlog(1, 'Warning: Disabling bisection detection.')
+
+    if 'DISABLE_PORT_STATE_CHANGE' in os.environ and os.environ['DISABLE_PORT_STATE_CHANGE'] == "YES":
+        DISABLE_PORT_STATE_CHANGE=True
+    if DISABLE_PORT_STATE_CHANGE:
+        vlog(1, 'Warning: Disabling port state changes.') 
+
+    initialize_db()
+
+    if not DISABLE_TICKETS and outbox:
+        #ticket operations commit with the database and are sent by run_drain()
+        EV = ev_outbox.Outbox(SQL)
+
+    vlog(5, argv)
+
+    if len(argv) < 2:
+        dump_help() 
+    else:
+        CMD=argv[1].lower()
+        if CMD == 'parse':
+            run_parse(argv[2])
+        elif CMD == 'maintenance':
+            run_maintenance(len(argv) > 2 and argv[2].lower() == 'force')
+        elif CMD == 'drain':
+            run_drain(len(argv) > 2 and argv[2].lower() == 'retry')
+        elif CMD == 'field_keys':
+            run_field_keys(len(argv) > 2 and argv[2].lower() == 'clear')
+        elif CMD == 'bisect':
+            for cid in resolve_cables(argv[2:]):
+                detect_bisect_cable(cid)  
+        elif CMD == 'list':
+            args = [arg for arg in argv[2:] if arg != '--json']
+            list_state(
+                args[0].lower() if args else 'action', 
+                args[1:] if len(args) > 1 else None,
+                '--json' in argv[2:]
+            )
+        elif len(argv) < 3:
+            if CMD == 'help':
+                dump_help(True)  
+            elif CMD == 'inventory':
+                dump_inventory()
+            else:
+                dump_help()  
+        else:
+            if CMD == 'replace':
+                new_cid = None
+                for cid in resolve_cables([argv[3]]):
+                    new_cid = cid
+                if new_cid:
+                    for cid in resolve_cables(argv[4:]):
+                        mark_replaced_cable(cid, new_cid, argv[2]) 
+            elif CMD == 'remove':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        remove_cable(cid, argv[2]) 
+            elif CMD == 'mlxdump' or CMD == 'dump':
+                for cid in resolve_cables(argv[3:]):
+                    dump_debug(cid, argv[2]) 
+            elif CMD == 'disable':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        disable_cable(cid, argv[2])
+            elif CMD == 'enable':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        enable_cable(cid, argv[2]) 
+            elif CMD == 'casg':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        send_casg(cid, argv[2]) 
+            elif CMD == 'add' or CMD == 'suspect':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        add_issue('Manual Entry', cid, argv[2], None, 'admin', int(time.time()))
+            elif CMD == 'release' or CMD == 'resolve':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        release_cable(cid, argv[2])
+            elif CMD == 'query':
+                for cid in resolve_cables(argv[2:]):
+                    query_cable_ports(cid) 
+            elif CMD == 'rejuvenate':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        release_cable(cid, argv[2], True)
+            elif CMD == 'ignore':
+                for iid in resolve_issues(argv[3:]):
+                    ignore_issue(argv[2], iid)
+            elif CMD == 'honor':
+                for iid in resolve_issues(argv[3:]):
+                    honor_issue(argv[2], iid) 
+            elif CMD == 'cable_plabel':
+                for cid in resolve_cables(argv[3:]):
+                    set_plabel_cable(cid, argv[2])
+            elif CMD == 'port_plabel':
+                for cid in resolve_cable_ports(argv[3:]):
+                    set_plabel_cableport(cid, argv[2])
+            elif CMD == 'comment':
+                with batch_cable_changes():
+                    for cid in resolve_cables(read_needles(argv[3:])):
+                        comment_cable(cid, argv[2]) 
+            else:
+                dump_help() 
+
+    release_db()
@@ -0,0 +1,457 @@
+#!/usr/bin/python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without 
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice, 
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+""" Bad cable list database schema 
+tables and indexes created by the bcl migrations and the hot statements bcl runs against them
+"""
+from .nlog import vlog
+
+TABLES = [
+    """
+    create table if not exists cables (
+        cid INTEGER PRIMARY KEY AUTOINCREMENT,
+        --State enum - watch, suspect, disabled, removed
+        state TEXT,
+        --creation time
+        ctime INTEGER,
+        --mtime (last time state from watch state)
+        mtime INTEGER,
+        --Cable Length
+        length text,
+        --Serial Number
+        SN text,
+        --Product Number
+        PN text,
+        comment BLOB,
+        --Number of times that cable has gone into suspect state
+        suspected INTEGER,
+        --Extraview Ticket number
+        ticket INTEGER,
+        --Physical Label
+        plabel text,
+        --Firmware Label
+        flabel text,
+        --Online (cable last seen online)
+        online BOOLEAN,
+        --Last Time seen Online
+        onlineTime integer 
+    );
+    """,
+    """
+    create table if not exists cable_ports (
+        cpid INTEGER PRIMARY KEY AUTOINCREMENT, 
+        cid integer,
+        --Physical Label
+        plabel text,
+        --Firmware Label
+        flabel text,
+        guid text,
+        --PortNum 
+        port integer,
+        --Name (usually hostname)
+        name text,
+        --if port is an HCA
+        hca BOOLEAN,
+        FOREIGN KEY (cid) REFERENCES cables(cid)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS issues (
+        iid INTEGER PRIMARY KEY AUTOINCREMENT,
+        -- last time issue was generated
+        mtime integer,
+        -- Parsed error type
+        type text,
+        -- Issue description (aka what is wrong)
+        issue blob,
+        --Raw error message
+        raw blob,
+        --Where error was generated
+        source blob,
+        --cable source of issue (may be null)
+        cid INTEGER,
+        --should these issues be ignored?
+        ignore BOOLEAN,
+        FOREIGN KEY (cid) REFERENCES cables(cid)
+    );
+    """,
+]
+""" bad cable tables (one statement each) """
+
+INDEXES = [
+    #cable_ports of a cable (joined by almost every cable query)
+    'CREATE INDEX IF NOT EXISTS cable_ports_guid_index on cable_ports (guid, port);',
+    'CREATE INDEX IF NOT EXISTS cable_ports_guid_cid_index on cable_ports (cid, guid, port);',
+    #state needles and listing bad cables
+    'CREATE INDEX IF NOT EXISTS cables_state_index on cables (state);',
+    #online/offline needles
+    'CREATE INDEX IF NOT EXISTS cables_online_index on cables (online);',
+    #ticket backfill from the extraview outbox
+    'CREATE INDEX IF NOT EXISTS cables_ticket_index on cables (ticket);',
+    #current issues of a cable
+    'CREATE INDEX IF NOT EXISTS issues_cid_index on issues (cid, ignore, mtime);',
+    #ignored issues are loaded for every parse (partial index stays small)
+    'CREATE INDEX IF NOT EXISTS issues_ignored_index on issues (cid) WHERE ignore = 1;',
+]
+""" indexes covering the query shapes in HOT_QUERIES (bcl migration 2, changes need a new migration) """
+
+ISSUE_IGNORED = '''
+    SELECT 
+        iid
+    FROM 
+        issues
+    WHERE
+        type = ? and
+        issue = ? and
+        ( ? IS NULL or raw = ? ) and
+        ignore = 1 and
+        cid = ?
+    LIMIT 1
+'''
+""" first ignored issue matching (type, issue, raw, raw, cid). a NULL raw matches any raw """
+
+IGNORED_ISSUES = '''
+    SELECT 
+        iid,
+        type,
+        issue,
+        raw,
+        cid
+    FROM 
+        issues
+    WHERE
+        ignore = 1
+'''
+""" every ignored issue """
+
+CABLE_STATUS = '''
+    SELECT 
+        cables.cid,
+        cables.state,
+        cables.suspected,
+        cables.ticket,
+        cp1.flabel as cp1_flabel,
+        cp2.flabel as cp2_flabel
+    FROM 
+        cables
+
+    INNER JOIN
+        cable_ports as cp1
+    ON
+        cables.cid = ? and
+        cables.cid = cp1.cid
+
+    LEFT OUTER JOIN
+        cable_ports as cp2
+    ON
+        cables.cid = cp2.cid and
+        cp1.cpid != cp2.cpid
+         
+    LIMIT 1
+'''
+""" state, suspected, ticket and port labels of (cid) """
+
+CABLE_PORTS_BY_CID = '''
+    SELECT 
+        cpid,
+        guid,
+        port,
+        hca
+    FROM 
+        cable_ports 
+    WHERE
+        cid = ?
+'''
+""" ports of (cid) """
+
+CABLES_BY_STATE = '''
+    SELECT 
+        cid
+    FROM 
+        cables
+    WHERE
+        state = ?
+'''
+""" cids of cables in (state) """
+
+CABLES_BY_ONLINE = '''
+    SELECT 
+        cid
+    FROM 
+        cables
+    WHERE
+        online = ?
+'''
+""" cids of cables (online) or not """
+
+BACKFILL_TICKET = 'UPDATE cables SET ticket = ? WHERE ticket = ?;'
+""" replace (placeholder ticket) with (ticket) """
+
+CABLE_ISSUE_SOURCES = '''
+    SELECT 
+        source
+    FROM 
+        issues 
+    WHERE
+        ignore = 0 and 
+        cid = ? and
+        mtime >= ?
+    ORDER BY mtime ASC
+'''
+""" sources of current issues of (cid) since (mtime) """
+
+LIST_ACTIONS = '''
+    SELECT 
+        cables.cid as cid,
+        cables.length as length,
+        cables.SN as SN,
+        cables.PN as PN,
+        cables.state as state,
+        cables.comment as comment,
+        cables.suspected as suspected,
+        cables.ticket as ticket,
+        cables.flabel as flabel,
+        cables.mtime as mtime,
+        issues.iid as iid,
+        issues.type as type,
+        issues.issue as issue,
+        issues.source as source,
+        issues.mtime as issue_mtime
+    FROM 
+        cables
+    %(join)s
+    LEFT OUTER JOIN
+        issues
+    ON
+        issues.cid = cables.cid and
+        issues.ignore = 0 and
+        issues.mtime >= cables.mtime
+    %(where)s
+    ORDER BY 
+        %(order)s
+        cables.ctime ASC,
+        cables.cid ASC,
+        issues.mtime ASC,
+        issues.iid ASC
+'''
+""" cables with their current issues (join, where and order by prefix restrict the cables) """
+
+ACTIONABLE = "WHERE cables.state IN ('suspect', 'disabled')"
+""" LIST_ACTIONS where clause for every cable that needs action """
+
+LIST_CABLES = '''
+    SELECT 
+        cables.cid as cid,
+        cables.ctime as ctime,
+        cables.mtime as mtime,
+        cables.length as length,
+        cables.SN as SN,
+        cables.PN as PN,
+        cables.state as state,
+        cables.comment as comment,
+        cables.suspected as suspected,
+        cables.ticket as ticket,
+        cables.flabel as flabel,
+        cables.plabel as plabel,
+        cp1.flabel as cp1_flabel,
+        cp1.plabel as cp1_plabel,
+        cp2.flabel as cp2_flabel,
+        cp2.plabel as cp2_plabel
+    from 
+        cables
+    %(join)s
+
+    --first and second port without grouping (which would walk every cable)
+    INNER JOIN
+        cable_ports as cp1
+    ON
+        cp1.cpid = (SELECT min(cpid) FROM cable_ports WHERE cable_ports.cid = cables.cid)
+
+    LEFT OUTER JOIN
+        cable_ports as cp2
+    ON
+        cp2.cpid = (SELECT min(cpid) FROM cable_ports WHERE cable_ports.cid = cables.cid and cable_ports.cpid > cp1.cpid)
+
+    ORDER BY %(order)s cables.cid ASC
+'''
+""" cables with the labels of their ports (join and order by prefix restrict the cables) """
+
+LIST_PORTS = '''
+    SELECT 
+        cable_ports.cid as cid,
+        cable_ports.cpid as cpid,
+        cable_ports.plabel as plabel,
+        cable_ports.flabel as flabel,
+        cable_ports.guid as guid,
+        cable_ports.port as port,
+        cable_ports.hca as hca,
+        cable_ports.name as name
+    FROM 
+        cable_ports 
+    %(join)s
+    ORDER BY %(order)s cable_ports.cpid ASC
+'''
+""" cable ports (join and order by prefix restrict the cables) """
+
+LIST_ISSUES = '''
+    SELECT 
+        issues.iid as iid,
+        issues.type as type,
+        issues.issue as issue,
+        issues.raw as raw,
+        issues.source as source,
+        issues.mtime as mtime,
+        issues.ignore as ignore,
+        issues.cid as cid
+    FROM 
+        issues 
+    %(join)s
+    ORDER BY %(order)s issues.iid ASC
+'''
+""" issues (join and order by prefix restrict the cables) """
+
+LIST_FILTER_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS list_cables (
+        ord INTEGER PRIMARY KEY,
+        cid INTEGER UNIQUE
+    );
+'''
+""" cids resolved from a list filter in order """
+
+LIST_FILTER_JOIN = 'INNER JOIN list_cables ON list_cables.cid = %(table)s.cid'
+""" join restricting (table) of a list query to list_cables """
+
+LIST_FILTER_ORDER = 'list_cables.ord ASC,'
+""" order by prefix of a list query restricted to list_cables """
+
+ISSUE_UPSERT = '''
+    INSERT INTO 
+    issues 
+    (
+        ignore,
+        type,
+        issue,
+        raw,
+        source,
+        mtime,
+        cid
+    ) VALUES (
+        0, ?, ?, ?, ?, ?, ?
+    )
+    ON CONFLICT (type, issue, source, cid, coalesce(raw, '')) DO UPDATE SET
+        mtime = excluded.mtime
+    ;'''
+""" insert issue (type, issue, raw, source, mtime, cid) or update mtime of the same issue (needs issues_identity_index) """
+
+NEEDLE_KEYS_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS needle_keys (
+        nid INTEGER,
+        key TEXT
+    );
+'''
+""" cable_aliases keys of every needle given to resolve_cables() """
+
+RESOLVE_CABLE = '''
+    SELECT 
+        cable_aliases.cid as cid,
+        coalesce(
+            cable_aliases.cpid,
+            (SELECT min(cpid) FROM cable_ports WHERE cable_ports.cid = cable_aliases.cid)
+        ) as cpid
+    FROM 
+        cable_aliases
+    INNER JOIN
+        cables
+    ON
+        cables.cid = cable_aliases.cid
+    WHERE
+        cable_aliases.key IN (%(keys)s)
+    ORDER BY 
+        cable_aliases.cpid IS NOT NULL ASC,
+        cables.ctime ASC,
+        cables.cid ASC
+    LIMIT 1
+'''
+""" cable (and port) of the preferred alias matching the keys placeholders """
+
+RESOLVE_NEEDLE_KEYS = '''
+    SELECT 
+        needle_keys.nid as nid,
+        cable_aliases.cid as cid
+    FROM 
+        needle_keys
+    --needle_keys has no statistics: CROSS JOIN keeps it the outer loop
+    CROSS JOIN
+        cable_aliases
+    ON
+        cable_aliases.key = needle_keys.key
+    INNER JOIN
+        cables
+    ON
+        cables.cid = cable_aliases.cid
+    ORDER BY 
+        needle_keys.nid ASC,
+        cable_aliases.cpid IS NOT NULL ASC,
+        cables.ctime ASC,
+        cables.cid ASC
+'''
+""" cids matching needle_keys, preferred alias of every needle first """
+
+HOT_QUERIES = {
+    'issue_ignored': (ISSUE_IGNORED, ('type', 'issue', None, None, 1)),
+    'batch_issues': (IGNORED_ISSUES, ()),
+    'cable_status': (CABLE_STATUS, (1,)),
+    'cable_ports': (CABLE_PORTS_BY_CID, (1,)),
+    'resolve_cables_state': (CABLES_BY_STATE, ('suspect',)),
+    'resolve_cables_online': (CABLES_BY_ONLINE, (0,)),
+    'backfill_ticket': (BACKFILL_TICKET, (1, -1)),
+    'dump_debug': (CABLE_ISSUE_SOURCES, (1, 0)),
+    'list_state': (LIST_ACTIONS % { 'join': '', 'where': ACTIONABLE, 'order': '' }, ()),
+    'list_state_actions': (LIST_ACTIONS % { 'join': LIST_FILTER_JOIN % { 'table': 'cables' }, 'where': '', 'order': LIST_FILTER_ORDER }, ()),
+    'list_state_cables': (LIST_CABLES % { 'join': LIST_FILTER_JOIN % { 'table': 'cables' }, 'order': LIST_FILTER_ORDER }, ()),
+    'list_state_ports': (LIST_PORTS % { 'join': LIST_FILTER_JOIN % { 'table': 'cable_ports' }, 'order': LIST_FILTER_ORDER }, ()),
+    'list_state_issues': (LIST_ISSUES % { 'join': LIST_FILTER_JOIN % { 'table': 'issues' }, 'order': LIST_FILTER_ORDER }, ()),
+    'add_issue': (ISSUE_UPSERT, ('type', 'issue', None, 'source', 1, 1)),
+    'resolve_cable': (RESOLVE_CABLE % { 'keys': '?, ?' }, ('c:1', 'cl:c1')),
+    'resolve_cables': (RESOLVE_NEEDLE_KEYS, ()),
+}
+""" statements bcl runs (by function) with sample arguments against the migrated schema 
+(plus LIST_FILTER_TABLE and NEEDLE_KEYS_TABLE). none may scan a whole table of it. 
+listing every cable, port or issue without a filter is expected to scan and is not included.
+"""
+
+def create_indexes(SQL):
+    """ Migration 2: create any missing INDEXES 
+    databases left at user_version 1 by the first index set already have them.
+    """
+    for index in INDEXES:
+        SQL.execute(index)
+
+    vlog(3, 'created bad cable indexes')
@@ -29,7 +29,6 @@
 #OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 #OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
 import opstt
-import extraview
 from sys import path, argv
 from .nlog import vlog,die_now
 from ClusterShell.NodeSet import NodeSet
@@ -42,6 +41,10 @@ from . import siblings
 from . import sgi_cluster
 from . import ipmi
 from . import file_locking
+from . import sqlite
+from . import ev_outbox
+from . import ev_field_keys
+from . import config
 import time
 import datetime
 
@@ -153,6 +156,8 @@ def add_nodes(nodes, comment, new_state = 'suspect-pending', skip_ev = False):
                     }
                 ) 
             if ev_id:
+                #ticket ids are kept as strings like the ones given to attach
+                ev_id = str(ev_id)
                 STATE['nodes'][node]['extraview'].append(ev_id)
                 vlog(3, 'Opened Extraview Ticket %s for %s' % (ev_id, node))
 
@@ -201,7 +206,7 @@ def list_state(nodes):
     print(('{:<20}{:<20}{:<20}{:<50}{:<20}'.format('Node','state','Extraview','comment', 'scheduler comment')))
     for node,state in list(STATE['nodes'].items()):
         if len(nodelist) == 0 or node in nodelist:
-            print(('{:<20}{:<20}{:<20}{:<50}{:<20}'.format(node,state['state'], ','.join(state['extraview']),state['comment'], state['scheduler_comment'])))
+            print(('{:<20}{:<20}{:<20}{:<50}{:<20}'.format(node,state['state'], ','.join(map(str, state['extraview'])),state['comment'], str(state['scheduler_comment']))))
  
 def comment_nodes(nodes, comment):
     """ add comment to nodes """
@@ -246,8 +251,9 @@ def detach_nodes(nodes, ev_ids):
            continue
        
         for ev_id in ev_ids:
-            if ev_id in STATE['nodes'][node]['extraview']:
-                STATE['nodes'][node]['extraview'].remove(ev_id)
+            #older states may hold integer ticket ids
+            for nev_id in [x for x in STATE['nodes'][node]['extraview'] if str(x) == str(ev_id)]:
+                STATE['nodes'][node]['extraview'].remove(nev_id)
                 vlog(3, 'node %s remove extraview %s' % (node, ev_id)) 
 
     save_state()   
@@ -473,6 +479,47 @@ def release_pending_node(node):
     if state == 'suspect-pending':
         STATE['nodes'][node]['state'] = 'suspect' 
 
+def open_extraview():
+    """ Open extraview client with persistently cached field keys """
+    #only needed to talk to extraview
+    import extraview_cli
+    return ev_field_keys.open_cache(extraview_cli.open_extraview(), CONFIG)
+
+def backfill_ticket(placeholder, ticket):
+    """ Replace placeholder ticket id of queued create with real ticket """
+    for node,nodest in list(STATE['nodes'].items()):
+        nodest['extraview'] = [str(ticket) if str(ev_id) == str(placeholder) else ev_id for ev_id in nodest['extraview']]
+
+def run_drain(retry = False):
+    """ Send queued extraview operations and backfill new ticket ids 
+    retry: requeue operations that failed every retry
+    """
+    if not OUTBOX_SQL:
+        die_now("extraview outbox is disabled")
+
+    if retry:
+        ev_outbox.retry_failed(OUTBOX_SQL)
+
+    stats = ev_outbox.drain(
+        OUTBOX_SQL, 
+        open_extraview(),
+        config.get(CONFIG, ['tickets', 'outbox retries'], ev_outbox.RETRIES),
+        config.get(CONFIG, ['tickets', 'outbox backoff'], ev_outbox.BACKOFF),
+        jobs = config.get(CONFIG, ['tickets', 'outbox jobs'], ev_outbox.JOBS),
+        rate = config.get(CONFIG, ['tickets', 'outbox rate'], ev_outbox.RATE)
+    )
+    count = ev_outbox.backfill(OUTBOX_SQL, backfill_ticket)
+    if count:
+        save_state()
+
+    vlog(3, 'extraview outbox: sent %s, retry %s, failed %s, waiting %s, backfilled %s tickets' % (
+        stats['sent'],
+        stats['retry'],
+        stats['failed'],
+        stats['waiting'],
+        count
+    ))
+
 def dump_help():
     die_now("""NCAR Bad Node List Multitool
 
@@ -518,6 +565,14 @@ def dump_help():
     detach: {0} {{node range}} {{detach}} {{extraview ids (comma delimited)}}
         detach comma seperated list of extraview ticket ids from bad nodes
 
+    drain: {0} {{drain}} [retry]
+        send extraview ticket operations queued in the outbox with retries
+        new tickets are listed with a negative placeholder id until drained
+        retry: requeue operations that failed every retry
+
+    field_keys: {0} {{field_keys}} {{clear}}
+        invalidate extraview field keys cached in tickets/'field key cache' after extraview is reconfigured
+
     auto: {0} {{auto}}
         auto add any down node in PBS to bad node list
         check jobs are done for bad nodes in hardware and casg states
@@ -527,63 +582,102 @@ def dump_help():
         VERBOSE=[1-5]
             1: lowest
             5: highest
+
+        CONFIG=[path default=/etc/opstt/config.json]
+            opstt config with the tickets/'field key cache', 'field key ttl' and outbox settings
+
+        DISABLE_EV_OUTBOX=[YES|NO default=NO]
+            YES: send ticket operations to extraview immediately
+            NO: queue ticket operations in the outbox for drain (unless tickets/outbox is false)
             
     """.format(argv[0]))
 
-if not sgi_cluster.is_sac():
-    die_now("Only run this on the SAC node")
-
 CLUSH_BAD_GROUPS='/etc/clustershell/groups.d/badnodes.yaml'
 BAD_NODE_DB='/etc/ncar_bad_node_list.json'
 BAD_NODE_DB_BACKUP='/etc/ncar_bad_node_list.backup.json'
 """ const string: Path to JSON database for bad node list """
 
+EV_OUTBOX_DB='/etc/ncar_bad_node_list.outbox.sqlite'
+""" const string: Path to sqlite database of queued extraview operations """
+OUTBOX_SQL=None
+
+CONFIG=None
+""" dictionary: opstt config (see config.load()) """
+
+EV=None
+""" extraview client or outbox """
+
 STATE={}
 """ dictionary: state table of bad node list
     this is written to the bad node DB on any changes
 """
 
-#only run with lock
-LOCK = file_locking.try_lock('/var/run/ncar_bnl', tries=10)
-if not LOCK:
-    die_now("unable to obtain lock. please try again later.")
-
-initialize_state()
-EV = extraview_cli.open_extraview()
-
-vlog(5, argv)
-
-if len(argv) < 2:
-    dump_help() 
-elif argv[1] == 'auto':
-    run_auto() 
-elif argv[1] == 'list':
-    NODES=NodeSet('') 
-    list_state(NODES)
-elif len(argv) == 3 and argv[2] == 'list':
-    NODES=NodeSet(argv[1]) 
-    list_state(NODES)
-elif len(argv) == 4:
-    NODES=NodeSet(argv[1]) 
-    CMD=argv[2].lower()
-
-    if CMD == 'add':
-        add_nodes(NODES, argv[3])
-    elif CMD == 'release':
-        del_nodes(NODES, argv[3]) 
-    elif CMD == 'comment':
-        comment_nodes(NODES, argv[3])
-    elif CMD == 'attach':
-        attach_nodes(NODES, argv[3].split(','))
-    elif CMD == 'detach':
-        detach_nodes(NODES, argv[3].split(','))
-    elif CMD == 'hardware':
-        mark_hardware(NODES, argv[3])
-    elif CMD == 'casg':
-        mark_casg(NODES, argv[3]) 
+def main():
+    global CONFIG, STATE, EV, LOCK, OUTBOX_CONNECTION, OUTBOX_SQL
+
+    if not sgi_cluster.is_sac():
+        die_now("Only run this on the SAC node")
+
+    CONFIG = config.load()
+
+    #only run with lock
+    LOCK = file_locking.try_lock('/var/run/ncar_bnl', tries=10)
+    if not LOCK:
+        die_now("unable to obtain lock. please try again later.")
+
+    initialize_state()
+    outbox = config.get(CONFIG, ['tickets', 'outbox'], True)
+    if 'DISABLE_EV_OUTBOX' in os.environ and os.environ['DISABLE_EV_OUTBOX'] == "YES":
+        outbox = False
+
+    if not outbox:
+        EV = open_extraview()
     else:
-        dump_help() 
-else:
-    dump_help() 
+        #ticket operations are queued and sent by drain
+        OUTBOX = sqlite.init(EV_OUTBOX_DB)
+        if not OUTBOX:
+            die_now("unable to open extraview outbox")
+        (OUTBOX_CONNECTION, OUTBOX_SQL) = OUTBOX
+        EV = ev_outbox.Outbox(OUTBOX_SQL)
+
+        if ev_outbox.backfill(OUTBOX_SQL, backfill_ticket):
+            save_state()
 
+    vlog(5, argv)
 
+    if len(argv) < 2:
+        dump_help() 
+    elif argv[1] == 'auto':
+        run_auto() 
+    elif argv[1] == 'drain':
+        run_drain(len(argv) > 2 and argv[2] == 'retry')
+    elif argv[1] == 'field_keys' and len(argv) > 2 and argv[2] == 'clear':
+        ev_field_keys.clear(ev_field_keys.cache_path(CONFIG))
+    elif argv[1] == 'list':
+        NODES=NodeSet('') 
+        list_state(NODES)
+    elif len(argv) == 3 and argv[2] == 'list':
+        NODES=NodeSet(argv[1]) 
+        list_state(NODES)
+    elif len(argv) == 4:
+        NODES=NodeSet(argv[1]) 
+        CMD=argv[2].lower()
+
+        if CMD == 'add':
+            add_nodes(NODES, argv[3])
+        elif CMD == 'release':
+            del_nodes(NODES, argv[3]) 
+        elif CMD == 'comment':
+            comment_nodes(NODES, argv[3])
+        elif CMD == 'attach':
+            attach_nodes(NODES, argv[3].split(','))
+        elif CMD == 'detach':
+            detach_nodes(NODES, argv[3].split(','))
+        elif CMD == 'hardware':
+            mark_hardware(NODES, argv[3])
+        elif CMD == 'casg':
+            mark_casg(NODES, argv[3]) 
+        else:
+            dump_help() 
+    else:
+        dump_help() 
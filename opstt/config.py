@@ -49,3 +49,15 @@ def load(configpath = None):
 
     return None
 
+def get(config, path, default = None):
+    """ Get value from loaded config 
+    path: list of nested keys
+    returns default if config or any key is missing
+    """
+    value = config
+    for key in path:
+        if not isinstance(value, dict) or not key in value:
+            return default
+        value = value[key]
+
+    return value
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without 
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice, 
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+#
+# Cache of parsed dump directories 
+#
+# The ports and issues parsed from a dump directory are pickled next to the
+# dump. The cache is keyed on the size, mtime and a sampled hash of every
+# dump file so it is ignored as soon as any of the files change.
+#
+# Unpickling runs arbitrary code and the key is inside of the same pickle,
+# so only caches that nobody else could have written are loaded.
+#
+from .nlog import vlog
+from . import ib_diagnostics
+import gc
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+
+CACHE_NAME = '.opstt_parse_cache'
+""" file name of the cache inside of the dump directory """
+
+CACHE_VERSION = 1
+""" bump to invalidate every cache when the cached format or parsers change """
+
+HASH_BLOCK_SIZE = 65536
+""" bytes hashed from the start, middle and end of every file """
+
+def file_hash ( path, size ):
+    """ Hash start, middle and end blocks of file 
+    Full hashes of large dumps would cost as much as parsing them, size and 
+    mtime catch anything appended or rewritten in place.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fds:
+        if size <= HASH_BLOCK_SIZE * 3:
+            digest.update(fds.read())
+        else:
+            for offset in (0, (size - HASH_BLOCK_SIZE) // 2, size - HASH_BLOCK_SIZE):
+                fds.seek(offset)
+                digest.update(fds.read(HASH_BLOCK_SIZE))
+
+    return digest.hexdigest()
+
+def fingerprint ( dump_dir, extra = None ):
+    """ Fingerprint of the dump files in dump_dir
+    extra: any other picklable value the parse depends on (such as counter thresholds)
+    returns tuple of cache version, (name, size, mtime, hash) per file and extra
+    """
+    files = []
+    for name, required in ib_diagnostics.DUMP_FILES:
+        path = os.path.join(dump_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            files.append((name, None, None, None))
+            continue
+
+        files.append((name, st.st_size, st.st_mtime_ns, file_hash(path, st.st_size)))
+
+    return (CACHE_VERSION, tuple(files), extra)
+
+def trusted ( fds ):
+    """ Check open cache file is owned by us and only writable by us """
+    st = os.fstat(fds.fileno())
+    if st.st_uid != os.geteuid():
+        return False
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return False
+
+    return True
+
+def load ( dump_dir, extra = None ):
+    """ Load cached parse of dump_dir 
+    extra: must match the extra value given to save()
+    returns (ports registry, issues) or None if there is no valid cache
+    """
+    path = os.path.join(dump_dir, CACHE_NAME)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        key = fingerprint(dump_dir, extra)
+        with open(path, 'rb') as fds:
+            #checked against the opened file so it can not be swapped afterwards
+            if not trusted(fds):
+                vlog(1, 'refusing to load parse cache not owned by uid %s or writable by others: %s' % (os.geteuid(), path))
+                return None
+
+            if pickle.load(fds) != key:
+                vlog(4, 'parse cache is stale: %s' % (path))
+                return None
+
+            #cyclic gc passes over the freshly loaded objects cost more than the load
+            gc.disable()
+            try:
+                ports, issues = pickle.load(fds)
+            finally:
+                gc.enable()
+    except Exception as err:
+        vlog(2, 'unable to load parse cache %s: %s' % (path, err))
+        return None
+
+    vlog(4, 'loaded parse cache: %s' % (path))
+    return (ports, issues)
+
+def save ( dump_dir, ports, issues, extra = None ):
+    """ Save parsed ports and issues of dump_dir 
+    The cache is written to a temporary file and renamed into place so 
+    readers never see a partial cache.
+    returns True if the cache was written
+    """
+    path = os.path.join(dump_dir, CACHE_NAME)
+    key = fingerprint(dump_dir, extra)
+
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix = CACHE_NAME, dir = dump_dir)
+    except OSError as err:
+        vlog(2, 'unable to write parse cache %s: %s' % (path, err))
+        return False
+
+    try:
+        with os.fdopen(fd, 'wb') as fds:
+            pickle.dump(key, fds, pickle.HIGHEST_PROTOCOL)
+            pickle.dump((ports, issues), fds, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except Exception as err:
+        vlog(2, 'unable to write parse cache %s: %s' % (path, err))
+        os.unlink(tmp_path)
+        return False
+
+    vlog(4, 'saved parse cache: %s' % (path))
+    return True
+
+def clear ( dump_dir ):
+    """ Remove cached parse of dump_dir """
+    path = os.path.join(dump_dir, CACHE_NAME)
+    if os.path.isfile(path):
+        os.unlink(path)
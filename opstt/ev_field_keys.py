@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without 
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice, 
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+#
+# Persistent cache of Extraview field keys
+#
+# Every new ticket looks up the keys of the same few field values
+# (HELP_LOCATION, HELP_HOSTNAME, ...) which only change when Extraview is
+# reconfigured. FieldKeyCache wraps the extraview client, loads the cached
+# keys once per process and only asks Extraview for missing or expired ones.
+#
+from .nlog import vlog
+from . import config
+import json
+import os
+import tempfile
+import threading
+import time
+
+CACHE_PATH = '/var/cache/opstt/ev_field_keys.json'
+""" const string: default path of the field key cache """
+
+TTL = 7 * 86400
+""" seconds before a cached field key is looked up again """
+
+def load(path):
+    """ Load cached field keys 
+    returns dictionary of field -> value -> [key, time cached]
+    """
+    if not os.path.isfile(path):
+        return {}
+
+    try:
+        with open(path, 'r') as fds:
+            return json.load(fds)
+    except Exception as err:
+        vlog(2, 'unable to load field key cache %s: %s' % (path, err))
+
+    return {}
+
+def save(path, entries):
+    """ Save cached field keys 
+    written to a temporary file and renamed into place so readers never 
+    see a partial cache.
+    returns True if the cache was written
+    """
+    try:
+        directory = os.path.dirname(path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(prefix = os.path.basename(path), dir = directory)
+    except OSError as err:
+        vlog(2, 'unable to write field key cache %s: %s' % (path, err))
+        return False
+
+    try:
+        with os.fdopen(fd, 'w') as fds:
+            json.dump(entries, fds, sort_keys=True, indent=4, separators=(',', ': '))
+        os.rename(tmp_path, path)
+    except Exception as err:
+        vlog(2, 'unable to write field key cache %s: %s' % (path, err))
+        os.unlink(tmp_path)
+        return False
+
+    vlog(5, 'saved field key cache: %s' % (path))
+    return True
+
+def clear(path):
+    """ Remove every cached field key (after Extraview is reconfigured) """
+    if os.path.isfile(path):
+        os.unlink(path)
+        vlog(3, 'cleared field key cache: %s' % (path))
+
+def cache_path(cfg):
+    """ Get path of the field key cache from tickets/'field key cache' of loaded config """
+    return config.get(cfg, ['tickets', 'field key cache'], CACHE_PATH)
+
+def open_cache(ev, cfg):
+    """ Wrap extraview client in a FieldKeyCache configured by loaded config 
+    tickets/'field key cache': path of the cache (default CACHE_PATH)
+    tickets/'field key ttl': seconds before a key is looked up again (default TTL)
+    """
+    return FieldKeyCache(ev, cache_path(cfg), config.get(cfg, ['tickets', 'field key ttl'], TTL))
+
+class FieldKeyCache(object):
+    """ Extraview client wrapper caching get_field_value_to_field_key() 
+    every other call is passed through to the client
+    """
+
+    def __init__(self, ev, path = CACHE_PATH, ttl = TTL):
+        self.ev = ev
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = load(path)
+
+    def __getattr__(self, name):
+        return getattr(self.ev, name)
+
+    def get_field_value_to_field_key(self, field, value):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(field, {}).get(value)
+            if entry and now - entry[1] < self.ttl:
+                return entry[0]
+
+            key = self.ev.get_field_value_to_field_key(field, value)
+            if key is None:
+                #do not cache failed lookups
+                return key
+
+            self.entries.setdefault(field, {})[value] = [key, now]
+            save(self.path, self.entries)
+            vlog(4, 'cached extraview field key %s=%s: %s' % (field, value, key))
+            return key
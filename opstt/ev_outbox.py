@@ -0,0 +1,482 @@
+#!/usr/bin/python
+# vim: set tabstop=8 softtabstop=4 noexpandtab
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without 
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice, 
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE 
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR 
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF 
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS 
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+#
+# Durable outbox of Extraview ticket operations
+#
+# Outbox mirrors the Extraview client calls used by bcl and bnl but only
+# records them in a sqlite table, so they commit (or roll back) with the
+# rest of the local state. drain() sends them later in order with retries.
+# New tickets get a negative placeholder id until the drainer learns the
+# real id, which is then handed to backfill() callers. Different tickets are
+# sent in parallel by a bounded thread pool.
+#
+from .nlog import vlog
+import concurrent.futures
+import json
+import queue
+import threading
+import time
+
+RETRIES = 8
+""" attempts before an operation is marked failed """
+
+BACKOFF = 60
+""" seconds before the first retry, doubled on every failed attempt """
+
+MAX_BACKOFF = 3600
+""" longest wait in seconds between retries """
+
+MAX_FAILURES = 3
+""" consecutive failed sends before drain() gives up (extraview is likely down) """
+
+JOBS = 4
+""" tickets sent to in parallel by drain() """
+
+RATE = 0
+""" most extraview calls per second across every drain() thread (0 for unlimited) """
+
+FIELD_KEY = '__ev_field_key__'
+""" marker of a field value that is resolved to its key when sent """
+
+def init(SQL):
+    """ Create outbox tables if missing """
+    SQL.execute('''
+        create table if not exists ev_outbox (
+            oid INTEGER PRIMARY KEY AUTOINCREMENT,
+            ctime INTEGER,
+            --operation: create, add_resolver_comment, assign_group, close
+            op TEXT,
+            --ticket operated on (negative placeholder until created)
+            ticket INTEGER,
+            --JSON list of arguments after the ticket
+            args TEXT,
+            --state enum: pending, sent, failed
+            state TEXT,
+            attempts INTEGER,
+            --do not send before this time
+            next_try INTEGER,
+            error TEXT
+        );
+    ''')
+    SQL.execute('''
+        create index if not exists ev_outbox_state_index on ev_outbox (state, oid);
+    ''')
+    SQL.execute('''
+        create table if not exists ev_tickets (
+            --ticket placeholder is -pid
+            pid INTEGER PRIMARY KEY AUTOINCREMENT,
+            ctime INTEGER,
+            --real extraview ticket once created
+            ticket INTEGER,
+            --real ticket has been given to backfill()
+            backfilled BOOLEAN
+        );
+    ''')
+    SQL.execute('''
+        create index if not exists ev_tickets_ticket_index on ev_tickets (ticket);
+    ''')
+
+class Outbox(object):
+    """ Extraview client stand in that queues every ticket operation """
+
+    def __init__(self, SQL):
+        #own cursor to avoid clobbering callers iterating over theirs
+        self.SQL = SQL.connection.cursor()
+        init(self.SQL)
+
+    def queue(self, op, ticket, args):
+        """ record operation and return its oid """
+        self.SQL.execute('''
+            INSERT INTO ev_outbox (
+                ctime,
+                op,
+                ticket,
+                args,
+                state,
+                attempts,
+                next_try
+            ) VALUES (?, ?, ?, ?, 'pending', 0, 0);
+        ''', (
+            int(time.time()),
+            op,
+            ticket,
+            json.dumps(args)
+        ))
+
+        vlog(5, 'queued extraview %s for ticket %s' % (op, ticket))
+        return self.SQL.lastrowid
+
+    def create(self, *args):
+        """ queue new ticket and return its placeholder ticket id """
+        self.SQL.execute('INSERT INTO ev_tickets (ctime, backfilled) VALUES (?, 0);', (int(time.time()),))
+        placeholder = -self.SQL.lastrowid
+
+        self.queue('create', placeholder, list(args))
+        return placeholder
+
+    def update(self, op, ticket, args):
+        """ queue operation against existing ticket """
+        if ticket is None:
+            vlog(2, 'skipping extraview %s without a ticket' % (op))
+            return
+
+        self.queue(op, ticket, list(args))
+
+    def add_resolver_comment(self, ticket, *args):
+        self.update('add_resolver_comment', ticket, args)
+
+    def assign_group(self, ticket, *args):
+        self.update('assign_group', ticket, args)
+
+    def close(self, ticket, *args):
+        self.update('close', ticket, args)
+
+    def get_field_value_to_field_key(self, field, value):
+        """ defer lookup until sent """
+        return { FIELD_KEY: [field, value] }
+
+def is_placeholder(ticket):
+    """ ticket id is a placeholder of a queued create """
+    return ticket is not None and int(ticket) < 0
+
+def resolve_fields(ev, value):
+    """ replace field key markers with field keys from extraview """
+    if isinstance(value, dict):
+        if FIELD_KEY in value:
+            return ev.get_field_value_to_field_key(*value[FIELD_KEY])
+        return { key: resolve_fields(ev, val) for key, val in value.items() }
+    if isinstance(value, list):
+        return [ resolve_fields(ev, val) for val in value ]
+    return value
+
+def resolve_ticket(SQL, ticket):
+    """ get real ticket id of placeholder 
+    returns (ticket or None, create failed)
+    """
+    if not is_placeholder(ticket):
+        return (ticket, False)
+
+    SQL.execute('''
+        SELECT 
+            ev_tickets.ticket as ticket,
+            ev_outbox.state as state
+        FROM 
+            ev_tickets
+        LEFT JOIN
+            ev_outbox
+        ON
+            ev_outbox.op = 'create' and
+            ev_outbox.ticket = ?
+        WHERE
+            ev_tickets.pid = ?
+        LIMIT 1
+    ''', (ticket, -ticket))
+
+    for row in SQL.fetchall():
+        return (row['ticket'], row['state'] == 'failed')
+
+    return (None, True)
+
+def counts(SQL):
+    """ get count of operations per state """
+    SQL.execute('SELECT state, count(*) as count FROM ev_outbox GROUP BY state;')
+    return { row['state']: row['count'] for row in SQL.fetchall() }
+
+def retry_failed(SQL):
+    """ requeue every failed operation """
+    SQL.execute('''
+        UPDATE ev_outbox 
+        SET 
+            state = 'pending', 
+            attempts = 0, 
+            next_try = 0 
+        WHERE 
+            state = 'failed';
+    ''')
+    vlog(3, 'requeued %s failed extraview operations' % (SQL.rowcount))
+
+class RateLimiter(object):
+    """ Space calls at least 1/rate seconds apart across every thread """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next)
+            self.next = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
+
+class Breaker(object):
+    """ Stop every thread after max_failures failed calls in a row """
+
+    def __init__(self, max_failures):
+        self.max_failures = max_failures
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def success(self):
+        with self.lock:
+            if self.failures < self.max_failures:
+                self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures == self.max_failures:
+                vlog(1, 'giving up on extraview after %s failures in a row' % (self.failures))
+
+    def tripped(self):
+        with self.lock:
+            return self.failures >= self.max_failures
+
+def send_chain(ev, chain, ticket, now, retries, limiter, breaker, report):
+    """ Send operations against one ticket in order 
+    runs in a worker thread and only talks to extraview. 
+    every outcome is handed to report() to be recorded by drain().
+    stops at the first operation to be retried so later ones wait for it.
+    """
+    for i, row in enumerate(chain):
+        if breaker.tripped() or row['next_try'] > now:
+            for rest in chain[i:]:
+                report('waiting', rest)
+            return
+
+        limiter.wait()
+        start = time.time()
+        try:
+            args = resolve_fields(ev, json.loads(row['args']))
+            if row['op'] == 'create':
+                result = ev.create(*args)
+                if not result:
+                    raise Exception('extraview returned no ticket id')
+                ticket = result
+            else:
+                result = getattr(ev, row['op'])(ticket, *args)
+        except Exception as err:
+            breaker.failure()
+            report('error', row, err, time.time() - start, ticket)
+
+            if row['attempts'] + 1 < retries:
+                for rest in chain[i + 1:]:
+                    report('waiting', rest)
+                return
+            if row['op'] == 'create':
+                for rest in chain[i + 1:]:
+                    report('orphan', rest)
+                return
+            continue
+
+        breaker.success()
+        report('sent', row, result, time.time() - start, ticket)
+
+def latency_summary(latencies):
+    """ get count, mean, p50, p95 and max seconds of every operation """
+    summary = {}
+    for op, values in latencies.items():
+        values = sorted(values)
+        summary[op] = {
+            'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': values[int(0.50 * (len(values) - 1))],
+            'p95': values[int(0.95 * (len(values) - 1))],
+            'max': values[-1],
+        }
+
+    return summary
+
+def drain(SQL, ev, retries = RETRIES, backoff = BACKOFF, max_backoff = MAX_BACKOFF, max_failures = MAX_FAILURES, limit = None, jobs = JOBS, rate = RATE):
+    """ Send pending operations to extraview 
+    ev: extraview client (shared by every worker thread)
+    jobs: number of tickets sent to in parallel
+    rate: most extraview calls per second (0 for unlimited)
+    operations against a ticket (or its placeholder) are sent in order, 
+    each waiting until every earlier operation against it has been sent. failed sends are
+    retried with exponential backoff.
+    returns dictionary of counts (sent, retry, failed, waiting) and 
+    latency summary per operation
+    """
+    now = int(time.time())
+    stats = { 'sent': 0, 'retry': 0, 'failed': 0, 'waiting': 0, 'latency': {} }
+
+    SQL.execute('''
+        SELECT 
+            oid,
+            op,
+            ticket,
+            args,
+            attempts,
+            next_try,
+            --placeholder the ticket was created as (if created by the outbox)
+            coalesce((
+                SELECT 
+                    -ev_tickets.pid 
+                FROM 
+                    ev_tickets 
+                WHERE 
+                    ev_outbox.ticket > 0 and
+                    ev_tickets.ticket = ev_outbox.ticket
+                LIMIT 1
+            ), ticket) as origin
+        FROM 
+            ev_outbox
+        WHERE
+            state = 'pending'
+        ORDER BY oid ASC
+        %s;
+    ''' % ('LIMIT %d' % (int(limit)) if limit else ''))
+
+    #one chain of operations per ticket in oid order. operations queued
+    #against a backfilled ticket join the chain of its placeholder.
+    chains = {}
+    for row in SQL.fetchall():
+        if not row['origin'] in chains:
+            chains[row['origin']] = []
+        chains[row['origin']].append(row)
+
+    #sqlite is only used from this thread, workers queue their outcomes
+    outcomes = queue.Queue()
+    report = lambda *outcome: outcomes.put(outcome)
+    breaker = Breaker(max_failures)
+    limiter = RateLimiter(rate)
+    latencies = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = max(1, jobs)) as pool:
+        futures = []
+        for ticket, chain in chains.items():
+            real = ticket
+            if chain[0]['op'] != 'create' and is_placeholder(ticket):
+                real, create_failed = resolve_ticket(SQL, ticket)
+                if real is None:
+                    for row in chain:
+                        report('orphan' if create_failed else 'waiting', row)
+                    continue
+
+            futures.append(pool.submit(send_chain, ev, chain, real, now, retries, limiter, breaker, report))
+
+        done = False
+        while not done or not outcomes.empty():
+            try:
+                outcome = outcomes.get(timeout = 0.1)
+            except queue.Empty:
+                done = all(future.done() for future in futures)
+                continue
+
+            status, row = outcome[0], outcome[1]
+            if status == 'waiting':
+                stats['waiting'] += 1
+                continue
+            if status == 'orphan':
+                SQL.execute('''
+                    UPDATE ev_outbox SET state = 'failed', error = ? WHERE oid = ?;
+                ''', ('ticket %s was never created' % (row['ticket']), row['oid']))
+                stats['failed'] += 1
+                continue
+
+            result, latency, real = outcome[2:]
+            latencies.setdefault(row['op'], []).append(latency)
+            attempts = row['attempts'] + 1
+
+            if status == 'error':
+                if attempts >= retries:
+                    state = 'failed'
+                    stats['failed'] += 1
+                    vlog(1, 'extraview %s for ticket %s failed after %s attempts: %s' % (row['op'], real, attempts, result))
+                else:
+                    state = 'pending'
+                    stats['retry'] += 1
+                    vlog(2, 'extraview %s for ticket %s failed (attempt %s): %s' % (row['op'], real, attempts, result))
+
+                SQL.execute('''
+                    UPDATE 
+                        ev_outbox 
+                    SET 
+                        state = ?, 
+                        attempts = ?, 
+                        next_try = ?, 
+                        error = ? 
+                    WHERE 
+                        oid = ?;
+                ''', (
+                    state, 
+                    attempts, 
+                    now + min(backoff * 2 ** (attempts - 1), max_backoff),
+                    str(result),
+                    row['oid']
+                ))
+                continue
+
+            stats['sent'] += 1
+            SQL.execute('''
+                UPDATE ev_outbox SET state = 'sent', attempts = ?, error = NULL WHERE oid = ?;
+            ''', (attempts, row['oid']))
+
+            if row['op'] == 'create':
+                SQL.execute('UPDATE ev_tickets SET ticket = ? WHERE pid = ?;', (result, -row['ticket']))
+                vlog(3, 'Opened Extraview Ticket %s for placeholder %s' % (result, row['ticket']))
+            else:
+                vlog(5, 'sent extraview %s for ticket %s' % (row['op'], real))
+
+    stats['latency'] = latency_summary(latencies)
+    return stats
+
+def backfill(SQL, callback):
+    """ Hand every newly created ticket to callback(placeholder, ticket) 
+    each ticket is only given once
+    returns number of tickets backfilled
+    """
+    SQL.execute('''
+        SELECT 
+            pid,
+            ticket
+        FROM 
+            ev_tickets
+        WHERE
+            ticket IS NOT NULL and
+            backfilled = 0
+        ORDER BY pid ASC;
+    ''')
+
+    count = 0
+    for row in SQL.fetchall():
+        callback(-row['pid'], row['ticket'])
+        SQL.execute('UPDATE ev_tickets SET backfilled = 1 WHERE pid = ?;', (row['pid'],))
+        count += 1
+
+    return count
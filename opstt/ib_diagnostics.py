@@ -33,13 +33,226 @@ from .nlog import vlog,die_now,to_hex,is_ascii
 import re
 import os
 import csv
+import io
+import mmap
 from . import cluster_info
 from . import sgi_cluster
 import math
+import functools
+import concurrent.futures
+try:
+    import numpy
+except ImportError: #optional: vectorized counter thresholds
+    numpy = None
+
+#regex matches following:
+#'ys4618 HCA-1'(4594/1)
+#MF0;ys75ib1:SXX536/L05/U1/P2
+#ys75ib1/L05/U1/P2
+#ys46ib1:SX60XX/U1/P26
+#MF0;ca00ib1a:SXX512/S01/U1
+#'MF0;ys72ib1:SXX536/L22/U1'(395/1)
+#geyser1/H3/P1
+IB_PORTNAME_TYPE1_REGEX = re.compile(
+    r"""
+    ^\s*
+    (?:\'|)
+    (?:
+        (?P<hca_host_name>\w+)\s+			#Host name
+        [hcaHCA]+-(?P<hca_id>\d+)			#HCA number
+        |                          	
+        (?:MF0;|)					#MF0 - useless id	
+        (?P<tca_host_name>\w+)			#TCA Name
+        (?::SX\w+|)					#Switch Type
+        (?:\/[hcaHCA]{1,3}(?P<hca_id2>\d+)|)	#HCA number
+        (?:\/[lLiIdD]+(?P<leaf>\d+)|)		#Leaf (sometimes called /LID in error)
+        (?:\/S(?P<spine>\d+)|)			#Spine
+        (?:\/U(?P<unit>\d+)|)			#U number
+        (?:\/P(?P<port1>\d+)|)			#Port
+    )
+    (?:
+        (?:\'|)
+        \(
+            \d+					#LID: just assume it is wrong
+            \/
+            (?P<port2>\d+)				#Port
+        \)
+        |
+    )
+    \s*$
+    """,
+    re.VERBOSE
+)
+
+#regex matches following: (mlnx default format if unlabeled)
+#Sguid/Nguid/Pport
+#S7cfe900300bdf570/N7cfe900300bdf570/P28
+#S248a0703003f1932/U/P1
+IB_PORTNAME_TYPE3_REGEX = re.compile(
+    r"""
+    ^\s*
+    S(?P<guid>[a-f0-9]*)  
+    (
+        \/
+        N[a-f0-9]*
+        |
+        \/U
+    )
+    (|
+        /P(?P<port>[0-9]*?)
+    )$
+    """,
+    re.VERBOSE
+)
+
+#regex matches following: (these are usually from human entry)
+#ys70ib1 L05 P12
+#ys22ib1 P13
+#ys2324 HCA-1
+#geyser01 HCA-1 P3
+IB_PORTNAME_TYPE2_REGEX = re.compile(
+    r"""
+    ^\s*
+    (?P<name>\w+)			#name
+    (?:
+        (?:\s+
+        [hcaHCA]+(?:-|)(?P<hca>\d+)	#hca id
+        )
+        |
+    )
+    (?:\s+
+        [lLiIdD]+			
+        (?P<leaf>\d+)			#leaf (called lid in error)
+        |
+    )	
+    (?:\s+U\d+|)			#/U useless
+    (?:
+        (?:\s+[pP](?P<port>\d+))	#port number
+        |
+        )
+    \s*$
+    """,
+    re.VERBOSE
+)
+
+def guid_to_int ( guid ):
+    """ convert guid (hex string or integer) to integer or None if invalid """
+    if guid is None or isinstance(guid, int):
+        return guid
+    try:
+        return int(guid, 16)
+    except (TypeError, ValueError):
+        return None
+
+class Port ( object ):
+    """ Parsed IB port
+
+    Compact record used in place of a dictionary per port. Only the fields
+    used by the parsers and bcl are kept and the guid is stored as an integer.
+    Dictionary style access still works: port['guid'] returns the guid as a
+    0x prefixed hex string, 'SN' in port is only true once SN has been set and
+    update() silently drops any field that is not kept.
+    """
+
+    #always defined (None if unknown)
+    FIELDS = (
+        'name', 'hca', 'leaf', 'spine', 'port', 'guid', 
+        'lid', 'type', 'speed', 'width', 'connection'
+    )
+    #only defined once set by a parser (or bcl)
+    OPTIONAL_FIELDS = ('SN', 'PN', 'LengthDesc', 'PortPhyState', 'PortState', 'cable_id')
+
+    __slots__ = FIELDS + OPTIONAL_FIELDS
+    _KEYS = frozenset(FIELDS + OPTIONAL_FIELDS)
+
+    def __init__ ( self, name = None, hca = None, leaf = None, spine = None, port = None, guid = None ):
+        self.name = name
+        self.hca = hca
+        self.leaf = leaf
+        self.spine = spine
+        self.port = port
+        self.guid = guid_to_int(guid)
+        self.lid = None
+        self.type = None
+        self.speed = None
+        self.width = None
+        self.connection = None
+
+    def __getitem__ ( self, key ):
+        if not key in self._KEYS:
+            raise KeyError(key)
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+        if key == 'guid' and value is not None:
+            return '0x%016x' % (value)
+        return value
+
+    def __setitem__ ( self, key, value ):
+        if not key in self._KEYS:
+            raise KeyError(key)
+        if key == 'guid':
+            value = guid_to_int(value)
+        setattr(self, key, value)
+
+    def __contains__ ( self, key ):
+        return key in self._KEYS and hasattr(self, key)
+
+    def __iter__ ( self ):
+        return iter(self.keys())
+
+    def __repr__ ( self ):
+        return 'Port(%s)' % (port_pretty(self))
+
+    def __getstate__ ( self ):
+        """ compact pickle state: values of FIELDS and dictionary of set optional fields """
+        return (
+            tuple(getattr(self, key) for key in self.FIELDS),
+            dict((key, getattr(self, key)) for key in self.OPTIONAL_FIELDS if hasattr(self, key))
+        )
+
+    def __setstate__ ( self, state ):
+        values, optional = state
+        for key, value in zip(self.FIELDS, values):
+            setattr(self, key, value)
+        for key, value in optional.items():
+            setattr(self, key, value)
+
+    def get ( self, key, default = None ):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys ( self ):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items ( self ):
+        return [(key, self[key]) for key in self.keys()]
+
+    def update ( self, values ):
+        """ update port from dictionary (or Port) ignoring fields that are not kept """
+        for key, value in values.items():
+            if key in self._KEYS:
+                self[key] = value
+
+    def copy ( self ):
+        port = Port()
+        for key in self.keys():
+            setattr(port, key, getattr(self, key))
+        return port
+
+PARSE_PORT_CACHE_SIZE = 65536
+""" maximum number of distinct port labels remembered by parse_port() """
 
 def parse_port ( label ):
     """ Parse the name of a IB port 
-    returns dictionary with parsed values
+    returns new Port with parsed values
+
+    Parsed labels are memoized (see parse_port_cache_info()) since the same 
+    switch names repeat for every port of the switch.
 
     Known Formats:
         'ys4618 HCA-1'(4594/1)
@@ -55,6 +268,21 @@ def parse_port ( label ):
         ys2324 HCA-1
         geyser01 HCA-1 P3
 
+    """
+    return Port(*_parse_port_cached(label))
+
+def parse_port_cache_info ():
+    """ return (hits, misses, maxsize, currsize) of the parse_port() cache """
+    return _parse_port_cached.cache_info()
+
+def parse_port_cache_clear ():
+    """ forget every memoized parse_port() label """
+    _parse_port_cached.cache_clear()
+
+@functools.lru_cache(maxsize=PARSE_PORT_CACHE_SIZE)
+def _parse_port_cached ( label ):
+    """ Parse the name of a IB port (memoized)
+    returns tuple of (name, hca, leaf, spine, port, guid)
     """
     name  = None
     hca   = None
@@ -64,47 +292,7 @@ def parse_port ( label ):
     guid  = None   
     unit  = None #chip unit or hca count
 
-    #regex matches following:
-    #'ys4618 HCA-1'(4594/1)
-    #'ys4618 HCA-1'(4594/1)
-    #MF0;ys75ib1:SXX536/L05/U1/P2
-    #ys75ib1/L05/U1/P2
-    #ys46ib1:SX60XX/U1/P26
-    #MF0;ca00ib1a:SXX512/S01/U1
-    #'MF0;ys72ib1:SXX536/L22/U1'(395/1)
-    #geyser1/H3/P1
-    ib_portname_type1_regex = re.compile(
-                r"""
-                ^\s*
-                (?:\'|)
-                (?:
-                    (?P<hca_host_name>\w+)\s+			#Host name
-                    [hcaHCA]+-(?P<hca_id>\d+)			#HCA number
-                    |                          	
-                    (?:MF0;|)					#MF0 - useless id	
-                    (?P<tca_host_name>\w+)			#TCA Name
-                    (?::SX\w+|)					#Switch Type
-                    (?:\/[hcaHCA]{1,3}(?P<hca_id2>\d+)|)	#HCA number
-                    (?:\/[lLiIdD]+(?P<leaf>\d+)|)		#Leaf (sometimes called /LID in error)
-                    (?:\/S(?P<spine>\d+)|)			#Spine
-                    (?:\/U(?P<unit>\d+)|)			#U number
-                    (?:\/P(?P<port1>\d+)|)			#Port
-                )
-                (?:
-                    (?:\'|)
-                    \(
-                        \d+					#LID: just assume it is wrong
-                        \/
-                        (?P<port2>\d+)				#Port
-                    \)
-                    |
-                )
-                \s*$
-                """,
-                re.VERBOSE
-                ) 
-
-    match = ib_portname_type1_regex.match(label)
+    match = IB_PORTNAME_TYPE1_REGEX.match(label)
     if match:
         vlog(6,'matched: %s' % match.group())
         if match.group('hca_host_name'):
@@ -122,27 +310,7 @@ def parse_port ( label ):
         if match.group('port2'):
             port = match.group('port2')
     else:
-        #regex matches following: (mlnx default format if unlabeled)
-        #Sguid/Nguid/Pport
-        #S7cfe900300bdf570/N7cfe900300bdf570/P28
-        #S248a0703003f1932/U/P1
-        ib_portname_type3_regex = re.compile(
-                    r"""
-                    ^\s*
-                    S(?P<guid>[a-f0-9]*)  
-                    (
-                        \/
-                        N[a-f0-9]*
-                        |
-                        \/U
-                    )
-                    (|
-                        /P(?P<port>[0-9]*?)
-                    )$
-                    """,
-                    re.VERBOSE
-                    ) 
-        match = ib_portname_type3_regex.match(label) 
+        match = IB_PORTNAME_TYPE3_REGEX.match(label) 
         if match:
             guid = '0x{0}'.format(match.group('guid'))
             name = guid
@@ -151,36 +319,7 @@ def parse_port ( label ):
 
             vlog(5, 'matched: %s GUID=%s Port=%s' % (match.group(), guid, port))
         else:
-            #regex matches following: (these are usually from human entry)
-            #ys70ib1 L05 P12
-            #ys22ib1 P13 
-            #ys2324 HCA-1
-            #geyser01 HCA-1 P3
-            ib_portname_type2_regex = re.compile(
-                        r"""
-                        ^\s*
-                        (?P<name>\w+)			#name
-                        (?:
-                            (?:\s+
-                            [hcaHCA]+(?:-|)(?P<hca>\d+)	#hca id
-                            )
-                            |
-                        )
-                        (?:\s+
-                            [lLiIdD]+			
-                            (?P<leaf>\d+)			#leaf (called lid in error)
-                            |
-                        )	
-                        (?:\s+U\d+|)			#/U useless
-                        (?:
-                            (?:\s+[pP](?P<port>\d+))	#port number
-                            |
-                            )
-                        \s*$
-                        """,
-                        re.VERBOSE
-                        ) 
-            match = ib_portname_type2_regex.match(label)
+            match = IB_PORTNAME_TYPE2_REGEX.match(label)
             if match:
                 vlog(5, 'matched: %s' % match.group())
                 name = match.group('name')
@@ -191,81 +330,206 @@ def parse_port ( label ):
                 vlog(6, 'unable to parse: %s' % (label))
                 name = label
 
-    return {
-                'name'	: name,
-                'hca'	: hca,
-                'leaf'	: leaf,
-                'spine'	: spine,
-                'port'	: port,
-                'connection' : None,
-                'dumped' : False,
-                'serial' : None,
-                'length' : None,
-                'partnumber' : None,
-                'guid' : guid,
-                'type' : None,
-                'speed' : None,
-                'width' : None,
-                'lid' : None
-            }
+    return (name, hca, leaf, spine, port, guid)
+
+class _Missing ( object ):
+    """ placeholder for label fields that are not defined in a port """
+    def __reduce__ ( self ):
+        #unpickle as the same module level placeholder
+        return '_MISSING'
+
+_MISSING = _Missing()
+
+def _guid_key ( port ):
+    """ return (integer guid, integer port) index key for port or None """
+    try:
+        if isinstance(port, Port):
+            if port.guid is None:
+                return None
+            return (port.guid, int(port.port))
+        return (int(port['guid'], 16), int(port['port']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _lid_key ( port ):
+    """ return (lid, port) index key for port or None """
+    try:
+        return (port['lid'], port['port'])
+    except (KeyError, TypeError):
+        return None
+
+def _label_key ( port ):
+    """ return (name, integer port, hca, leaf, spine) index key for port or None """
+    try:
+        return (port['name'], int(port['port'])) + tuple(
+            port[key] if key in port else _MISSING for key in ['hca', 'leaf', 'spine']
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class PortRegistry ( object ):
+    """ Ordered collection of parsed IB ports with hash indexes
+
+    Ports are kept in insertion order (same as the bare ports list) while
+    dictionary indexes keyed by (guid, port) and by (name, port, hca, leaf, spine)
+    allow resolving a port without scanning every known port. Lookups return
+    the first port in list order to match the results of a linear scan.
+    A (lid, port) index is kept for duplicate detection while registering cables.
+    """
+
+    def __init__ ( self, ports = None ):
+        self._ports = []
+        #id(port) -> position in list
+        self._position = {}
+        #id(port) -> index keys currently assigned to port
+        self._keys = {}
+        self._guid_index = {}
+        self._label_index = {}
+        self._lid_index = {}
+
+        if ports:
+            self.extend(ports)
+
+    def __iter__ ( self ):
+        return iter(self._ports)
+
+    def __len__ ( self ):
+        return len(self._ports)
+
+    def __getitem__ ( self, i ):
+        return self._ports[i]
+
+    def __getstate__ ( self ):
+        #id() keys are replaced by list positions
+        return (
+            self._ports, 
+            [self._keys[id(port)] for port in self._ports],
+            self._guid_index,
+            self._label_index,
+            self._lid_index
+        )
+
+    def __setstate__ ( self, state ):
+        self._ports, keys, self._guid_index, self._label_index, self._lid_index = state
+        self._position = dict((id(port), i) for i, port in enumerate(self._ports))
+        self._keys = dict((id(port), key) for port, key in zip(self._ports, keys))
+
+    def _add_key ( self, index, key, port ):
+        """ add port to index bucket while keeping list order """
+        if key is None:
+            return
+
+        bucket = index.setdefault(key, [])
+        bucket.append(port)
+        if len(bucket) > 1:
+            bucket.sort(key=lambda p: self._position[id(p)])
+
+    def _del_key ( self, index, key, port ):
+        """ remove port from index bucket """
+        if key is None:
+            return
+
+        bucket = index[key]
+        bucket.remove(port)
+        if not bucket:
+            del index[key]
+
+    def _index ( self, port ):
+        keys = (_guid_key(port), _label_key(port), _lid_key(port))
+        self._keys[id(port)] = keys
+        self._add_key(self._guid_index, keys[0], port)
+        self._add_key(self._label_index, keys[1], port)
+        self._add_key(self._lid_index, keys[2], port)
+
+    def _unindex ( self, port ):
+        keys = self._keys.pop(id(port))
+        self._del_key(self._guid_index, keys[0], port)
+        self._del_key(self._label_index, keys[1], port)
+        self._del_key(self._lid_index, keys[2], port)
+
+    def append ( self, port ):
+        """ add port to end of registry """
+        self._position[id(port)] = len(self._ports)
+        self._ports.append(port)
+        self._index(port)
+
+    def extend ( self, ports ):
+        for port in ports:
+            self.append(port)
+
+    def update_port ( self, pport, values ):
+        """ update registered port pport with values and reindex it """
+        self._unindex(pport)
+        pport.update(values)
+        self._index(pport)
+
+    def find_by_guid ( self, port ):
+        """ find first registered port with same guid and port number """
+        bucket = self._guid_index.get(_guid_key(port))
+        return bucket[0] if bucket else None
+
+    def find_by_label ( self, port ):
+        """ find first registered port with same name, port number, hca, leaf and spine """
+        bucket = self._label_index.get(_label_key(port))
+        return bucket[0] if bucket else None
+
+    def has_lid_port ( self, port ):
+        """ check if a port with the same lid and port number is registered """
+        return _lid_key(port) in self._lid_index
 
 def register_cable ( ports, port1, port2 ):
     """ add cable ports to ports list (for now). port2 can be None for unconnected ports. """
 
+    registry = ports if isinstance(ports, PortRegistry) else PortRegistry(ports)
+
     #check for and ignore dups
-    for port in ports:
-        if  (
-                port['lid']    == port1['lid'] and
-                port['port']    == port1['port']
-            ) or ( port2 and (
-                port['lid']    == port2['lid'] and
-                port['port']    == port2['port']
-            )):
-                return
+    if registry.has_lid_port(port1) or (port2 and registry.has_lid_port(port2)):
+        return
 
     ports.append(port1)
     if port2:
         ports.append(port2)
 
-def parse_ibnetdiscover_cables ( ports, contents ):
-
-    vlog(4, 'parse_ibnetdiscover_cables()')
-
-    """ Parse the output of 'ibnetdiscover -p' 
-
-    Two types of line formats:
-    CA    44  1 0x0002c9030045f121 4x FDR - SW     2 17 0x0002c903006e1430 ( 'localhost HCA-1' - 'MF0;js01ib2:SX60XX/U1' )
-    SW     2 19 0x0002c903006e1430 4x SDR                                    'MF0;js01ib2:SX60XX/U1'
-    SW    82 19 0x7cfe900300bdf4f0 4x ???                                    'r1i0s0 SW1'
-
+#Two types of line formats:
+#CA    44  1 0x0002c9030045f121 4x FDR - SW     2 17 0x0002c903006e1430 ( 'localhost HCA-1' - 'MF0;js01ib2:SX60XX/U1' )
+#SW     2 19 0x0002c903006e1430 4x SDR                                    'MF0;js01ib2:SX60XX/U1'
+#SW    82 19 0x7cfe900300bdf4f0 4x ???                                    'r1i0s0 SW1'
+IBNETDISCOVER_CABLE_REGEX = re.compile(
+        r"""
+        ^(?P<HCA1_type>CA|SW)\s+		#HCA1 type
+        (?P<HCA1_lid>\d+)\s+		#HCA1 LID
+        (?P<HCA1_port>\d+)\s+		#HCA1 Port
+        (?P<HCA1_guid>0x\w+)\s+		#HCA1 GUID
+        (?P<width>\w+)\s+			#Cable Width
+        (?P<speed>\w+|\?\?\?)\s+	        #Cable Speed
+        (
+            \'(?P<HCA_name>.+)\'		#Port Name
+            |				#cable is connected
+            -\s+		
+            (?P<HCA2_type>CA|SW)\s+		#HCA2 Type
+            (?P<HCA2_lid>\d+)\s+		#HCA2 LID
+            (?P<HCA2_port>\d+)\s+		#HCA2 Port
+            (?P<HCA2_guid>0x\w+)\s+		#HCA2 GUID
+            \(\s+
+                \'(?P<HCA1_name>.+)\'	#HCA1 Name
+                \s+-\s
+                +\'(?P<HCA2_name>.+)\'	#HCA2 Name
+            \s+\)
+        )$
+        """,
+        re.VERBOSE
+        ) 
+
+def iter_ibnetdiscover_cables ( lines ):
+    """ Parse the output of 'ibnetdiscover -p' one line at a time 
+    lines: iterable of lines (such as an open file)
+    yields (port1, port2) per cable found. port2 is None for unconnected ports.
     """
-    ibcable_regex = re.compile(
-            r"""
-            ^(?P<HCA1_type>CA|SW)\s+		#HCA1 type
-            (?P<HCA1_lid>\d+)\s+		#HCA1 LID
-            (?P<HCA1_port>\d+)\s+		#HCA1 Port
-            (?P<HCA1_guid>0x\w+)\s+		#HCA1 GUID
-            (?P<width>\w+)\s+			#Cable Width
-            (?P<speed>\w+|\?\?\?)\s+	        #Cable Speed
-            (
-                \'(?P<HCA_name>.+)\'		#Port Name
-                |				#cable is connected
-                -\s+		
-                (?P<HCA2_type>CA|SW)\s+		#HCA2 Type
-                (?P<HCA2_lid>\d+)\s+		#HCA2 LID
-                (?P<HCA2_port>\d+)\s+		#HCA2 Port
-                (?P<HCA2_guid>0x\w+)\s+		#HCA2 GUID
-                \(\s+
-                    \'(?P<HCA1_name>.+)\'	#HCA1 Name
-                    \s+-\s
-                    +\'(?P<HCA2_name>.+)\'	#HCA2 Name
-                \s+\)
-            )$
-            """,
-            re.VERBOSE
-            ) 
-    for line in contents.split(os.linesep):
-        match = ibcable_regex.match(line)
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+
+        match = IBNETDISCOVER_CABLE_REGEX.match(line)
         if match:
             if match.group('HCA_name'):
                 port = parse_port(match.group('HCA_name'))
@@ -276,7 +540,7 @@ def parse_ibnetdiscover_cables ( ports, contents ):
                 port['speed'] = match.group('speed')
                 port['width'] = match.group('width')
                 port['connection'] = None
-                register_cable(ports, port, None)
+                yield (port, None)
                 #vlog(5, port)
             else:
                 port1 = parse_port(match.group('HCA1_name'))
@@ -301,11 +565,23 @@ def parse_ibnetdiscover_cables ( ports, contents ):
                 #cross reference connecting port
                 port1['connection'] = port2
                 port2['connection'] = port1
-                register_cable(ports, port1, port2)
+                yield (port1, port2)
         else:
             if line != "":
                 vlog(3, 'Parse fail: %s' % line )
 
+def parse_ibnetdiscover_cables ( ports, contents ):
+    """ Parse the output of 'ibnetdiscover -p' into ports 
+    contents: string or file object to stream lines from
+    """
+    vlog(4, 'parse_ibnetdiscover_cables()')
+
+    if isinstance(contents, str):
+        contents = contents.split(os.linesep)
+
+    for port1, port2 in iter_ibnetdiscover_cables(contents):
+        register_cable(ports, port1, port2)
+
 def msg_port_pretty_long ( port, why ): 
     """ msg port label with helpful info"""
     vlog(1,'%s: %s SPEED=%s LID=%s GUID=%s SN=%s PN=%s' % (
@@ -323,7 +599,7 @@ def port_name_pretty ( port ):
     """ return pretty port name """
     if not port:
         return 'None'
-    if not isinstance(port, dict):
+    if not isinstance(port, (dict, Port)):
         name = port
     else:
         name = port['name']
@@ -412,9 +688,19 @@ def find_underperforming_cables ( ports, issues, speed, width = "4x"):
 
 def parse_sgi_ibcv2 ( ports, issues, contents ):
     """ Parse the useful output of SGI's ibcv2 tool """
+    vlog(4, 'parse_sgi_ibcv2()')
+
+    for issue, queries in iter_sgi_ibcv2_records(contents):
+        issue['ports'] = _resolve_record_ports(ports, queries)
+        issues.append(issue)
+
+def iter_sgi_ibcv2_records ( contents ):
+    """ Tokenize the output of SGI's ibcv2 tool without resolving ports
+    yields (issue, port queries) 
+    """
 
     def parse(label):
-        """ Parse the ibcv2 specific label names """
+        """ Parse the ibcv2 specific label names into port query """
         vlog(5, 'parse_sgi_ibcv2::parse(%s)' % (label))
 
 
@@ -426,19 +712,17 @@ def parse_sgi_ibcv2 ( ports, issues, contents ):
         vlog(4, 'parse %s -> %s' % (label, sgi_cluster.print_label(p, 'simple')))
         
         if p and 'port' in p and not p['port'] is None:        
-            return resolve_port(ports, {
+            return {
                 'name': sgi_cluster.print_label(p, 'firmware_name'),
                 'port': int(p['port']),
                 'hca': None,
                 'spine': None,
                 'leaf': None
-            })
+            }
         else:
             vlog(2, 'unable to parse ibcv2 port %s' % label)
             return None
 
-    vlog(4, 'parse_sgi_ibcv2()')
-
     #Errors to parse out:
     #print "NOT FOUND: $comment\n";
     #print "MISCABLE:\n";
@@ -461,213 +745,443 @@ def parse_sgi_ibcv2 ( ports, issues, contents ):
 
         if match.group('error'):
             vlog(5, 'unknown error: %s' % match.group('error'))
-            issues.append({ 
+            yield ({ 
                 'type': 'unknown',
-                'ports': [],
+                'ports': None,
                 'issue': 'Unknown Error detected',
                 'raw': match.group(1),
                 'source': 'sgi ibcv2'
-            })        
+            }, [])        
         elif match.group('missingi'): 
             p1 = '%sc0.%s' % (match.group('missingi'), match.group('missingip1'))
             p2 = '%sc1.%s' % (match.group('missingi'), match.group('missingip2'))
             vlog(5, 'missing internal cable: %s <--> %s' % (p1, p2))
-            issues.append({ 
+            yield ({ 
                 'type': 'missing',
-                'ports': [parse(p1), parse(p2)],
+                'ports': None,
                 'issue': 'Missing cable',
                 'raw': match.group(1),
                 'source': 'sgi ibcv2'
-            })   
+            }, [parse(p1), parse(p2)])   
         elif match.group('missing1'): 
             vlog(5, 'missing cable: %s <--> %s' % (match.group('missing1'), match.group('missing2')))
-            issues.append({ 
+            yield ({ 
                 'type': 'missing',
-                'ports': [parse(match.group('missing1')), parse(match.group('missing2'))],
+                'ports': None,
                 'issue': 'Missing cable',
                 'raw': match.group(1),
                 'source': 'sgi ibcv2'
-            })   
+            }, [parse(match.group('missing1')), parse(match.group('missing2'))])   
         elif match.group('found1'): 
             vlog(5, 'unexpected cable: %s <--> %s' % (match.group('found1'), match.group('found2')))
-            issues.append({ 
+            yield ({ 
                 'type': 'unexpected',
-                'ports': [parse(match.group('found1')),parse(match.group('found2'))],
+                'ports': None,
                 'issue': 'Unexpected cable',
                 'raw': match.group(1),
                 'source': 'sgi ibcv2'
-            })
+            }, [parse(match.group('found1')), parse(match.group('found2'))])
+
+IBDIAG_LINE_REGEX = re.compile(r"""
+        \s*-[^IW]-\s+	    #find all none Info and Warns
+        (?:
+            (?!lid=0x[0-9a-z]+\ dev=\d+)		#ignore the lid dumps for counters since its dup
+            (?P<msg>.*)				#extract message after type
+        )
+    """, re.VERBOSE) 
+
+#Se41d2d03004bcfb0/Ne41d2d03004bcfb0/P20 - "port_rcv_remote_physical_errors" increased during the run (difference value=1,difference allowed threshold=1)
+#r9i1n24/U1/P1 - "port_rcv_remote_physical_errors" increased during the run (difference value=117,difference allowed threshold=1)
+IBDIAG_LINE_REGEX_PORT = re.compile(r"""
+        ^\s*
+        (?P<port>\S*)
+        \s*-\s*" 
+        (?P<counter>\S*)"\s*
+        increased\ during\ the\ run\ \(difference\ value=
+        (?P<value>[0-9]*),
+    """, re.VERBOSE)  
+
+#Link: S7cfe900300a51030/N7cfe900300a51030/P28<-->ime2/U1/P1 - Unexpected actual link speed 14
+IBDIAG_LINE_REGEX_LINK = re.compile(r"""
+        ^\s*Link:\s*
+        (?P<port>\S*?)
+        (|<-->
+            (?P<port2>\S*)
+        )
+        \s*-\s*(?P<what>.*)
+    """, re.VERBOSE)  
+
+#Unassigned LFT for lid:4 Dead end at:S7cfe900300bdf4f0/N7cfe900300bdf4f0 PLFT:0
+#Error in mark route from:gs1/U1 SLID:108 to DLID:103
+#Fail to find a path from:r1i3n6/U1/1 to:r1i3n12/U1/1
+#Error in mark route from:r1i1n17/U1 SLID:46 to DLID:64
+IBDIAG_LINE_REGEX_LFT = re.compile(r"""
+        ^\s*
+        (?::\s*|)
+        (?:
+            Unassigned\ LFT\ for
+            |
+            Error\ in\ mark\ route
+            |
+            Fail\ to\ find\ a\ path
+            |
+            Error\ in\ mark\ route
+        ).*
+    """, re.VERBOSE)   
 
-def parse_ibdiagnet ( ports, issues, contents ):
-    """ Parse the output of ibdiagnet """
+#all of the stanzas start with --- or ###
+IBDIAG_STANZA_SEPARATOR_REGEX = re.compile(r"^[#-]+$")
+
+def _iter_ibdiagnet_stanza_lines ( lines ):
+    """ Split ibdiagnet2.log lines into stanzas 
+    yields (label, line) for every content line outside of the Summary stanza
+    """
+    label = None
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+
+        if IBDIAG_STANZA_SEPARATOR_REGEX.match(line):
+            label = None
+            continue
+
+        if label is None:
+            if line == "":
+                continue
+            elif line[0] in '#-':
+                #stanza without a label
+                label = ""
+            else: #first real line is the label
+                label = line
+                continue
+
+        #Summary counts are ignored
+        if label != "Summary":
+            yield (label, line)
+
+#leading name token of a port label word as parse_port() would find it
+#'MF0;ys72ib1:SXX536/L22/U1'(395/1) -> ys72ib1
+PORT_WORD_NAME_REGEX = re.compile(r"^'?(?:MF0;)?(\w+)")
+#leading guid of a mellanox default port label word
+#S7cfe900300bdf570/N7cfe900300bdf570/P28 -> 7cfe900300bdf570
+PORT_WORD_GUID_REGEX = re.compile(r"^S([a-f0-9]*)/[NU]")
+
+def index_port_tokens ( ports ):
+    """ Build lookup of every registered port name and guid 
+    returns (set of names, set of integer guids)
+    """
+    names = set()
+    guids = set()
+    for port in ports:
+        names.add(port['name'])
+        key = _guid_key(port)
+        if key:
+            guids.add(key[0])
+
+    return (names, guids)
+
+def word_may_name_port ( tokens, word ):
+    """ Quick check if word could resolve to a registered port 
+    tokens: lookup from index_port_tokens()
+    returns False only if parse_resolve_port(word) can not find a port
+    """
+    names, guids = tokens
+
+    match = PORT_WORD_NAME_REGEX.match(word)
+    if match and match.group(1) in names:
+        return True
+
+    match = PORT_WORD_GUID_REGEX.match(word)
+    if match:
+        guid = '0x{0}'.format(match.group(1))
+        return guid in names or guid_to_int(guid) in guids
+
+    return False
+
+DEFAULT_COUNTER_THRESHOLDS = {
+    #ignored congestion counters in general
+    'port_rcv_switch_relay_errors': None,
+    'port_xmit_discard': None,
+    #mlnx will not honor these as symbol errors should catch issue
+    'port_rcv_remote_physical_errors': None,
+    #ignore reconnects for HCAs since they happen often for node crashes
+    'link_down_counter': 3,
+    #ignore small numbers of corruption errors
+    'port_rcv_errors': 100,
+    'symbol_error_counter': 100,
+    #ignore small numbers of control errors
+    'vl15_dropped': 100,
+    #ignore small numbers of errors
+    'error_detection_counter_lane0': 7,
+    'error_detection_counter_lane1': 7,
+    'error_detection_counter_lane2': 7,
+    'error_detection_counter_lane3': 7,
+    'unknown_block_cnt': 7,
+    'sync_header_err_cnt': 7,
+    'link_error_recovery_counter': 7,
+}
+""" counter name -> minimum increase that is reported (None: always ignored)
+    counters not listed are always reported
+"""
+
+COUNTER_PORT_TYPES = ( 'CA', 'SW' )
+""" port types (from ibnetdiscover) that can override counter thresholds """
+
+def compile_counter_thresholds ( conf = None ):
+    """ Compile counter thresholds into a single lookup table
+    conf: optional thresholds from config merged over DEFAULT_COUNTER_THRESHOLDS:
+        { "counter": minimum or null, "CA": { "counter": minimum or null }, "SW": {...} }
+    returns { (port type or None, counter): minimum or None }
+    """
+    base = dict(DEFAULT_COUNTER_THRESHOLDS)
+    overrides = dict((ptype, {}) for ptype in COUNTER_PORT_TYPES)
+
+    def add(table, counter, minimum):
+        if minimum is not None and not isinstance(minimum, int):
+            vlog(1, 'ignoring invalid counter threshold %s: %s' % (counter, minimum))
+        else:
+            table[counter] = minimum
+
+    for key, value in (conf or {}).items():
+        if key in COUNTER_PORT_TYPES:
+            for counter, minimum in value.items():
+                add(overrides[key], counter, minimum)
+        else:
+            add(base, key, value)
+
+    table = {}
+    for ptype in (None,) + COUNTER_PORT_TYPES:
+        for counter, minimum in base.items():
+            table[(ptype, counter)] = minimum
+        if ptype:
+            for counter, minimum in overrides[ptype].items():
+                table[(ptype, counter)] = minimum
+
+    return table
+
+COUNTER_THRESHOLDS = compile_counter_thresholds()
+""" default compiled counter thresholds """
+
+def _port_type ( port ):
+    """ port type used for counter thresholds (None if unknown) """
+    if not port:
+        return None
+    ptype = port.get('type')
+    return ptype if ptype in COUNTER_PORT_TYPES else None
+
+def counter_ignored ( thresholds, ptype, counter, value ):
+    """ check if counter increase is below the threshold for the port type """
+    minimum = thresholds.get((ptype, counter), 0)
+    return minimum is None or value < minimum
+
+def counters_reported ( thresholds, counters ):
+    """ Check a list of (port type, counter, value) against thresholds 
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    returns list of True for every counter that should be reported
+    """
+    if thresholds is None:
+        thresholds = COUNTER_THRESHOLDS
+
+    if numpy is None or not counters:
+        return [not counter_ignored(thresholds, *counter) for counter in counters]
+
+    #only look up every distinct (port type, counter) once
+    keys = {}
+    codes = numpy.fromiter(
+        (keys.setdefault((ptype, counter), len(keys)) for ptype, counter, value in counters),
+        dtype = numpy.intp,
+        count = len(counters)
+    )
+    minimums = numpy.empty(len(keys))
+    for key, code in keys.items():
+        minimum = thresholds.get(key, 0)
+        minimums[code] = numpy.inf if minimum is None else minimum
+
+    values = numpy.fromiter((value for ptype, counter, value in counters), dtype = numpy.float64, count = len(counters))
+    return (values >= minimums[codes]).tolist()
+
+def _ibdiagnet_record ( label, line ):
+    """ Tokenize single line of an ibdiagnet2.log stanza without resolving ports
+    returns record (issue, port labels, message to search for ports, (counter, value)) 
+        or None if line is not an issue
+        issue['ports'] is filled in by _resolve_ibdiagnet_record()
+        counter thresholds are checked after the port (and its type) is resolved
+    """
+    lmatch = IBDIAG_LINE_REGEX.match(line)
+    if not lmatch:
+        return None
+
+    vlog(4,'IBDiagnet2: %s: %s' % (label, lmatch.group('msg')))
+
+    cmatch = IBDIAG_LINE_REGEX_PORT.match(lmatch.group('msg'))
+    lnmatch = IBDIAG_LINE_REGEX_LINK.match(lmatch.group('msg'))
+    lftmatch = IBDIAG_LINE_REGEX_LFT.match(lmatch.group('msg'))
+    if cmatch:
+        value = cmatch.group('value')
+        return ({ 
+            'type': 'counters',
+            'ports': None,
+            'issue': 'Counter %s increased to %s' % (cmatch.group('counter'), value),
+            'raw': cmatch.string,
+            'source': 'ibdiagnet2.log'
+        }, [cmatch.group('port')], None, (cmatch.group('counter'), int(value) if value else 0))
+    elif lnmatch:
+        return ({ 
+            'type': 'link',
+            'ports': None,
+            'issue': lnmatch.group('what'),
+            'raw': lnmatch.string,
+            'source': 'ibdiagnet2.log'
+        }, [lnmatch.group('port'), lnmatch.group('port2') or None], None, None)
+    elif lftmatch:
+        return ({ 
+            'type': 'lft',
+            'ports': None,
+            'issue': 'LFT Error',
+            'raw': lmatch.group('msg'),
+            'source': 'ibdiagnet2.log'
+        }, [], None, None)
+    else:
+        if not str(lmatch.group('msg')) in [
+                'Ports counters value Check finished with errors',
+                'Ports counters Difference Check (during run) finished with errors',
+                'Links Speed Check finished with errors',
+                'Links Check finished with errors',
+                'Links Width Check finished with errors',
+                'Fabric Discover finished with errors',
+                'Alias GUIDs finished with errors',
+                'Partition Keys finished with errors'
+            ]:
+
+            vlog(4,'IBDiagnet2 unknown: %s: %s' % (label, lmatch.group('msg')))
+
+            return ({ 
+                'type': 'unknown',
+                'ports': None,
+                'issue': '%s: %s' % (label, lmatch.group('msg')),  
+                'raw': lmatch.string,
+                'source': 'ibdiagnet2.log'
+            }, None, lmatch.group('msg'), None)
+
+    return None
+
+def _resolve_record_ports ( ports, queries ):
+    """ resolve list of port labels (strings) or port dictionaries (None is left as None) """
+    return [
+        None if query is None else
+        parse_resolve_port(ports, query) if isinstance(query, str) else
+        resolve_port(ports, query)
+        for query in queries
+    ]
+
+def _resolve_ibdiagnet_record ( ports, record, tokens = None, resolved = None ):
+    """ Resolve the ports of a record from _ibdiagnet_record()
+    tokens: optional index_port_tokens() lookup to skip words that are not ports
+    resolved: optional dictionary to memoize ports found in unknown messages
+    returns issue
+    """
+    issue, queries, msg, counter = record
+
+    if msg is None:
+        issue['ports'] = _resolve_record_ports(ports, queries)
+        return issue
+
+    if resolved is not None and msg in resolved:
+        port1, port2 = resolved[msg]
+    else:
+        port1 = None
+        port2 = None
+
+        #attempt to brute force resolve a port from each word
+        for w in msg.split():
+            if tokens and not word_may_name_port(tokens, w):
+                continue
+
+            port = parse_resolve_port(ports, w)
+            if port:
+                if not port1:
+                    port1 = port
+                elif not port2:
+                    port2 = port
+                    break
+
+        if resolved is not None:
+            resolved[msg] = (port1, port2)
+
+    issue['ports'] = [port1, port2]
+    return issue
+
+def iter_ibdiagnet_records ( lines ):
+    """ Tokenize ibdiagnet2.log one line at a time without resolving ports
+    yields records for _resolve_ibdiagnet_record()
+    """
+    for label, line in _iter_ibdiagnet_stanza_lines(lines):
+        record = _ibdiagnet_record(label, line)
+        if record:
+            yield record
+
+def resolve_ibdiagnet_records ( ports, records, thresholds = None ):
+    """ Resolve every record of an ibdiagnet2.log 
+    Counter thresholds are checked for all of the counters in one pass 
+    (vectorized when numpy is available).
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    returns list of issues
+    """
+    tokens = index_port_tokens(ports)
+    resolved = {}
+
+    issues = []
+    counters = []
+    positions = []
+    for record in records:
+        issue = _resolve_ibdiagnet_record(ports, record, tokens, resolved)
+        if record[3]:
+            positions.append(len(issues))
+            counters.append((_port_type(issue['ports'][0]),) + record[3])
+        issues.append(issue)
+
+    ignored = set()
+    for i, counter, reported in zip(positions, counters, counters_reported(thresholds, counters)):
+        if not reported:
+            vlog(4, 'ignoring counter %s with %s' % (counter[1], counter[2]))
+            ignored.add(i)
+
+    return [issue for i, issue in enumerate(issues) if not i in ignored]
+
+def iter_ibdiagnet ( ports, lines, thresholds = None ):
+    """ Parse the output of ibdiagnet (ibdiagnet2.log) one line at a time 
+    lines: iterable of lines (such as an open file)
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    yields issues as they are found
+    """
+    if thresholds is None:
+        thresholds = COUNTER_THRESHOLDS
+
+    tokens = index_port_tokens(ports)
+    resolved = {}
+
+    for record in iter_ibdiagnet_records(lines):
+        issue = _resolve_ibdiagnet_record(ports, record, tokens, resolved)
+        if record[3]:
+            counter, value = record[3]
+            if counter_ignored(thresholds, _port_type(issue['ports'][0]), counter, value):
+                vlog(4, 'ignoring counter %s with %s' % (counter, value))
+                continue
+        yield issue
+
+def parse_ibdiagnet ( ports, issues, contents, thresholds = None ):
+    """ Parse the output of ibdiagnet 
+    contents: string or file object to stream lines from
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    issues are appended as they are found (see iter_ibdiagnet())
+    """
 
     vlog(4, 'parse_ibdiagnet()')
 
-    ibdiag_line_regex = re.compile(r"""
-            \s*-[^IW]-\s+	    #find all none Info and Warns
-            (?:
-                (?!lid=0x[0-9a-z]+\ dev=\d+)		#ignore the lid dumps for counters since its dup
-                (?P<msg>.*)				#extract message after type
-            )
-        """, re.VERBOSE) 
-
-    #Se41d2d03004bcfb0/Ne41d2d03004bcfb0/P20 - "port_rcv_remote_physical_errors" increased during the run (difference value=1,difference allowed threshold=1)
-    #r9i1n24/U1/P1 - "port_rcv_remote_physical_errors" increased during the run (difference value=117,difference allowed threshold=1)
-    ibdiag_line_regex_port = re.compile(r"""
-            ^\s*
-            (?P<port>\S*)
-            \s*-\s*" 
-            (?P<counter>\S*)"\s*
-            increased\ during\ the\ run\ \(difference\ value=
-            (?P<value>[0-9]*),
-        """, re.VERBOSE)  
-    #Link: S7cfe900300a51030/N7cfe900300a51030/P28<-->ime2/U1/P1 - Unexpected actual link speed 14
-    ibdiag_line_regex_link = re.compile(r"""
-            ^\s*Link:\s*
-            (?P<port>\S*?)
-            (|<-->
-                (?P<port2>\S*)
-            )
-            \s*-\s*(?P<what>.*)
-        """, re.VERBOSE)  
-
-    #Unassigned LFT for lid:4 Dead end at:S7cfe900300bdf4f0/N7cfe900300bdf4f0 PLFT:0
-    #Error in mark route from:gs1/U1 SLID:108 to DLID:103
-    #Fail to find a path from:r1i3n6/U1/1 to:r1i3n12/U1/1
-    #Error in mark route from:r1i1n17/U1 SLID:46 to DLID:64
-    ibdiag_line_regex_lft = re.compile(r"""
-            ^\s*
-            (?::\s*|)
-            (?:
-                Unassigned\ LFT\ for
-                |
-                Error\ in\ mark\ route
-                |
-                Fail\ to\ find\ a\ path
-                |
-                Error\ in\ mark\ route
-            ).*
-        """, re.VERBOSE)   
-    for match in re.finditer(r"""
-        (?![#-]+[\n\r])[\r\n]*		#all of the stanzas start with --- or ###
-        (?P<label>(?![#-]+).*)[\r\n]+   #first real line is the label
-        (?P<content>			#content follows label
-            (?:
-                (?![#-]+[\n\r])		#make sure not to run into next stanza
-                .*[\r\n]*		#suck in the ws
-            )+
-        )
-        """, contents, re.VERBOSE):
+    if isinstance(contents, str):
+        contents = contents.split("\n")
 
-       #Look for summary to extract to ignore it
-       if match.group('label') == "Summary":
-           for line in match.group('content').split("\n"):
-               if line == "": #stop at end of the summary count stanza
-                   break
-       else: #stanza containing detail information
-           for line in match.group('content').split("\n"):
-               lmatch = ibdiag_line_regex.match(line)
-               if lmatch:
-                   vlog(4,'IBDiagnet2: %s: %s' % (match.group('label'), lmatch.group('msg')))
-
-                   cmatch = ibdiag_line_regex_port.match(lmatch.group('msg'))
-                   lnmatch = ibdiag_line_regex_link.match(lmatch.group('msg'))
-                   lftmatch = ibdiag_line_regex_lft.match(lmatch.group('msg'))
-                   if cmatch:
-                       port = parse_resolve_port(ports, cmatch.group('port'))
-
-                       if (
-                               str(cmatch.group('counter')) in [ 
-                                   #ignored congestion counters  in general
-                                   'port_rcv_switch_relay_errors', 
-                                   'port_xmit_discard',
-                                   'port_rcv_remote_physical_errors' #mlnx will not honor these as symbol errors should catch issue
-                               ] or
-                               ( #ignore reconnects for HCAs since they happen often for node crashes
-                                   cmatch.group('counter') == 'link_down_counter' and int(cmatch.group('value')) < 3
-                               )  or
-                               ( #ignore small numbers of corruption errors
-                                   str(cmatch.group('counter')) in [ 'port_rcv_errors', 'symbol_error_counter' ] and
-                                   int(cmatch.group('value')) < 100
-                               )   or
-                               ( #ignore small numbers of control errors
-                                   str(cmatch.group('counter')) in [ 'vl15_dropped' ] and
-                                   int(cmatch.group('value')) < 100
-                               )   or
-                               ( #ignore small numbers of errors
-                                   str(cmatch.group('counter')) in [ 
-                                       'error_detection_counter_lane0',
-                                       'error_detection_counter_lane1',
-                                       'error_detection_counter_lane2',
-                                       'error_detection_counter_lane3',
-                                       'unknown_block_cnt',
-                                       'sync_header_err_cnt',
-                                       'link_error_recovery_counter'
-                                   ] and
-                                   int(cmatch.group('value')) < 7
-                               ) 
-                          ):
-                               vlog(4, 'ignoring counter %s with %s' % (cmatch.group('counter'), cmatch.group('value')))
-                       else:
-                           issues.append({ 
-                               'type': 'counters',
-                               'ports': [port],
-                               'issue': 'Counter %s increased to %s' % (cmatch.group('counter'), cmatch.group('value')),
-                               'raw': cmatch.string,
-                               'source': 'ibdiagnet2.log'
-                           })    
-                   elif lnmatch:
-                       dport2 = None
-                       if lnmatch.group('port2'):
-                           dport2 = parse_resolve_port(ports, lnmatch.group('port2'))
-                       issues.append({ 
-                           'type': 'link',
-                           'ports': [parse_resolve_port(ports, lnmatch.group('port')), dport2],
-                           'issue': lnmatch.group('what'),
-                           'raw': lnmatch.string,
-                           'source': 'ibdiagnet2.log'
-                       })
-                   elif lftmatch:
-                       issues.append({ 
-                           'type': 'lft',
-                           'ports': [],
-                           'issue': 'LFT Error',
-                           'raw': lmatch.group('msg'),
-                           'source': 'ibdiagnet2.log'
-                       }) 
-                   else:
-                       if not str(lmatch.group('msg')) in [
-                                'Ports counters value Check finished with errors',
-                                'Ports counters Difference Check (during run) finished with errors',
-                                'Links Speed Check finished with errors',
-                                'Links Check finished with errors',
-                                'Links Width Check finished with errors',
-                                'Fabric Discover finished with errors',
-                                'Alias GUIDs finished with errors',
-                                'Partition Keys finished with errors'
-                            ]:
-
-                            port1 = None
-                            port2 = None
-
-                            #attempt to brute force resolve a port from each word
-                            for w in lmatch.group('msg').split():
-                                port = parse_resolve_port(ports, w)
-                                if port:
-                                    if not port1:
-                                        port1 = port
-                                    elif not port2:
-                                        port2 = port
-
-                            vlog(4,'IBDiagnet2 unknown: %s: %s' % (match.group('label'), lmatch.group('msg')))
-
-                            issues.append({ 
-                                'type': 'unknown',
-                                'ports': [port1, port2],
-                                'issue': '%s: %s' % (match.group('label'), lmatch.group('msg')),  
-                                'raw': lmatch.string,
-                                'source': 'ibdiagnet2.log'
-                            }) 
+    issues.extend(iter_ibdiagnet(ports, contents, thresholds))
 
 def sanity_check_string(issues, source, what, string, check_type = "string"):
     """ sanity check string is ascii or make issue. 
@@ -739,10 +1253,92 @@ def sanity_check_string(issues, source, what, string, check_type = "string"):
     return True
 
 
-def parse_ibdiagnet_csv ( ports, issues, fcsv ):
+IBDIAGNET_CSV_SECTIONS = ( 'START_CABLE_INFO', 'START_PORTS' )
+""" ibdiagnet2.db_csv sections used by parse_ibdiagnet_csv() """
+
+IBDIAGNET_CSV_SECTION_REGEX = re.compile(br"^START_\w+$")
+
+def index_ibdiagnet_csv ( buf ):
+    """ Find the byte offsets of every section in ibdiagnet2.db_csv 
+    buf: bytes like object (such as an mmap) of the file
+    returns list of (section name, start offset, end offset) in file order
+        start is the offset of the START_ line 
+        end is the offset after the END_ line (or end of file)
+    """
+    sections = []
+    size = len(buf)
+
+    def find_line(prefix, start):
+        """ find offset of next line starting with prefix after start or -1 """
+        if start == 0 and buf[:len(prefix)] == prefix:
+            return 0
+        i = buf.find(b'\n' + prefix, max(start - 1, 0))
+        return i if i < 0 else i + 1
+
+    #START_CABLE_INFO
+    #END_CABLE_INFO
+    pos = find_line(b'START_', 0)
+    while pos >= 0:
+        eol = buf.find(b'\n', pos)
+        if eol < 0:
+            eol = size
+
+        name = buf[pos:eol].rstrip(b'\r')
+        if IBDIAGNET_CSV_SECTION_REGEX.match(name):
+            end = find_line(b'END_', eol)
+            if end < 0:
+                end = size
+            else:
+                end = buf.find(b'\n', end)
+                end = size if end < 0 else end + 1
+
+            sections.append((name.decode('ascii'), pos, end))
+        else: #START_ with more than one field is data
+            end = eol
+
+        pos = find_line(b'START_', end) if end < size else -1
+
+    return sections
+
+def parse_ibdiagnet_csv ( ports, issues, fcsv, sections = IBDIAGNET_CSV_SECTIONS ):
     """ Parse the output of ibdiagnet ibdiagnet2.db_csv
         Limited to pulling the cable serials and state out currently
+
+        The file is memory mapped and indexed by section so only the requested 
+        sections are ever tokenized. sections=None parses every section.
+        Falls back to reading every row if fcsv can not be memory mapped.
+    """
+
+    vlog(4, 'parse_ibdiagnet_csv()')
+
+    for row in iter_ibdiagnet_csv(issues, fcsv, sections):
+        resolve_update_port(ports, row)
+
+def iter_ibdiagnet_csv ( issues, fcsv, sections = IBDIAGNET_CSV_SECTIONS ):
+    """ Tokenize ibdiagnet2.db_csv (see parse_ibdiagnet_csv())
+    yields row dictionaries to update the matching ports with
     """
+    try:
+        buf = mmap.mmap(fcsv.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, io.UnsupportedOperation, ValueError, OSError) as err:
+        vlog(5, 'unable to mmap ibdiagnet2.db_csv: %s' % (err))
+        for row in _iter_ibdiagnet_csv_rows(issues, csv.reader(fcsv)):
+            yield row
+        return
+
+    encoding = getattr(fcsv, 'encoding', None) or 'utf-8'
+    with buf:
+        for name, start, end in index_ibdiagnet_csv(buf):
+            if sections is None or name in sections:
+                vlog(5, 'parsing ibdiagnet2.db_csv section %s bytes %s-%s' % (name, start, end))
+                text = buf[start:end].decode(encoding)
+                for row in _iter_ibdiagnet_csv_rows(issues, csv.reader(text.splitlines(True))):
+                    yield row
+            else:
+                vlog(5, 'skipping ibdiagnet2.db_csv section %s' % (name))
+
+def _iter_ibdiagnet_csv_rows ( issues, csv_reader ):
+    """ Parse rows of ibdiagnet2.db_csv into port updates """
 
     def sc(field, var, ctype = "string"):
         """ quick sanity check of dict field """
@@ -751,14 +1347,9 @@ def parse_ibdiagnet_csv ( ports, issues, fcsv ):
         else:
             return True
 
-    vlog(4, 'parse_ibdiagnet_csv()')
     csv_mode=None
     csv_headers=None
 
-    #START_CABLE_INFO
-    #END_CABLE_INFO
-
-    csv_reader = csv.reader(fcsv)
     for row in csv_reader:
         if len(row) == 1 and row[0] != "" :
             if row[0].startswith('START_'):
@@ -785,7 +1376,7 @@ def parse_ibdiagnet_csv ( ports, issues, fcsv ):
                         
                            rowdict['guid'] = rowdict['PortGuid']
                            rowdict['port'] = rowdict['PortNum']
-                           resolve_update_port(ports,rowdict) 
+                           yield rowdict
 
                     elif csv_mode == 'START_PORTS':
                         if (
@@ -797,7 +1388,7 @@ def parse_ibdiagnet_csv ( ports, issues, fcsv ):
                         ):
                             rowdict['guid'] = rowdict['NodeGuid']
                             rowdict['port'] = rowdict['PortNum']
-                            resolve_update_port(ports,rowdict)
+                            yield rowdict
 
                     #elif csv_mode == 'START_LINKS':
                     #   rowdict['guid'] = rowdict['NodeGuid1']
@@ -812,6 +1403,14 @@ def parse_ibdiagnet_cables ( ports, issues, contents ):
     """ Parse the output of ibdiagnet ibdiagnet2.cables """
     vlog(4, 'parse_ibdiagnet_cables()')
 
+    for port in iter_ibdiagnet_cables(issues, contents):
+        resolve_update_port(ports, port)
+
+def iter_ibdiagnet_cables ( issues, contents ):
+    """ Tokenize ibdiagnet2.cables 
+    yields port dictionaries (with a SN) to update the matching ports with
+    """
+
     def sc(field, var, ctype = "string"):
         """ quick sanity check of dict field """
         if field in var:
@@ -819,12 +1418,9 @@ def parse_ibdiagnet_cables ( ports, issues, contents ):
         else:
             return True
 
-    def add_port(port):
-        if not 'SN' in port or not port['SN']:
-            #ignore any port that doesnt have SN
-            return
-
-        resolve_update_port(ports, port)
+    def has_sn(port):
+        #ignore any port that doesnt have SN
+        return 'SN' in port and port['SN']
 
     #-------------------------------------------------------
     #Port=2 Lid=0x02d7 GUID=0x0002c9030068eaf0 Port Name=gladei00ib1a/L02/U1/P2
@@ -862,8 +1458,8 @@ def parse_ibdiagnet_cables ( ports, issues, contents ):
         """, contents, re.VERBOSE):
 
         if match.group('port'):
-            if port:
-                add_port(port)
+            if port and has_sn(port):
+                yield port
 
             port = {
                     'port': match.group('port'),
@@ -880,9 +1476,10 @@ def parse_ibdiagnet_cables ( ports, issues, contents ):
         sc('guid', port, 'hex integer') and
         sc('SN', port) and
         sc('PN', port) and
-        sc('LengthDesc', port)
+        sc('LengthDesc', port) and
+        has_sn(port)
     ):
-        add_port(port)
+        yield port
 
 def find_cable_by_switch_leaf_port ( ports, name, leaf, port ):
     """ Checks all of the ports for any that are not at full width or speed """
@@ -894,35 +1491,28 @@ def find_cable_by_switch_leaf_port ( ports, name, leaf, port ):
     return None
 
 def resolve_port(ports, port):
-    """ Resolves out port from ports list """
+    """ Resolves out port from ports registry (or list) """
     if not port:
         vlog(4, 'unable to resolve none port')
         return None
 
+    if not isinstance(ports, PortRegistry):
+        #bare lists have to be indexed for every lookup
+        ports = PortRegistry(ports)
+
     #match by guid (preferred match)
     if 'guid' in port and port['guid'] and port['port']:
-        for pport in ports:
-            #if port['guid'] == pport['guid'] and port['port'] == pport['port']:
-            if int(port['guid'], 16) == int(pport['guid'], 16) and int(port['port']) == int(pport['port']):
-                return pport
+        pport = ports.find_by_guid(port)
+        if pport:
+            return pport
         vlog(5, 'unable to resolve port: GUID={0} PortNum={1}'.format(port['guid'], port['port']))
 
     #match by port label (flawed match if port names are not unique)
+    #hca, leaf and spine must match or be undefined in both ports
     if 'name' in port and port['name'] and port['port'] and port['name'] != "localhost":
-        for pport in ports:
-            if port['name'] == pport['name'] and int(port['port']) == int(pport['port']):
-                match = True;
-
-                for key in ['hca', 'leaf', 'spine']:
-                    if key in port and key in pport:
-                        if port[key] != pport[key]:
-                            match = False
-                    elif (key in port) != (key in pport):
-                        #defined in one and not the other?
-                        match = False
-
-                if match:
-                    return pport
+        pport = ports.find_by_label(port)
+        if pport:
+            return pport
 
         vlog(5, 'unable to resolve port: Name={0} PortNum={1} HCA={2} Leaf={3} Spine={4}'.format(
             port['name'], 
@@ -948,7 +1538,11 @@ def resolve_update_port(ports, port):
     pport = resolve_port(ports, port)
 
     if pport:
-        pport.update(port);
+        if isinstance(ports, PortRegistry):
+            #keep indexes in sync with any changed guid or label
+            ports.update_port(pport, port)
+        else:
+            pport.update(port);
     else:
         vlog(4, 'unable to resolve port and update %s' % port)
 
@@ -961,3 +1555,135 @@ def parse_resolve_port(ports, label):
         return None
 
     return resolve_port(ports, pport)
+
+DUMP_FILES = (
+    ('ibnetdiscover.log', True),
+    ('ibdiagnet2.db_csv', True),
+    ('ibdiagnet2.log', True),
+    ('ibdiagnet2.cables', False),
+    ('sgi-ibcv2.log', False),
+)
+""" (file name, required) of every dump file in the order they are parsed """
+
+def _port_record ( port ):
+    """ compact tuple of port values (without connection) """
+    if port is None:
+        return None
+    return (
+        port.name, port.hca, port.leaf, port.spine, port.port, port.guid,
+        port.lid, port.type, port.speed, port.width
+    )
+
+def _record_port ( record ):
+    """ Port from _port_record() tuple """
+    port = Port(*record[:6])
+    port.lid, port.type, port.speed, port.width = record[6:]
+    return port
+
+def _port_values ( values ):
+    """ copy of dictionary with only the values kept by Port """
+    return dict((key, value) for key, value in values.items() if key in Port._KEYS)
+
+def read_dump_file ( name, path ):
+    """ Tokenize a single dump file into records without resolving any ports
+        All of the regex and csv work is done here so it can run in another 
+        process. The records are applied with apply_dump_records().
+    name: file name from DUMP_FILES
+    path: path to file
+    returns (issues, records)
+    """
+    vlog(4, 'read_dump_file(%s)' % (path))
+
+    issues = []
+    with open(path, 'r') as fds:
+        if name == 'ibnetdiscover.log':
+            records = [
+                (_port_record(port1), _port_record(port2)) 
+                for port1, port2 in iter_ibnetdiscover_cables(fds)
+            ]
+        elif name == 'ibdiagnet2.db_csv':
+            records = [_port_values(row) for row in iter_ibdiagnet_csv(issues, fds)]
+        elif name == 'ibdiagnet2.log':
+            records = list(iter_ibdiagnet_records(fds))
+        elif name == 'ibdiagnet2.cables':
+            records = [_port_values(port) for port in iter_ibdiagnet_cables(issues, fds.read())]
+        elif name == 'sgi-ibcv2.log':
+            records = list(iter_sgi_ibcv2_records(fds.read()))
+        else:
+            raise ValueError('unknown dump file: %s' % (name))
+
+    return (issues, records)
+
+def apply_dump_records ( ports, issues, name, file_issues, records, thresholds = None ):
+    """ Merge the output of read_dump_file() into ports and issues 
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    """
+    vlog(4, 'apply_dump_records(%s)' % (name))
+
+    issues.extend(file_issues)
+
+    if name == 'ibnetdiscover.log':
+        for record1, record2 in records:
+            port1 = _record_port(record1)
+            port2 = None
+            if record2:
+                port2 = _record_port(record2)
+                #cross reference connecting port
+                port1.connection = port2
+                port2.connection = port1
+            register_cable(ports, port1, port2)
+    elif name in ('ibdiagnet2.db_csv', 'ibdiagnet2.cables'):
+        for values in records:
+            resolve_update_port(ports, values)
+    elif name == 'ibdiagnet2.log':
+        issues.extend(resolve_ibdiagnet_records(ports, records, thresholds))
+    elif name == 'sgi-ibcv2.log':
+        for issue, queries in records:
+            issue['ports'] = _resolve_record_ports(ports, queries)
+            issues.append(issue)
+    else:
+        raise ValueError('unknown dump file: %s' % (name))
+
+def _parse_dump_file ( ports, issues, name, path, thresholds = None ):
+    """ Parse a single dump file directly into ports and issues """
+    with open(path, 'r') as fds:
+        if name == 'ibnetdiscover.log':
+            parse_ibnetdiscover_cables(ports, fds)
+        elif name == 'ibdiagnet2.db_csv':
+            parse_ibdiagnet_csv(ports, issues, fds)
+        elif name == 'ibdiagnet2.log':
+            parse_ibdiagnet(ports, issues, fds, thresholds)
+        elif name == 'ibdiagnet2.cables':
+            parse_ibdiagnet_cables(ports, issues, fds.read())
+        elif name == 'sgi-ibcv2.log':
+            parse_sgi_ibcv2(ports, issues, fds.read())
+        else:
+            raise ValueError('unknown dump file: %s' % (name))
+
+def parse_dump ( ports, issues, dump_dir, jobs = None, thresholds = None ):
+    """ Parse every file of a dump directory into ports and issues 
+    jobs: number of processes used to tokenize the files in parallel.
+        The records are always merged in DUMP_FILES order so the ports 
+        and issues match parsing one file after another (jobs=None or 1).
+    thresholds: table from compile_counter_thresholds() (default COUNTER_THRESHOLDS)
+    """
+    vlog(4, 'parse_dump(%s, jobs=%s)' % (dump_dir, jobs))
+
+    files = []
+    for name, required in DUMP_FILES:
+        path = os.path.join(dump_dir, name)
+        if required or os.path.isfile(path):
+            files.append((name, path))
+
+    if not jobs or jobs < 2:
+        for name, path in files:
+            _parse_dump_file(ports, issues, name, path, thresholds)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = min(jobs, len(files))) as pool:
+        futures = [(name, pool.submit(read_dump_file, name, path)) for name, path in files]
+
+        #merge in order while later files are still being read
+        for name, future in futures:
+            file_issues, records = future.result()
+            apply_dump_records(ports, issues, name, file_issues, records, thresholds)
@@ -29,6 +29,7 @@
 #OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 #OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
 import sqlite3
+import contextlib
 from .nlog import vlog,die_now
 
 def init(database_path):
@@ -63,5 +64,201 @@ def add_column(SQL, table, column, column_type):
     SQL.execute('ALTER TABLE %s ADD %s %s;' % (table, column, column_type))
 
     return True
- 
 
+@contextlib.contextmanager
+def transaction(SQL):
+    """ Run block inside of a single explicit transaction 
+    connections from init() are in autocommit mode so every statement
+    would otherwise be its own transaction (and WAL sync).
+    Commits when block completes and rolls back on any exception.
+    Nested calls join the outer transaction.
+    """
+    if SQL.connection.in_transaction:
+        yield SQL
+        return
+
+    SQL.execute('BEGIN IMMEDIATE;')
+    try:
+        yield SQL
+    except:
+        if SQL.connection.in_transaction:
+            SQL.execute('ROLLBACK;')
+        vlog(3, 'rolled back transaction')
+        raise
+    else:
+        SQL.execute('COMMIT;')
+
+def checkpoint(SQL):
+    """ Commit the open transaction and start a new one 
+    used to split long running transactions into chunks
+    """
+    if SQL.connection.in_transaction:
+        SQL.execute('COMMIT;')
+        SQL.execute('BEGIN IMMEDIATE;')
+
+def next_autoincrement(SQL, table, column):
+    """ Get the next key sqlite will assign to an AUTOINCREMENT column 
+    only stable while a write transaction is held
+    """
+    SQL.execute('''
+        SELECT 
+            max(
+                coalesce((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                coalesce((SELECT max(%s) FROM %s), 0)
+            ) + 1 as next
+    ''' % (column, table), (table,))
+
+    for row in SQL.fetchall():
+        return int(row['next'])
+
+    return 1
+
+AUTO_VACUUM_INCREMENTAL = 2
+""" PRAGMA auto_vacuum value of incremental mode """
+
+def auto_vacuum(SQL):
+    """ Get auto vacuum mode of database (0=none 1=full 2=incremental) """
+    SQL.execute('PRAGMA auto_vacuum;')
+    for row in SQL.fetchall():
+        return int(row[0])
+
+    return 0
+
+def free_pages(SQL):
+    """ Get (free pages, total pages) of database """
+    SQL.execute('PRAGMA freelist_count;')
+    free = int(SQL.fetchone()[0])
+    SQL.execute('PRAGMA page_count;')
+    total = int(SQL.fetchone()[0])
+
+    return (free, total)
+
+def incremental_vacuum(SQL, pages):
+    """ Release up to pages free pages back to the file system 
+    requires auto_vacuum=INCREMENTAL and is a no-op otherwise
+    commits any open transaction
+    """
+    #pragma frees one page per step and execute() only steps once
+    SQL.executescript('PRAGMA incremental_vacuum(%d);' % (int(pages)))
+
+def user_version(SQL):
+    """ Get user_version of database (0 for new databases) """
+    SQL.execute('PRAGMA user_version;')
+    for row in SQL.fetchall():
+        return int(row[0])
+
+    return 0
+
+def migrate(SQL, migrations):
+    """ Apply pending numbered migrations 
+    migrations: list of (number, function(SQL)) 
+    PRAGMA user_version holds the number of the last applied migration so
+    an up to date database only costs one integer check. Every migration
+    runs in its own transaction with foreign keys disabled (see rebuild_table()).
+    must not be called inside of a transaction
+    returns user_version of database
+    """
+    version = user_version(SQL)
+    pending = sorted([ m for m in migrations if m[0] > version ], key = lambda m: m[0])
+    if not pending:
+        return version
+
+    SQL.execute('PRAGMA foreign_keys;')
+    foreign_keys = int(SQL.fetchone()[0])
+    SQL.execute('PRAGMA foreign_keys = OFF;')
+    try:
+        for number, migration in pending:
+            with transaction(SQL):
+                #another process may have applied it while we waited on the lock
+                version = user_version(SQL)
+                if number <= version:
+                    continue
+
+                migration(SQL)
+                SQL.execute('PRAGMA user_version = %d;' % (int(number)))
+
+            version = number
+            vlog(3, 'applied database migration %s' % (number))
+    finally:
+        SQL.execute('PRAGMA foreign_keys = %s;' % ('ON' if foreign_keys else 'OFF'))
+
+    return version
+
+def table_columns(SQL, table):
+    """ Get list of column names of table """
+    SQL.execute('PRAGMA table_info(%s);' % (table))
+    return [ row[1] for row in SQL.fetchall() ]
+
+def rebuild_table(SQL, table, columns, copy = None):
+    """ Rebuild table with new column definitions by copy and swap 
+    the only way to change column types or constraints in sqlite.
+    must be run inside of a migrate() migration (foreign keys disabled)
+    columns: column definitions and constraints of the rebuilt table
+    copy: dict of new column -> SQL expression against the old table row
+        columns in both tables are copied as is by default
+    indexes and triggers of table are recreated as they were
+    """
+    if not SQL.connection.in_transaction:
+        raise sqlite3.OperationalError('rebuild of %s must run inside of a transaction' % (table))
+
+    #indexes and triggers are dropped with the old table
+    SQL.execute('''
+        SELECT 
+            sql 
+        FROM 
+            sqlite_master 
+        WHERE 
+            tbl_name = ? and 
+            type IN ('index', 'trigger') and 
+            sql IS NOT NULL
+    ''', (table,))
+    schema = [ row[0] for row in SQL.fetchall() ]
+
+    #AUTOINCREMENT keys must never be reused
+    SQL.execute("SELECT name FROM sqlite_master WHERE type = 'table' and name = 'sqlite_sequence'")
+    sequence = None
+    if SQL.fetchall():
+        SQL.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+        for row in SQL.fetchall():
+            sequence = row[0]
+
+    #only fail on foreign key violations the rebuild introduced
+    SQL.execute('PRAGMA foreign_key_check(%s);' % (table))
+    violations = len(SQL.fetchall())
+
+    rebuild = '%s_rebuild' % (table)
+    SQL.execute('CREATE TABLE %s (%s);' % (rebuild, columns))
+
+    old = table_columns(SQL, table)
+    select = dict((column, column) for column in table_columns(SQL, rebuild) if column in old)
+    if copy:
+        select.update(copy)
+
+    names = list(select.keys())
+    SQL.execute('INSERT INTO %s (%s) SELECT %s FROM %s;' % (
+        rebuild,
+        ', '.join(names),
+        ', '.join([ select[name] for name in names ]),
+        table
+    ))
+
+    SQL.execute('DROP TABLE %s;' % (table))
+    #leave references to table in other triggers and foreign keys alone
+    SQL.execute('PRAGMA legacy_alter_table = ON;')
+    try:
+        SQL.execute('ALTER TABLE %s RENAME TO %s;' % (rebuild, table))
+    finally:
+        SQL.execute('PRAGMA legacy_alter_table = OFF;')
+
+    for sql in schema:
+        SQL.execute(sql)
+
+    if not sequence is None:
+        SQL.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        SQL.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, sequence))
+
+    SQL.execute('PRAGMA foreign_key_check(%s);' % (table))
+    if len(SQL.fetchall()) > violations:
+        raise sqlite3.IntegrityError('rebuild of %s violates foreign keys' % (table))
+
+    vlog(3, 'rebuilt table %s' % (table))
@@ -0,0 +1,108 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import re
+import unittest
+from .context import opstt
+from opstt import sqlite
+from opstt import bcl_schema
+from opstt import bcl
+
+CABLES = 100000
+
+#SCAN without an index walks every row of the table
+FULL_SCAN = re.compile(r'^SCAN (?P<table>\w+)(?: AS \w+)?$')
+
+#migrations before the indexes covering HOT_QUERIES
+BASELINE = [ m for m in bcl.MIGRATIONS if m[0] == 1 ]
+
+class BclSchemaTestSuite(unittest.TestCase):
+    """ bad cable schema test cases """
+
+    @classmethod
+    def setUpClass(cls):
+        (cls.conn, cls.sql) = sqlite.init(':memory:')
+        #shipped schema (with cable_aliases and issues_identity_index)
+        sqlite.migrate(cls.sql, BASELINE)
+        cls.sql.execute(bcl_schema.LIST_FILTER_TABLE)
+        cls.sql.execute(bcl_schema.NEEDLE_KEYS_TABLE)
+
+        #mostly watched cables with two ports each and a few ignored issues
+        states = ['watch'] * 95 + ['suspect'] * 3 + ['disabled', 'removed']
+        with sqlite.transaction(cls.sql):
+            cls.sql.executemany('''
+                INSERT INTO cables (cid, state, ctime, mtime, ticket, online, flabel) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                (cid, states[cid % len(states)], cid, cid, cid if cid % 50 == 0 else None, 1 if cid % 20 else 0, 'c%s' % (cid))
+                for cid in range(1, CABLES + 1)
+            ))
+            cls.sql.executemany('''
+                INSERT INTO cable_ports (cid, guid, port, hca, flabel) VALUES (?, ?, ?, 0, ?)
+            ''', (
+                (cpid // 2 + 1, str(cpid // 36), cpid % 36, 'p%s' % (cpid))
+                for cpid in range(CABLES * 2)
+            ))
+            cls.sql.executemany('''
+                INSERT INTO issues (cid, type, issue, source, mtime, ignore) VALUES (?, 'type', 'issue', ?, ?, ?)
+            ''', (
+                (iid * 7 % CABLES + 1, 's%s' % (iid), iid, 1 if iid % 100 == 0 else 0)
+                for iid in range(CABLES // 2)
+            ))
+
+    @classmethod
+    def tearDownClass(cls):
+        sqlite.close(cls.conn, cls.sql)
+
+    def full_scans(self):
+        """ get names of hot queries that scan a whole table of the schema """
+        self.sql.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = set(row['name'] for row in self.sql.fetchall())
+
+        scans = []
+        for name, (query, args) in sorted(bcl_schema.HOT_QUERIES.items()):
+            self.sql.execute('EXPLAIN QUERY PLAN %s' % (query), args)
+            for row in self.sql.fetchall():
+                match = FULL_SCAN.match(row['detail'])
+                if match and match.group('table') in tables:
+                    scans.append('%s: %s' % (name, row['detail']))
+
+        return scans
+
+    def test_hot_queries(self):
+        self.assertEqual(sqlite.user_version(self.sql), 1)
+        self.assertNotEqual(self.full_scans(), [])
+
+        self.assertEqual(sqlite.migrate(self.sql, bcl.MIGRATIONS), bcl.MIGRATIONS[-1][0])
+        self.assertEqual(self.full_scans(), [])
+
+        #plans must hold once the planner has statistics too
+        self.sql.execute('ANALYZE;')
+        self.assertEqual(self.full_scans(), [])
+
+if __name__ == '__main__':
+    unittest.main()
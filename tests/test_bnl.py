@@ -0,0 +1,132 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from .context import opstt
+from opstt import sqlite
+from opstt import ev_outbox
+from opstt import bnl
+from benchmarks.extraview import FakeExtraview
+
+class BnlTestSuite(unittest.TestCase):
+    """ bad node list test cases against throwaway state files """
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        for name in ('BAD_NODE_DB', 'BAD_NODE_DB_BACKUP', 'CLUSH_BAD_GROUPS', 'STATE', 'EV', 'OUTBOX_SQL', 'CONFIG'):
+            self.addCleanup(setattr, bnl, name, getattr(bnl, name))
+        bnl.BAD_NODE_DB = os.path.join(self.work, 'bnl.json')
+        bnl.BAD_NODE_DB_BACKUP = os.path.join(self.work, 'bnl.backup.json')
+        bnl.CLUSH_BAD_GROUPS = os.path.join(self.work, 'badnodes.yaml')
+        bnl.CONFIG = {}
+
+        #no scheduler to talk to
+        for name in ('scheduler_open_nodes', 'scheduler_close_nodes'):
+            self.addCleanup(setattr, bnl, name, getattr(bnl, name))
+            setattr(bnl, name, lambda nodes, comment: None)
+
+        (self.conn, self.sql) = sqlite.init(os.path.join(self.work, 'outbox.sqlite'))
+        bnl.OUTBOX_SQL = self.sql
+        bnl.EV = ev_outbox.Outbox(self.sql)
+        bnl.initialize_state()
+
+    def tearDown(self):
+        sqlite.close(self.conn, self.sql)
+        shutil.rmtree(self.work)
+
+    def listed(self, nodes):
+        """ get list_state() output """
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            bnl.list_state(nodes)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def saved(self, node):
+        """ get ticket ids of node saved in state file """
+        with open(bnl.BAD_NODE_DB, 'r') as fds:
+            return json.load(fds)['nodes'][node]['extraview']
+
+    def test_tickets(self):
+        bnl.add_nodes(['r1i1n1'], 'bad dimm')
+
+        #queued ticket has a placeholder until drained
+        self.assertEqual(self.saved('r1i1n1'), ['-1'])
+        self.assertIn('-1', self.listed(['r1i1n1']))
+
+        ev = FakeExtraview()
+        open_extraview = bnl.open_extraview
+        bnl.open_extraview = lambda: ev
+        try:
+            bnl.run_drain()
+        finally:
+            bnl.open_extraview = open_extraview
+
+        self.assertEqual([ call[0] for call in ev.calls ], ['create', 'comment'])
+        self.assertEqual(ev.calls[1][1], ev.next_ticket)
+        self.assertEqual(self.saved('r1i1n1'), [str(ev.next_ticket)])
+        self.assertIn(str(ev.next_ticket), self.listed(''))
+
+        #ticket ids from the command line
+        bnl.attach_nodes(['r1i1n1'], ['77'])
+        bnl.detach_nodes(['r1i1n1'], [str(ev.next_ticket)])
+        self.assertEqual(self.saved('r1i1n1'), ['77'])
+
+        #states saved with integer ids still list and detach
+        bnl.STATE['nodes']['r1i1n1']['extraview'].append(78)
+        self.assertIn('77,78', self.listed(''))
+        bnl.detach_nodes(['r1i1n1'], ['77', '78'])
+        self.assertEqual(self.saved('r1i1n1'), [])
+
+    def test_drain_config(self):
+        bnl.add_nodes(['r1i1n1'], 'bad dimm')
+
+        ev = FakeExtraview()
+        ev.down = True
+        open_extraview = bnl.open_extraview
+        bnl.open_extraview = lambda: ev
+        try:
+            #defaults would retry for another 7 attempts
+            bnl.CONFIG = { 'tickets': { 'outbox retries': 1, 'outbox jobs': 1 } }
+            bnl.run_drain()
+        finally:
+            bnl.open_extraview = open_extraview
+
+        self.assertEqual(ev_outbox.counts(self.sql), { 'failed': 2 })
+        self.assertEqual(self.saved('r1i1n1'), ['-1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import tempfile
+import unittest
+from .context import opstt
+from opstt import dump_cache
+from opstt import ib_diagnostics
+from .test_ib_diagnostics import IBNETDISCOVER, IBDIAGNET, IBDIAGNET_CSV
+
+class DumpCacheTestSuite(unittest.TestCase):
+    """ Parsed dump cache test cases """
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+        for name, contents in [
+            ('ibnetdiscover.log', IBNETDISCOVER),
+            ('ibdiagnet2.db_csv', IBDIAGNET_CSV),
+            ('ibdiagnet2.log', IBDIAGNET),
+        ]:
+            with open(os.path.join(self.dump_dir, name), 'w') as fds:
+                fds.write(contents)
+
+        self.ports = ib_diagnostics.PortRegistry()
+        self.issues = []
+        ib_diagnostics.parse_dump(self.ports, self.issues, self.dump_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dump_dir)
+
+    def test_round_trip(self):
+        self.assertIsNone(dump_cache.load(self.dump_dir))
+        self.assertTrue(dump_cache.save(self.dump_dir, self.ports, self.issues))
+
+        ports, issues = dump_cache.load(self.dump_dir)
+        self.assertEqual(
+            [ib_diagnostics.port_pretty(port) for port in ports], 
+            [ib_diagnostics.port_pretty(port) for port in self.ports]
+        )
+        self.assertEqual([issue['issue'] for issue in issues], [issue['issue'] for issue in self.issues])
+
+        #issues and connections still point at the cached ports
+        port = ib_diagnostics.parse_resolve_port(ports, 'r1i0n1/U1/P1')
+        self.assertIs(issues[0]['ports'][0], port)
+        self.assertIs(port['connection']['connection'], port)
+        self.assertEqual(port['PortState'], '4')
+
+    def test_invalidate(self):
+        dump_cache.save(self.dump_dir, self.ports, self.issues, 'thresholds')
+        self.assertIsNone(dump_cache.load(self.dump_dir, 'other thresholds'))
+        self.assertIsNotNone(dump_cache.load(self.dump_dir, 'thresholds'))
+
+        with open(os.path.join(self.dump_dir, 'ibdiagnet2.log'), 'a') as fds:
+            fds.write('-E- something new\n')
+        self.assertIsNone(dump_cache.load(self.dump_dir, 'thresholds'))
+
+        dump_cache.save(self.dump_dir, self.ports, self.issues, 'thresholds')
+        with open(os.path.join(self.dump_dir, 'ibdiagnet2.cables'), 'w') as fds:
+            fds.write('')
+        self.assertIsNone(dump_cache.load(self.dump_dir, 'thresholds'))
+
+    def test_untrusted(self):
+        dump_cache.save(self.dump_dir, self.ports, self.issues)
+        path = os.path.join(self.dump_dir, dump_cache.CACHE_NAME)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+        #anyone else could have written the pickle
+        for mode in (0o620, 0o602):
+            os.chmod(path, mode)
+            self.assertIsNone(dump_cache.load(self.dump_dir))
+
+        os.chmod(path, 0o644)
+        self.assertIsNotNone(dump_cache.load(self.dump_dir))
+
+        if os.geteuid() == 0:
+            os.chown(path, 65534, -1)
+            self.assertIsNone(dump_cache.load(self.dump_dir))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import tempfile
+import unittest
+from .context import opstt
+from opstt import ev_field_keys
+from benchmarks.extraview import FakeExtraview
+
+class EvFieldKeysTestSuite(unittest.TestCase):
+    """ Extraview field key cache test cases """
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.path = os.path.join(self.work, 'cache', 'ev_field_keys.json')
+        self.ev = FakeExtraview()
+
+    def tearDown(self):
+        shutil.rmtree(self.work)
+
+    def test_cache(self):
+        ev = ev_field_keys.FieldKeyCache(self.ev, self.path)
+        for i in range(3):
+            self.assertEqual(ev.get_field_value_to_field_key('HELP_LOCATION', 'NWSC'), 'HELP_LOCATION=NWSC')
+        self.assertEqual(ev.get_field_value_to_field_key('HELP_HOSTNAME', 'cheyenne'), 'HELP_HOSTNAME=cheyenne')
+        self.assertEqual(self.ev.field_lookups, 2)
+
+        #other calls pass through to the client
+        self.assertEqual(ev.create('ssgev', 'ssg', None, 'title', 'description', {}), 1001)
+
+        #later processes load the cache from disk
+        ev = ev_field_keys.FieldKeyCache(self.ev, self.path)
+        self.assertEqual(ev.get_field_value_to_field_key('HELP_LOCATION', 'NWSC'), 'HELP_LOCATION=NWSC')
+        self.assertEqual(self.ev.field_lookups, 2)
+
+    def test_expire(self):
+        ev_field_keys.FieldKeyCache(self.ev, self.path).get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+
+        ev = ev_field_keys.FieldKeyCache(self.ev, self.path, ttl = 0)
+        ev.get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        self.assertEqual(self.ev.field_lookups, 2)
+
+    def test_clear(self):
+        ev_field_keys.FieldKeyCache(self.ev, self.path).get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        self.assertEqual(list(ev_field_keys.load(self.path).keys()), ['HELP_LOCATION'])
+
+        ev_field_keys.clear(self.path)
+        self.assertEqual(ev_field_keys.load(self.path), {})
+        ev_field_keys.FieldKeyCache(self.ev, self.path).get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        self.assertEqual(self.ev.field_lookups, 2)
+
+    def test_missing(self):
+        class Missing(FakeExtraview):
+            def get_field_value_to_field_key(self, field, value):
+                self.field_lookups += 1
+                return None
+
+        missing = Missing()
+        ev = ev_field_keys.FieldKeyCache(missing, self.path)
+        self.assertIsNone(ev.get_field_value_to_field_key('HELP_LOCATION', 'nowhere'))
+        self.assertIsNone(ev.get_field_value_to_field_key('HELP_LOCATION', 'nowhere'))
+        self.assertEqual(missing.field_lookups, 2)
+
+    def test_config(self):
+        #defaults without a config or tickets section
+        for cfg in (None, {}, { 'tickets': {} }):
+            self.assertEqual(ev_field_keys.cache_path(cfg), ev_field_keys.CACHE_PATH)
+            ev = ev_field_keys.open_cache(self.ev, cfg)
+            self.assertEqual((ev.path, ev.ttl), (ev_field_keys.CACHE_PATH, ev_field_keys.TTL))
+
+        cfg = { 'tickets': { 'field key cache': self.path, 'field key ttl': 0 } }
+        self.assertEqual(ev_field_keys.cache_path(cfg), self.path)
+        ev = ev_field_keys.open_cache(self.ev, cfg)
+        ev.get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        ev.get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        self.assertEqual(self.ev.field_lookups, 2)
+        self.assertEqual(list(ev_field_keys.load(self.path).keys()), ['HELP_LOCATION'])
+
+        ev_field_keys.clear(ev_field_keys.cache_path(cfg))
+        self.assertFalse(os.path.exists(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from .context import opstt
+from opstt import sqlite
+from opstt import ev_outbox
+from benchmarks.extraview import FakeExtraview, queue_tickets
+
+class EvOutboxTestSuite(unittest.TestCase):
+    """ Extraview outbox test cases """
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        (self.conn, self.sql) = sqlite.init(os.path.join(self.work, 'test.sqlite'))
+        self.outbox = ev_outbox.Outbox(self.sql)
+        self.ev = FakeExtraview()
+
+    def tearDown(self):
+        sqlite.close(self.conn, self.sql)
+        shutil.rmtree(self.work)
+
+    def create(self, title):
+        return self.outbox.create('ssgev', 'ssg', None, title, 'description', {
+            'HELP_LOCATION': self.outbox.get_field_value_to_field_key('HELP_LOCATION', 'NWSC')
+        })
+
+    def test_drain(self):
+        tid = self.create('Bad Cable')
+        self.assertTrue(ev_outbox.is_placeholder(tid))
+        self.outbox.add_resolver_comment(tid, 'first')
+        self.outbox.assign_group(tid, 'casg', None, { 'COMMENTS': 'go' })
+        self.outbox.close(tid, 'done')
+        self.outbox.add_resolver_comment(42, 'existing ticket')
+        self.assertEqual(self.ev.calls, [])
+
+        stats = ev_outbox.drain(self.sql, self.ev)
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(self.ev.calls, [
+            ('create', 'Bad Cable'),
+            ('comment', 1001, 'first'),
+            ('assign', 1001, 'casg', { 'COMMENTS': 'go' }),
+            ('close', 1001, 'done'),
+            ('comment', 42, 'existing ticket'),
+        ])
+        self.assertEqual(ev_outbox.counts(self.sql), { 'sent': 5 })
+
+        backfilled = []
+        self.assertEqual(ev_outbox.backfill(self.sql, lambda placeholder, ticket: backfilled.append((placeholder, ticket))), 1)
+        self.assertEqual(backfilled, [(tid, 1001)])
+        #only backfilled once
+        self.assertEqual(ev_outbox.backfill(self.sql, lambda placeholder, ticket: self.fail()), 0)
+
+    def test_field_keys(self):
+        class Fields(FakeExtraview):
+            def create(self, project, group, user, title, description, fields):
+                self.call('create', fields)
+                return 7
+
+        ev = Fields()
+        self.create('Bad Node')
+        ev_outbox.drain(self.sql, ev)
+        self.assertEqual(ev.calls, [('create', { 'HELP_LOCATION': 'HELP_LOCATION=NWSC' })])
+
+    def test_retry(self):
+        tid = self.create('Bad Cable')
+        self.outbox.add_resolver_comment(tid, 'first')
+        self.outbox.add_resolver_comment(42, 'other')
+
+        self.ev.down = True
+        stats = ev_outbox.drain(self.sql, self.ev, retries = 2, backoff = 0, max_failures = 1, jobs = 1)
+        self.assertEqual(stats['retry'], 1)
+        self.assertEqual(ev_outbox.counts(self.sql), { 'pending': 3 })
+
+        #later operations against the ticket fail with the create
+        stats = ev_outbox.drain(self.sql, self.ev, retries = 2, backoff = 0, jobs = 1)
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(ev_outbox.counts(self.sql), { 'failed': 2, 'pending': 1 })
+
+        self.ev.down = False
+        ev_outbox.retry_failed(self.sql)
+        stats = ev_outbox.drain(self.sql, self.ev, backoff = 0)
+        self.assertEqual(stats['sent'], 3)
+        self.assertEqual(self.ev.calls, [
+            ('create', 'Bad Cable'),
+            ('comment', 1001, 'first'),
+            ('comment', 42, 'other'),
+        ])
+
+    def test_backfilled_order(self):
+        tid = self.create('Bad Cable')
+        self.outbox.add_resolver_comment(tid, 'first')
+        ev_outbox.drain(self.sql, self.ev, limit = 1)
+
+        #first comment waits to be retried
+        self.ev.down = True
+        ev_outbox.drain(self.sql, self.ev, backoff = 600)
+        self.ev.down = False
+
+        tickets = {}
+        ev_outbox.backfill(self.sql, lambda placeholder, ticket: tickets.update({ placeholder: ticket }))
+        self.assertEqual(tickets, { tid: 1001 })
+        self.outbox.add_resolver_comment(1001, 'second')
+
+        #comment against the real ticket waits for the one against its placeholder
+        stats = ev_outbox.drain(self.sql, self.ev, backoff = 600)
+        self.assertEqual((stats['sent'], stats['waiting']), (0, 2))
+
+        self.sql.execute("UPDATE ev_outbox SET next_try = 0;")
+        stats = ev_outbox.drain(self.sql, self.ev, jobs = 2)
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(self.ev.calls, [
+            ('create', 'Bad Cable'),
+            ('comment', 1001, 'first'),
+            ('comment', 1001, 'second'),
+        ])
+
+    def test_backoff(self):
+        self.outbox.add_resolver_comment(42, 'first')
+        self.outbox.add_resolver_comment(42, 'second')
+
+        self.ev.down = True
+        ev_outbox.drain(self.sql, self.ev, backoff = 600)
+        self.ev.down = False
+        stats = ev_outbox.drain(self.sql, self.ev, backoff = 600)
+        self.assertEqual((stats['sent'], stats['waiting']), (0, 2))
+        self.assertEqual(self.ev.calls, [])
+
+    def test_parallel(self):
+        tids = queue_tickets(self.sql, 8, 4)
+        self.ev.latency = 0.005
+
+        stats = ev_outbox.drain(self.sql, self.ev, jobs = 4)
+        self.assertEqual(stats['sent'], 40)
+        self.assertEqual(stats['latency']['add_resolver_comment']['count'], 32)
+        self.assertGreaterEqual(stats['latency']['create']['p50'], 0.005)
+        self.assertGreater(self.ev.max_in_flight, 1)
+        self.assertLessEqual(self.ev.max_in_flight, 4)
+
+        #comments against every ticket arrive after its create and in order
+        tickets = {}
+        ev_outbox.backfill(self.sql, lambda placeholder, ticket: tickets.update({ placeholder: ticket }))
+        self.assertEqual(sorted(tickets.keys()), sorted(tids))
+        for tid in tids:
+            self.assertEqual(
+                [call[2] for call in self.ev.ticket_calls(tickets[tid])], 
+                ['comment %d' % (i) for i in range(4)]
+            )
+
+    def test_rate(self):
+        for i in range(6):
+            self.outbox.add_resolver_comment(i + 1, 'comment')
+
+        start = time.time()
+        ev_outbox.drain(self.sql, self.ev, jobs = 6, rate = 50)
+        #first call goes out immediately
+        self.assertGreaterEqual(time.time() - start, 5 / 50.0)
+        self.assertEqual(len(self.ev.calls), 6)
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with sqlite.transaction(self.sql):
+                self.create('Bad Cable')
+                raise ValueError()
+
+        self.assertEqual(ev_outbox.counts(self.sql), {})
+
+if __name__ == '__main__':
+    unittest.main()
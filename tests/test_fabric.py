@@ -0,0 +1,79 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import shutil
+import tempfile
+import unittest
+from .context import opstt
+from opstt import ib_diagnostics
+from benchmarks import fabric
+
+class FabricTestSuite(unittest.TestCase):
+    """ Synthetic fabric generator test cases """
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dump_dir)
+
+    def parse(self, fab):
+        fab.write(self.dump_dir)
+        ports = ib_diagnostics.PortRegistry()
+        issues = []
+        ib_diagnostics.parse_dump(ports, issues, self.dump_dir)
+        return ports, issues
+
+    def test_fat_tree(self):
+        fab = fabric.Fabric('fat-tree', 400, 0.2, 1)
+        ports, issues = self.parse(fab)
+
+        #every connected port plus the unconnected switch ports
+        self.assertEqual(len([port for port in ports if port['connection']]), fab.port_count())
+        self.assertTrue(issues)
+        self.assertTrue(all(port['SN'] for port in ports if port['connection']))
+
+        port = ib_diagnostics.parse_resolve_port(ports, 'ys00001/U1/P1')
+        self.assertEqual(port['connection']['name'], 'ib001')
+
+    def test_hypercube(self):
+        fab = fabric.Fabric('hypercube', 400, 0.2, 1)
+        ports, issues = self.parse(fab)
+
+        self.assertEqual(len([port for port in ports if port['connection']]), fab.port_count())
+        self.assertIn('missing', [issue['type'] for issue in issues])
+
+    def test_seed(self):
+        self.assertEqual(
+            fabric.Fabric('fat-tree', 400, 0.1, 3).errors,
+            fabric.Fabric('fat-tree', 400, 0.1, 3).errors
+        )
+        self.assertRaises(ValueError, fabric.Fabric, 'torus')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,447 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from .context import opstt
+from opstt import ib_diagnostics
+
+IBNETDISCOVER = os.linesep.join([
+    "CA    44  1 0x0002c9030045f121 4x FDR - SW     2 17 0x0002c903006e1430 ( 'r1i0n0 HCA-1' - 'MF0;r1i0s0:SX60XX/U1' )",
+    "CA    45  1 0x0002c9030045f122 4x FDR - SW     2 18 0x0002c903006e1430 ( 'r1i0n1 HCA-1' - 'MF0;r1i0s0:SX60XX/U1' )",
+    "SW     2 19 0x0002c903006e1430 4x SDR                                    'MF0;r1i0s0:SX60XX/U1'",
+    "SW     3  1 0x7cfe900300bdf4f0 4x FDR - SW     4  1 0x7cfe900300bdf570 ( 'S7cfe900300bdf4f0/N7cfe900300bdf4f0' - 'ys75ib1/L05/U1' )",
+    "SW     2 17 0x0002c903006e1430 4x FDR - CA    44  1 0x0002c9030045f121 ( 'MF0;r1i0s0:SX60XX/U1' - 'r1i0n0 HCA-1' )",
+    "",
+])
+
+IBDIAGNET = """-------------------------------------------------------
+Discovery
+-I- Discovering ... 7 nodes (2 Switches & 5 CA-s) discovered.
+-I- Fabric Discover finished successfully
+-------------------------------------------------------
+Port Counters
+-E- r1i0n0/U1/P1 - "symbol_error_counter" increased during the run (difference value=5,difference allowed threshold=1)
+-E- r1i0n1/U1/P1 - "symbol_error_counter" increased during the run (difference value=500,difference allowed threshold=1)
+-E- Ports counters Difference Check (during run) finished with errors
+
+-------------------------------------------------------
+Links Check
+-E- Link: r1i0n0/U1/P1<-->MF0;r1i0s0:SX60XX/U1/P17 - Unexpected actual link speed 14
+-E- Error in mark route from:r1i0n1/U1 SLID:108 to DLID:103
+-E- Cable problem between r1i0n1/U1/P1 and S0002c903006e1430/N0002c903006e1430/P19
+-------------------------------------------------------
+Summary
+-I- Stage                     Warnings   Errors     Comment
+-E- Total                     0          4
+"""
+
+IBDIAGNET_CSV = "\n".join([
+    "START_NODES",
+    "NodeDesc,NodeGUID",
+    "\"r1i0n0 HCA-1\",0x0002c9030045f121",
+    "END_NODES",
+    "",
+    "START_CABLE_INFO",
+    "PortGuid,PortNum,SN,PN,LengthDesc",
+    "0x0002c9030045f121,1,SN0001,MC2207130-002,2 m",
+    "END_CABLE_INFO",
+    "START_PORTS",
+    "NodeGuid,PortNum,PortState",
+    "0x0002c9030045f122,1,4",
+    "END_PORTS",
+    "",
+])
+
+IBDIAGNET_CABLES = """-------------------------------------------------------
+Port=1 Lid=0x002d GUID=0x0002c9030045f122 Port Name=r1i0n1/U1/P1
+-------------------------------------------------------
+Vendor: Mellanox
+PN: 00W0085
+SN: MT1234567890
+"""
+
+#fields of every port compared against the baseline parser
+BASELINE_FIELDS = ['type', 'lid', 'guid', 'port', 'name', 'hca', 'leaf', 'spine', 'speed', 'width', 'connection']
+
+#output of the baseline (list and regex per line) parser for IBNETDISCOVER and IBDIAGNET
+BASELINE_PORTS = [
+    ('CA', '44', '0x0002c9030045f121', '1', 'r1i0n0', '1', None, None, 'FDR', '4x', 'r1i0s0/U1/P17'),
+    ('SW', '2', '0x0002c903006e1430', '17', 'r1i0s0', '1', None, None, 'FDR', '4x', 'r1i0n0/U1/P1'),
+    ('CA', '45', '0x0002c9030045f122', '1', 'r1i0n1', '1', None, None, 'FDR', '4x', 'r1i0s0/U1/P18'),
+    ('SW', '2', '0x0002c903006e1430', '18', 'r1i0s0', '1', None, None, 'FDR', '4x', 'r1i0n1/U1/P1'),
+    ('SW', '2', '0x0002c903006e1430', '19', 'r1i0s0', '1', None, None, 'SDR', '4x', None),
+    ('SW', '3', '0x7cfe900300bdf4f0', '1', '0x7cfe900300bdf4f0', None, None, None, 'FDR', '4x', 'ys75ib1/L05/P1'),
+    ('SW', '4', '0x7cfe900300bdf570', '1', 'ys75ib1', '1', '05', None, 'FDR', '4x', '0x7cfe900300bdf4f0/P1'),
+]
+BASELINE_ISSUES = [
+    ('counters', 'Counter symbol_error_counter increased to 500', 'r1i0n1/U1/P1 - "symbol_error_counter" increased during the run (difference value=500,difference allowed threshold=1)', 'ibdiagnet2.log', ['r1i0n1/U1/P1']),
+    ('link', 'Unexpected actual link speed 14', 'Link: r1i0n0/U1/P1<-->MF0;r1i0s0:SX60XX/U1/P17 - Unexpected actual link speed 14', 'ibdiagnet2.log', ['r1i0n0/U1/P1', 'r1i0s0/U1/P17']),
+    ('lft', 'LFT Error', 'Error in mark route from:r1i0n1/U1 SLID:108 to DLID:103', 'ibdiagnet2.log', []),
+    ('unknown', 'Links Check: Cable problem between r1i0n1/U1/P1 and S0002c903006e1430/N0002c903006e1430/P19', '-E- Cable problem between r1i0n1/U1/P1 and S0002c903006e1430/N0002c903006e1430/P19', 'ibdiagnet2.log', ['r1i0n1/U1/P1', 'r1i0s0/U1/P19']),
+]
+
+def scan_resolve_port(ports, port):
+    """ reference linear scan matching the original resolve_port() """
+    if 'guid' in port and port['guid'] and port['port']:
+        for pport in ports:
+            if int(port['guid'], 16) == int(pport['guid'], 16) and int(port['port']) == int(pport['port']):
+                return pport
+
+    if 'name' in port and port['name'] and port['port'] and port['name'] != "localhost":
+        for pport in ports:
+            if port['name'] == pport['name'] and int(port['port']) == int(pport['port']):
+                match = True
+                for key in ['hca', 'leaf', 'spine']:
+                    if key in port and key in pport:
+                        if port[key] != pport[key]:
+                            match = False
+                    elif (key in port) != (key in pport):
+                        match = False
+                if match:
+                    return pport
+
+    return None
+
+class PortRegistryTestSuite(unittest.TestCase):
+    """ Indexed port resolution test cases """
+
+    def setUp(self):
+        self.ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(self.ports, IBNETDISCOVER)
+
+    def test_ignores_duplicate_ports(self):
+        self.assertEqual(len(self.ports), 7)
+
+    def test_resolve_matches_scan(self):
+        labels = [
+            'r1i0n0/U1/P1',
+            'r1i0n1 HCA-1 P1',
+            'MF0;r1i0s0:SX60XX/U1/P17',
+            'S0002c903006e1430/N0002c903006e1430/P19',
+            'S7cfe900300bdf570/U/P1',
+            'ys75ib1/L05/U1/P1',
+            'ys75ib1/L06/U1/P1',
+            'localhost HCA-1',
+            'unknown/P3',
+        ]
+        for label in labels:
+            port = ib_diagnostics.parse_port(label)
+            self.assertIs(
+                ib_diagnostics.resolve_port(self.ports, port),
+                scan_resolve_port(list(self.ports), port),
+                label
+            )
+
+    def test_update_reindexes_port(self):
+        port = ib_diagnostics.resolve_update_port(self.ports, {
+            'guid': '0x0002c9030045f121',
+            'port': '1',
+            'name': 'renamed',
+            'SN': 'SN1'
+        })
+        self.assertEqual(port['SN'], 'SN1')
+        self.assertIs(ib_diagnostics.resolve_port(self.ports, ib_diagnostics.parse_port('renamed HCA-1 P1')), port)
+        self.assertIsNone(ib_diagnostics.resolve_port(self.ports, ib_diagnostics.parse_port('r1i0n0 HCA-1 P1')))
+
+    def test_resolve_bare_list(self):
+        port = ib_diagnostics.parse_resolve_port(list(self.ports), 'r1i0n1/U1/P1')
+        self.assertEqual(port['guid'], '0x0002c9030045f122')
+
+class PortTestSuite(unittest.TestCase):
+    """ Compact Port record test cases """
+
+    def test_dict_access(self):
+        port = ib_diagnostics.parse_port('S7cfe900300bdf570/N7cfe900300bdf570/P28')
+        self.assertEqual(port.guid, 0x7cfe900300bdf570)
+        self.assertEqual(port['guid'], '0x7cfe900300bdf570')
+        self.assertEqual(port['port'], 28)
+        self.assertIn('hca', port)
+        self.assertNotIn('SN', port)
+        self.assertIsNone(port.get('SN'))
+        self.assertRaises(KeyError, lambda: port['SN'])
+        self.assertRaises(KeyError, lambda: port['Vendor'])
+
+    def test_update_keeps_used_fields(self):
+        port = ib_diagnostics.parse_port('r1i0n0 HCA-1')
+        port.update({'guid': '0x0002c9030045f121', 'port': '1', 'SN': 'SN1', 'Vendor': 'Mellanox'})
+        self.assertEqual(port['guid'], '0x0002c9030045f121')
+        self.assertEqual(port['SN'], 'SN1')
+        self.assertNotIn('Vendor', port)
+        self.assertEqual(ib_diagnostics.port_name_pretty(port), 'r1i0n0')
+        self.assertEqual(dict(port.items())['SN'], 'SN1')
+
+class ParsePortCacheTestSuite(unittest.TestCase):
+    """ Memoized parse_port test cases """
+
+    def setUp(self):
+        ib_diagnostics.parse_port_cache_clear()
+
+    def test_cache_hits(self):
+        for i in range(3):
+            ib_diagnostics.parse_port('MF0;ys75ib1:SXX536/L05/U1/P2')
+        info = ib_diagnostics.parse_port_cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 1, 1))
+
+    def test_returns_copy(self):
+        port = ib_diagnostics.parse_port('geyser01 HCA-1 P3')
+        port['name'] = 'changed'
+        port['connection'] = port
+        port = ib_diagnostics.parse_port('geyser01 HCA-1 P3')
+        self.assertEqual((port['name'], port['hca'], port['port']), ('geyser01', '1', '3'))
+        self.assertIsNone(port['connection'])
+
+def baseline_ports(ports):
+    """ get ports as BASELINE_PORTS records """
+    return [
+        tuple(
+            ib_diagnostics.port_pretty(port[field]) if field == 'connection' and port[field] else port[field]
+            for field in BASELINE_FIELDS
+        )
+        for port in ports
+    ]
+
+def baseline_issues(issues):
+    """ get issues as BASELINE_ISSUES records """
+    return [
+        (issue['type'], issue['issue'], issue['raw'], issue['source'], [ib_diagnostics.port_pretty(port) for port in issue['ports']])
+        for issue in issues
+    ]
+
+class BaselineTestSuite(unittest.TestCase):
+    """ Parser output matches the baseline parser """
+
+    def test_string(self):
+        ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(ports, IBNETDISCOVER)
+        self.assertEqual(baseline_ports(ports), BASELINE_PORTS)
+
+        issues = []
+        ib_diagnostics.parse_ibdiagnet(ports, issues, IBDIAGNET)
+        self.assertEqual(baseline_issues(issues), BASELINE_ISSUES)
+
+    def test_stream(self):
+        ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(ports, io.StringIO(IBNETDISCOVER))
+        self.assertEqual(baseline_ports(ports), BASELINE_PORTS)
+
+        issues = []
+        ib_diagnostics.parse_ibdiagnet(ports, issues, io.StringIO(IBDIAGNET))
+        self.assertEqual(baseline_issues(issues), BASELINE_ISSUES)
+
+        #batched counter checks of the parallel dump path
+        records = list(ib_diagnostics.iter_ibdiagnet_records(io.StringIO(IBDIAGNET)))
+        self.assertEqual(baseline_issues(ib_diagnostics.resolve_ibdiagnet_records(ports, records)), BASELINE_ISSUES)
+
+class StreamingParseTestSuite(unittest.TestCase):
+    """ Line at a time parser test cases """
+
+    def setUp(self):
+        self.ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(self.ports, io.StringIO(IBNETDISCOVER))
+
+    def test_stream_matches_string(self):
+        ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(ports, IBNETDISCOVER)
+        self.assertEqual(
+            [ib_diagnostics.port_pretty(port) for port in ports],
+            [ib_diagnostics.port_pretty(port) for port in self.ports]
+        )
+
+        issues = []
+        ib_diagnostics.parse_ibdiagnet(self.ports, issues, IBDIAGNET)
+        self.assertEqual(issues, list(ib_diagnostics.iter_ibdiagnet(self.ports, io.StringIO(IBDIAGNET))))
+
+    def test_ibdiagnet_issues(self):
+        issues = list(ib_diagnostics.iter_ibdiagnet(self.ports, io.StringIO(IBDIAGNET)))
+        self.assertEqual([issue['type'] for issue in issues], ['counters', 'link', 'lft', 'unknown'])
+        self.assertEqual(issues[0]['issue'], 'Counter symbol_error_counter increased to 500')
+        self.assertEqual(issues[0]['ports'][0]['guid'], '0x0002c9030045f122')
+        self.assertEqual(issues[3]['issue'], 'Links Check: Cable problem between r1i0n1/U1/P1 and S0002c903006e1430/N0002c903006e1430/P19')
+        self.assertEqual(
+            [ib_diagnostics.port_pretty(port) for port in issues[3]['ports']],
+            ['r1i0n1/U1/P1', 'r1i0s0/U1/P19']
+        )
+
+    def test_word_tokens(self):
+        tokens = ib_diagnostics.index_port_tokens(self.ports)
+        words = [
+            'Cable', 'problem', 'between', 'r1i0n1/U1/P1', 'and',
+            'S0002c903006e1430/N0002c903006e1430/P19', "'MF0;r1i0s0:SX60XX/U1'(395/17)",
+            'S0002c903006e1431/U/P1', 'r9i9n9/U1/P1'
+        ]
+        for word in words:
+            if not ib_diagnostics.word_may_name_port(tokens, word):
+                self.assertIsNone(ib_diagnostics.parse_resolve_port(self.ports, word), word)
+
+        self.assertEqual(
+            [word for word in words if ib_diagnostics.word_may_name_port(tokens, word)],
+            ['r1i0n1/U1/P1', 'S0002c903006e1430/N0002c903006e1430/P19', "'MF0;r1i0s0:SX60XX/U1'(395/17)"]
+        )
+
+class CounterThresholdTestSuite(unittest.TestCase):
+    """ Counter threshold table test cases """
+
+    def setUp(self):
+        self.ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(self.ports, IBNETDISCOVER)
+        self.thresholds = ib_diagnostics.compile_counter_thresholds({
+            'symbol_error_counter': 1000,
+            'link_down_counter': None,
+            'CA': { 'port_xmit_discard': 10 },
+            'SW': { 'symbol_error_counter': 2 }
+        })
+
+    def test_compile(self):
+        self.assertEqual(self.thresholds[(None, 'symbol_error_counter')], 1000)
+        self.assertEqual(self.thresholds[('SW', 'symbol_error_counter')], 2)
+        self.assertIsNone(self.thresholds[('CA', 'link_down_counter')])
+        self.assertIsNone(self.thresholds[('SW', 'port_xmit_discard')])
+        self.assertEqual(self.thresholds[('CA', 'port_xmit_discard')], 10)
+        self.assertEqual(self.thresholds[('CA', 'vl15_dropped')], 100)
+
+    def test_reported(self):
+        counters = [
+            (None, 'symbol_error_counter', 500),
+            ('CA', 'symbol_error_counter', 1000),
+            ('SW', 'symbol_error_counter', 2),
+            ('SW', 'link_down_counter', 100),
+            ('CA', 'port_xmit_discard', 9),
+            ('CA', 'port_xmit_discard', 10),
+            ('CA', 'not_a_known_counter', 0),
+        ]
+        expected = [False, True, True, False, False, True, True]
+        self.assertEqual(
+            [not ib_diagnostics.counter_ignored(self.thresholds, *counter) for counter in counters],
+            expected
+        )
+        self.assertEqual(ib_diagnostics.counters_reported(self.thresholds, counters), expected)
+
+    def test_parse(self):
+        issues = []
+        ib_diagnostics.parse_ibdiagnet(self.ports, issues, IBDIAGNET, self.thresholds)
+        self.assertEqual([issue['type'] for issue in issues], ['link', 'lft', 'unknown'])
+        self.assertEqual(
+            issues,
+            list(ib_diagnostics.iter_ibdiagnet(self.ports, io.StringIO(IBDIAGNET), self.thresholds))
+        )
+
+class IbdiagnetCsvTestSuite(unittest.TestCase):
+    """ ibdiagnet2.db_csv section index test cases """
+
+    def setUp(self):
+        self.ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(self.ports, IBNETDISCOVER)
+
+        self.fcsv = tempfile.TemporaryFile(mode='w+')
+        self.fcsv.write(IBDIAGNET_CSV)
+        self.fcsv.seek(0)
+
+    def tearDown(self):
+        self.fcsv.close()
+
+    def test_index_sections(self):
+        buf = IBDIAGNET_CSV.encode('ascii')
+        sections = ib_diagnostics.index_ibdiagnet_csv(buf)
+        self.assertEqual([name for name, start, end in sections], ['START_NODES', 'START_CABLE_INFO', 'START_PORTS'])
+        for name, start, end in sections:
+            lines = buf[start:end].decode('ascii').splitlines()
+            self.assertEqual(lines[0], name)
+            self.assertEqual(lines[-1], name.replace('START_', 'END_'))
+
+    def test_mmap_matches_rows(self):
+        issues = []
+        ib_diagnostics.parse_ibdiagnet_csv(self.ports, issues, self.fcsv)
+
+        ports = ib_diagnostics.PortRegistry()
+        ib_diagnostics.parse_ibnetdiscover_cables(ports, IBNETDISCOVER)
+        ib_diagnostics.parse_ibdiagnet_csv(ports, [], io.StringIO(IBDIAGNET_CSV))
+
+        self.assertEqual(issues, [])
+        keys = ['SN', 'PN', 'LengthDesc', 'PortState']
+        self.assertEqual(
+            [[port.get(key) for key in keys] for port in self.ports],
+            [[port.get(key) for key in keys] for port in ports]
+        )
+        port = ib_diagnostics.parse_resolve_port(self.ports, 'r1i0n0/U1/P1')
+        self.assertEqual(port['SN'], 'SN0001')
+        port = ib_diagnostics.parse_resolve_port(self.ports, 'r1i0n1/U1/P1')
+        self.assertEqual(port['PortState'], '4')
+
+class ParseDumpTestSuite(unittest.TestCase):
+    """ Parallel dump directory ingest test cases """
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+        for name, contents in [
+            ('ibnetdiscover.log', IBNETDISCOVER),
+            ('ibdiagnet2.db_csv', IBDIAGNET_CSV),
+            ('ibdiagnet2.log', IBDIAGNET),
+            ('ibdiagnet2.cables', IBDIAGNET_CABLES),
+        ]:
+            with open(os.path.join(self.dump_dir, name), 'w') as fds:
+                fds.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.dump_dir)
+
+    def parse(self, jobs):
+        ports = ib_diagnostics.PortRegistry()
+        issues = []
+        ib_diagnostics.parse_dump(ports, issues, self.dump_dir, jobs)
+        return (
+            [sorted((key, value) for key, value in port.items() if key != 'connection') for port in ports],
+            [
+                (issue['type'], issue['issue'], issue['raw'], [ib_diagnostics.port_pretty(port) for port in issue['ports']])
+                for issue in issues
+            ]
+        )
+
+    def test_parallel_matches_serial(self):
+        ports, issues = self.parse(None)
+        self.assertEqual(self.parse(3), (ports, issues))
+        self.assertEqual(len(issues), 4)
+
+    def test_records_match_parse(self):
+        ports = ib_diagnostics.PortRegistry()
+        issues = []
+        for name, required in ib_diagnostics.DUMP_FILES:
+            path = os.path.join(self.dump_dir, name)
+            if os.path.isfile(path):
+                file_issues, records = ib_diagnostics.read_dump_file(name, path)
+                ib_diagnostics.apply_dump_records(ports, issues, name, file_issues, records)
+
+        port = ib_diagnostics.parse_resolve_port(ports, 'r1i0n1/U1/P1')
+        self.assertEqual((port['SN'], port['PN'], port['PortState']), ('MT1234567890', '00W0085', '4'))
+        self.assertEqual([issue['type'] for issue in issues], ['counters', 'link', 'lft', 'unknown'])
+
+if __name__ == '__main__':
+    unittest.main()
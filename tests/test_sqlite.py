@@ -0,0 +1,212 @@
+#Copyright (c) 2017, University Corporation for Atmospheric Research
+#All rights reserved.
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions are met:
+#
+#1. Redistributions of source code must retain the above copyright notice,
+#this list of conditions and the following disclaimer.
+#
+#2. Redistributions in binary form must reproduce the above copyright notice,
+#this list of conditions and the following disclaimer in the documentation
+#and/or other materials provided with the distribution.
+#
+#3. Neither the name of the copyright holder nor the names of its contributors
+#may be used to endorse or promote products derived from this software without
+#specific prior written permission.
+#
+#THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+#LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+#WHETHER IN CONTRACT, STRICT LIABILITY,
+#OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from .context import opstt
+from opstt import sqlite
+
+class SqliteTestSuite(unittest.TestCase):
+    """ sqlite helper test cases """
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        (self.conn, self.sql) = sqlite.init(os.path.join(self.work, 'test.sqlite'))
+        self.sql.execute('CREATE TABLE cables (cid INTEGER PRIMARY KEY AUTOINCREMENT, SN text);')
+
+    def tearDown(self):
+        sqlite.close(self.conn, self.sql)
+        shutil.rmtree(self.work)
+
+    def count(self):
+        self.sql.execute('SELECT count(*) as c FROM cables')
+        return self.sql.fetchone()['c']
+
+    def test_transaction(self):
+        with sqlite.transaction(self.sql):
+            self.sql.execute("INSERT INTO cables (SN) VALUES ('a')")
+            #nested transactions join the outer one
+            with sqlite.transaction(self.sql):
+                self.sql.execute("INSERT INTO cables (SN) VALUES ('b')")
+            self.assertTrue(self.conn.in_transaction)
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.count(), 2)
+
+        def fail():
+            with sqlite.transaction(self.sql):
+                self.sql.execute("INSERT INTO cables (SN) VALUES ('c')")
+                raise ValueError('crash')
+
+        self.assertRaises(ValueError, fail)
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.count(), 2)
+
+    def test_checkpoint(self):
+        def fail():
+            with sqlite.transaction(self.sql):
+                self.sql.execute("INSERT INTO cables (SN) VALUES ('a')")
+                sqlite.checkpoint(self.sql)
+                self.sql.execute("INSERT INTO cables (SN) VALUES ('b')")
+                raise ValueError('crash')
+
+        self.assertRaises(ValueError, fail)
+        #only the committed chunk survives
+        self.assertEqual(self.count(), 1)
+
+    def test_next_autoincrement(self):
+        self.assertEqual(sqlite.next_autoincrement(self.sql, 'cables', 'cid'), 1)
+        self.sql.execute("INSERT INTO cables (SN) VALUES ('a')")
+        self.sql.execute("INSERT INTO cables (SN) VALUES ('b')")
+        self.sql.execute("DELETE FROM cables WHERE cid = 2")
+        #AUTOINCREMENT never reuses a key
+        self.assertEqual(sqlite.next_autoincrement(self.sql, 'cables', 'cid'), 3)
+
+    def test_incremental_vacuum(self):
+        path = os.path.join(self.work, 'vacuum.sqlite')
+        (conn, sql) = sqlite.init(path)
+        try:
+            #only applies before the first table is created
+            sql.execute('PRAGMA auto_vacuum = INCREMENTAL;')
+            sql.execute('CREATE TABLE t (a blob);')
+            self.assertEqual(sqlite.auto_vacuum(sql), sqlite.AUTO_VACUUM_INCREMENTAL)
+
+            with sqlite.transaction(sql):
+                sql.executemany('INSERT INTO t VALUES (?)', [(b'x' * 2000,) for i in range(500)])
+            sql.execute('DELETE FROM t;')
+
+            free, total = sqlite.free_pages(sql)
+            self.assertTrue(free > 100)
+
+            sqlite.incremental_vacuum(sql, 10)
+            self.assertEqual(sqlite.free_pages(sql), (free - 10, total - 10))
+        finally:
+            sqlite.close(conn, sql)
+
+    def test_migrate(self):
+        applied = []
+
+        def migration(number):
+            def run(sql):
+                applied.append(number)
+                sql.execute("INSERT INTO cables (SN) VALUES ('m%s')" % (number))
+            return run
+
+        migrations = [ (2, migration(2)), (1, migration(1)) ]
+        self.assertEqual(sqlite.migrate(self.sql, migrations), 2)
+        self.assertEqual(applied, [1, 2])
+        self.assertEqual(sqlite.user_version(self.sql), 2)
+
+        #only pending migrations run
+        migrations.append((3, migration(3)))
+        self.assertEqual(sqlite.migrate(self.sql, migrations), 3)
+        self.assertEqual(sqlite.migrate(self.sql, migrations), 3)
+        self.assertEqual(applied, [1, 2, 3])
+        self.assertEqual(self.count(), 3)
+
+        def fail(sql):
+            sql.execute("INSERT INTO cables (SN) VALUES ('m4')")
+            raise ValueError('crash')
+
+        self.sql.execute('PRAGMA foreign_keys = ON;')
+        self.assertRaises(ValueError, sqlite.migrate, self.sql, migrations + [ (4, fail) ])
+        self.assertEqual(sqlite.user_version(self.sql), 3)
+        self.assertEqual(self.count(), 3)
+        self.sql.execute('PRAGMA foreign_keys;')
+        self.assertEqual(self.sql.fetchone()[0], 1)
+
+    def test_rebuild_table(self):
+        self.sql.executescript("""
+            PRAGMA foreign_keys = ON;
+            CREATE TABLE cable_ports (
+                cpid INTEGER PRIMARY KEY AUTOINCREMENT, 
+                cid integer, 
+                guid text,
+                FOREIGN KEY (cid) REFERENCES cables(cid)
+            );
+            CREATE INDEX cable_ports_guid_index on cable_ports (guid);
+            CREATE TABLE log (cpid integer);
+            CREATE TRIGGER cable_ports_log AFTER INSERT ON cable_ports 
+            BEGIN 
+                INSERT INTO log (cpid) VALUES (NEW.cpid); 
+            END;
+            CREATE TRIGGER cables_log AFTER DELETE ON cables 
+            BEGIN 
+                DELETE FROM cable_ports WHERE cid = OLD.cid; 
+            END;
+            INSERT INTO cables (SN) VALUES ('a');
+            INSERT INTO cables (SN) VALUES ('b');
+            INSERT INTO cable_ports (cid, guid) VALUES (1, '1311768467294899695');
+            INSERT INTO cable_ports (cid, guid) VALUES (2, '2');
+            INSERT INTO cable_ports (cid, guid) VALUES (2, '3');
+            DELETE FROM cable_ports WHERE cpid = 3;
+        """)
+
+        def guid_int(sql):
+            sqlite.rebuild_table(sql, 'cable_ports', """
+                cpid INTEGER PRIMARY KEY AUTOINCREMENT, 
+                cid integer NOT NULL, 
+                guid text,
+                guid_int integer,
+                FOREIGN KEY (cid) REFERENCES cables(cid)
+            """, { 'guid_int': 'CAST(guid AS INTEGER)' })
+
+            #the parent of a foreign key can be rebuilt too
+            sqlite.rebuild_table(sql, 'cables', 'cid INTEGER PRIMARY KEY AUTOINCREMENT, SN text NOT NULL')
+
+        self.assertEqual(sqlite.migrate(self.sql, [ (1, guid_int) ]), 1)
+
+        self.assertEqual(sqlite.table_columns(self.sql, 'cable_ports'), ['cpid', 'cid', 'guid', 'guid_int'])
+        self.sql.execute('SELECT cpid, cid, guid_int FROM cable_ports ORDER BY cpid')
+        self.assertEqual([ tuple(row) for row in self.sql.fetchall() ], [(1, 1, 1311768467294899695), (2, 2, 2)])
+        self.assertEqual(self.count(), 2)
+
+        #indexes, triggers and AUTOINCREMENT survive the swap
+        self.sql.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger') ORDER BY name")
+        self.assertEqual([ row[0] for row in self.sql.fetchall() ], ['cable_ports_guid_index', 'cable_ports_log', 'cables_log'])
+        self.assertEqual(sqlite.next_autoincrement(self.sql, 'cable_ports', 'cpid'), 4)
+        self.sql.execute("INSERT INTO cable_ports (cid, guid) VALUES (1, '4')")
+        self.sql.execute('SELECT cpid FROM log')
+        self.assertEqual([ row[0] for row in self.sql.fetchall() ], [1, 2, 3, 4])
+
+        def orphan(sql):
+            sqlite.rebuild_table(sql, 'cable_ports', """
+                cpid INTEGER PRIMARY KEY AUTOINCREMENT, 
+                cid integer, 
+                guid text,
+                FOREIGN KEY (cid) REFERENCES cables(cid)
+            """, { 'cid': 'cid + 10' })
+
+        self.assertRaises(sqlite3.IntegrityError, sqlite.migrate, self.sql, [ (2, orphan) ])
+        self.assertEqual(sqlite.user_version(self.sql), 1)
+        self.assertEqual(sqlite.table_columns(self.sql, 'cable_ports'), ['cpid', 'cid', 'guid', 'guid_int'])
+
+if __name__ == '__main__':
+    unittest.main()